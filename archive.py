@@ -0,0 +1,88 @@
+import asyncio
+import os
+import zipfile
+from io import BytesIO
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+ZIP_COMPRESSLEVEL = int(os.getenv("ZIP_COMPRESSLEVEL", "6"))
+ZIP_CHUNK_SIZE = 256 * 1024
+
+
+class _ChunkSink:
+    """Write-only file object that collects archive bytes until they are taken.
+
+    It has no `tell`/`seek`, so zipfile writes entries with data descriptors
+    and never needs to go back into bytes that were already handed out.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def iter_zip(files: Dict[str, Optional[str]], compresslevel: int = ZIP_COMPRESSLEVEL,
+             chunk_size: int = ZIP_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a deflated zip of `{path: content}` incrementally, never holding more than about one chunk."""
+    sink = _ChunkSink()
+    zipf = zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+    for file_path, content in files.items():
+        # Directory placeholders carry no content
+        if content is None:
+            continue
+
+        data = content.encode('utf-8')
+        with zipf.open(file_path, 'w') as entry:
+            for start in range(0, len(data), chunk_size):
+                entry.write(data[start:start + chunk_size])
+                if len(sink.buffer) >= chunk_size:
+                    yield sink.take()
+        if len(sink.buffer) >= chunk_size:
+            yield sink.take()
+
+    zipf.close()
+    yield sink.take()
+
+
+async def aiter_zip(files: Dict[str, Optional[str]], compresslevel: int = ZIP_COMPRESSLEVEL) -> AsyncIterator[bytes]:
+    # Compression runs on a worker thread so the event loop only moves finished chunks
+    chunks = iter_zip(files, compresslevel)
+    while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+        if chunk:
+            yield chunk
+
+
+class ZipStream:
+    """Zip writer fed one file at a time; every call returns the archive bytes that are ready to send."""
+
+    def __init__(self, compresslevel: int = ZIP_COMPRESSLEVEL):
+        self._sink = _ChunkSink()
+        self._zipf = zipfile.ZipFile(self._sink, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+
+    def add(self, path: str, content: str) -> bytes:
+        with self._zipf.open(path, 'w') as entry:
+            entry.write(content.encode('utf-8'))
+        return self._sink.take()
+
+    def close(self) -> bytes:
+        self._zipf.close()
+        return self._sink.take()
+
+
+def read_zip(archive: bytes) -> Dict[str, str]:
+    with zipfile.ZipFile(BytesIO(archive)) as zipf:
+        return {
+            name: zipf.read(name).decode('utf-8')
+            for name in zipf.namelist()
+            if not name.endswith('/')
+        }
@@ -0,0 +1,192 @@
+"""Offline end-to-end load test: N concurrent upload -> generate -> download flows.
+
+The FastAPI app is served by uvicorn inside this process with a fake LLM
+generator and the local storage backend, so nothing leaves the machine.
+
+    python -m benchmarks.bench_e2e --flows 50 --concurrency 10 --stage-latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4) if values else 0.0
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def monitor_loop_lag(lags: List[float], stop: asyncio.Event, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - started - interval))
+
+
+async def run_flow(client, index: int, args) -> Dict[str, Optional[float]]:
+    from benchmarks.fakes import make_pdf
+
+    label = "shared" if args.same_paper else index
+    pdf = make_pdf([f"Benchmark paper {label} page {page}" for page in range(args.pages)])
+
+    files = {"file": (f"paper_{index}.pdf", pdf, "application/pdf")}
+    params = {"mode": args.mode, "use_cache": str(not args.no_cache).lower()}
+
+    started = time.perf_counter()
+    if args.combined:
+        # One request carries the PDF and streams progress back
+        request = client.stream("POST", "/generate", files=files, data=params)
+    else:
+        response = await client.post("/upload", files=files)
+        response.raise_for_status()
+        request = client.stream("GET", f"/generate/{response.json()['file_id']}", params=params)
+
+    first_event = None
+    project_id = None
+    # The combined request includes the upload, so it is timed from the start of the flow
+    generate_started = started if args.combined else time.perf_counter()
+    async with request as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            if event["status"] in ("uploaded", "heartbeat"):
+                continue
+            if first_event is None:
+                first_event = time.perf_counter() - generate_started
+            if event["status"] == "error":
+                raise RuntimeError(event["message"])
+            if event["status"] == "complete":
+                project_id = event["project_id"]
+                break
+
+    response = await client.get(f"/download/{project_id}")
+    response.raise_for_status()
+
+    return {"latency": time.perf_counter() - started, "first_event": first_event, "archive_bytes": len(response.content)}
+
+
+async def run_benchmark(args) -> Dict:
+    import httpx
+    import uvicorn
+    from benchmarks.fakes import install_fake_generator
+
+    install_fake_generator(args.stage_latency, args.files, args.file_bytes)
+    import server
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    uvicorn_server = uvicorn.Server(uvicorn.Config(server.app, log_level="warning", lifespan="on"))
+    serve_task = asyncio.create_task(uvicorn_server.serve(sockets=[sock]))
+    while not uvicorn_server.started:
+        await asyncio.sleep(0.01)
+
+    lags: List[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(lags, stop))
+    semaphore = asyncio.Semaphore(args.concurrency)
+    results, errors = [], []
+
+    async def limited(client, index):
+        async with semaphore:
+            try:
+                results.append(await run_flow(client, index, args))
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(client, index) for index in range(args.flows)))
+        elapsed = time.perf_counter() - started
+
+    stop.set()
+    await lag_task
+    uvicorn_server.should_exit = True
+    await serve_task
+
+    return {
+        "flows": args.flows,
+        "concurrency": args.concurrency,
+        "mode": args.mode,
+        "combined": args.combined,
+        "completed": len(results),
+        "errors": errors[:10],
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_flows_per_second": round(len(results) / elapsed, 3) if elapsed else 0.0,
+        "latency_seconds": summarize([r["latency"] for r in results]),
+        "time_to_first_event_seconds": summarize([r["first_event"] for r in results if r["first_event"] is not None]),
+        "event_loop_lag_seconds": summarize(lags),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flows", type=int, default=20, help="number of upload/generate/download flows")
+    parser.add_argument("--concurrency", type=int, default=5, help="flows in flight at once")
+    parser.add_argument("--stage-latency", type=float, default=0.05, help="seconds each fake LLM stage takes")
+    parser.add_argument("--files", type=int, default=5, help="files generated per project")
+    parser.add_argument("--file-bytes", type=int, default=2000, help="characters per generated file")
+    parser.add_argument("--pages", type=int, default=4, help="pages per uploaded PDF")
+    parser.add_argument("--mode", default="sequential", help="pipeline mode passed to /generate")
+    parser.add_argument("--same-paper", action="store_true", help="upload the same PDF for every flow")
+    parser.add_argument("--no-cache", action="store_true", help="bypass project and stage caches")
+    parser.add_argument("--combined", action="store_true", help="use POST /generate instead of /upload then GET /generate")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    args = parse_args(argv)
+
+    # Everything the server writes goes to a throwaway directory
+    workdir = tempfile.mkdtemp(prefix="brss_bench_")
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["LOCAL_STORAGE_DIR"] = os.path.join(workdir, "storage")
+    os.environ["JOBS_DB_PATH"] = os.path.join(workdir, "jobs.sqlite3")
+    os.environ["CHECKPOINT_DIR"] = os.path.join(workdir, "checkpoints")
+    os.environ["DOWNLOAD_CACHE_DIR"] = os.path.join(workdir, "downloads")
+    os.environ["PDF_CACHE_DIR"] = os.path.join(workdir, "pdfs")
+    os.environ["WORKSPACE_DIR"] = os.path.join(workdir, "workspaces")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm_cache.sqlite3")
+
+    try:
+        report = asyncio.run(run_benchmark(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
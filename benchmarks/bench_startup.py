@@ -0,0 +1,123 @@
+"""Cold start benchmark: time to import the server, run its startup and answer a first request.
+
+Every sample is a fresh interpreter, as on a newly scheduled container. The
+server runs under uvicorn with the local storage backend and the fake
+generator, and reports which heavy modules were loaded before the first
+request.
+
+    python -m benchmarks.bench_startup --samples 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_e2e import summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies a cold start should not pay for before the first generation
+HEAVY_MODULES = ("brss_paper_to_code.src.main", "openai", "PyPDF2", "supabase", "httpx", "aiohttp")
+
+
+async def measure_child() -> Dict:
+    started = time.perf_counter()
+    import server
+    imported = time.perf_counter()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    import uvicorn
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    uvicorn_server = uvicorn.Server(uvicorn.Config(server.app, log_level="warning", lifespan="on"))
+    serve_task = asyncio.create_task(uvicorn_server.serve(sockets=[sock]))
+    while not uvicorn_server.started:
+        await asyncio.sleep(0.001)
+    ready = time.perf_counter()
+
+    def first_request():
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            return response.status
+
+    status = await asyncio.to_thread(first_request)
+    answered = time.perf_counter()
+
+    uvicorn_server.should_exit = True
+    await serve_task
+    return {
+        "import_seconds": imported - started,
+        "startup_seconds": ready - imported,
+        "first_response_seconds": answered - started,
+        "status": status,
+        "heavy_modules": loaded
+    }
+
+
+def run_sample(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="brss_bench_startup_")
+    env = {
+        **os.environ,
+        "STORAGE_BACKEND": "local",
+        "LOCAL_STORAGE_DIR": os.path.join(workdir, "storage"),
+        "JOBS_DB_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "CHECKPOINT_DIR": os.path.join(workdir, "checkpoints"),
+        "DOWNLOAD_CACHE_DIR": os.path.join(workdir, "downloads"),
+        "PDF_CACHE_DIR": os.path.join(workdir, "pdfs"),
+        "WORKSPACE_DIR": os.path.join(workdir, "workspaces"),
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.sqlite3"),
+        "STARTUP_WARMUP": "true" if args.warmup else "false"
+    }
+    try:
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+            cwd=ROOT, env=env, capture_output=True, text=True, timeout=120
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "child failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5, help="fresh interpreters to start")
+    parser.add_argument("--warmup", action="store_true", help="start with STARTUP_WARMUP enabled")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(asyncio.run(measure_child())))
+        return {}
+
+    samples = [run_sample(args) for _ in range(args.samples)]
+    report = {
+        "samples": len(samples),
+        "warmup": args.warmup,
+        "import_seconds": summarize([s["import_seconds"] for s in samples]),
+        "startup_seconds": summarize([s["startup_seconds"] for s in samples]),
+        "first_response_seconds": summarize([s["first_response_seconds"] for s in samples]),
+        "statuses": sorted({s["status"] for s in samples}),
+        "heavy_modules": sorted({name for s in samples for name in s["heavy_modules"]})
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import sys
+import time
+import types
+from typing import Dict, List
+
+
+def make_pdf(page_texts: List[str]) -> bytes:
+    """Build a minimal PDF with one line of Helvetica text per page."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(body)
+    body += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    body += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    body += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return body
+
+
+class FakeProjectGenerator:
+    """Deterministic stand-in for ProjectGenerator.
+
+    Every LLM stage sleeps for `stage_latency` seconds (per file for
+    `improve_code`, scaled by the number of files it is given) and returns
+    `files` files of about `file_bytes` characters each.
+    """
+
+    stage_latency = 0.05
+    files = 5
+    file_bytes = 2000
+
+    def read_paper(self, pdf_path: str) -> str:
+        with open(pdf_path, 'rb') as f:
+            return f.read().decode('latin-1')
+
+    def generate_plan(self, paper_content: str) -> str:
+        time.sleep(self.stage_latency)
+        return f"plan for {len(paper_content)} characters"
+
+    def implement_code(self, paper_content: str, plan: str) -> Dict[str, str]:
+        time.sleep(self.stage_latency)
+        line = f"# {plan}\n"
+        return {
+            f"src/module_{index}.py": (line * (self.file_bytes // len(line) + 1))[:self.file_bytes]
+            for index in range(self.files)
+        }
+
+    def analyze_code(self, paper_content: str, plan: str, code_blocks: Dict[str, str]) -> str:
+        time.sleep(self.stage_latency)
+        return f"analysis of {len(code_blocks)} files"
+
+    def improve_code(self, code_blocks: Dict[str, str], analysis: str) -> Dict[str, str]:
+        time.sleep(self.stage_latency * len(code_blocks) / max(self.files, 1))
+        return {path: content + f"\n# {analysis}\n" for path, content in code_blocks.items()}
+
+    def cleanup(self):
+        pass
+
+
+def install_fake_generator(stage_latency: float = 0.05, files: int = 5, file_bytes: int = 2000):
+    """Register FakeProjectGenerator as brss_paper_to_code.src.main.ProjectGenerator."""
+    FakeProjectGenerator.stage_latency = stage_latency
+    FakeProjectGenerator.files = files
+    FakeProjectGenerator.file_bytes = file_bytes
+
+    for name in ("brss_paper_to_code", "brss_paper_to_code.src"):
+        sys.modules.setdefault(name, types.ModuleType(name))
+    module = types.ModuleType("brss_paper_to_code.src.main")
+    module.ProjectGenerator = FakeProjectGenerator
+    sys.modules["brss_paper_to_code.src.main"] = module
+    return FakeProjectGenerator
+
+
+class FakeChatCompletions:
+    """Answers every chat completion with an echo of the last message and counts the calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, model: str, messages: List[Dict[str, str]], **params):
+        from openai.types.chat import ChatCompletion
+
+        self.calls += 1
+        content = f"echo: {messages[-1]['content']}"
+        return ChatCompletion.model_validate({
+            "id": f"chatcmpl-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(messages), "completion_tokens": 1, "total_tokens": len(messages) + 1}
+        })
+
+
+class FakeOpenAI:
+    """Offline stand-in for the parts of openai.OpenAI that ProjectGenerator uses."""
+
+    def __init__(self):
+        self.chat = types.SimpleNamespace(completions=FakeChatCompletions())
@@ -0,0 +1,298 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+RUN_IDLE_SECONDS = float(os.getenv("RUN_IDLE_SECONDS", "30"))
+RUN_LOG_PATH = os.getenv("RUN_LOG_PATH", os.getenv("JOBS_DB_PATH", "jobs.sqlite3"))
+RUN_LOG_TTL_SECONDS = float(os.getenv("RUN_LOG_TTL_SECONDS", str(24 * 60 * 60)))
+
+FINAL_STATUSES = ("complete", "error")
+
+# Events that only matter at the moment they are sent are not replayed to late subscribers
+TRANSIENT_STATUSES = ("heartbeat", "queued")
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    key TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    finished INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_events (
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, seq)
+);
+"""
+
+
+def _status(event: str) -> Optional[str]:
+    return json.loads(event[event.index("data: ") + len("data: "):]).get('status')
+
+
+class RunLog:
+    """The numbered events of the latest run per key, kept in SQLite for `ttl` seconds.
+
+    A client that reconnects after its run finished, possibly to a restarted
+    server, gets the rest of that run's events under the same ids. Writes are
+    queued and a single writer task commits whatever has piled up in one
+    transaction on a persistent connection, so runs never wait on the disk.
+    """
+
+    def __init__(self, path: str = RUN_LOG_PATH, ttl: float = RUN_LOG_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._pending: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        # The connection is shared by the writer and readers, one thread at a time
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(SCHEMA)
+                self._conn = conn
+            return fn(self._conn)
+
+    def _enqueue(self, entry: Any):
+        if self._writer is None or self._writer.done():
+            self._pending = asyncio.Queue()
+            self._writer = asyncio.create_task(self._write_loop())
+        self._pending.put_nowait(entry)
+
+    def start(self, key: Hashable, run_id: str):
+        """Make `run_id` the run logged for `key`, dropping the one before it and any that expired."""
+        self._enqueue(("start", json.dumps(key), run_id, time.time()))
+
+    def add(self, run_id: str, seq: int, event: str):
+        self._enqueue(("add", run_id, seq, event))
+
+    async def flush(self):
+        """Wait until everything logged so far is committed."""
+        if self._writer is None or self._writer.done():
+            return
+        written = asyncio.get_running_loop().create_future()
+        self._pending.put_nowait(written)
+        await written
+
+    async def close(self):
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._pending.get()]
+            while not self._pending.empty():
+                batch.append(self._pending.get_nowait())
+            entries = [entry for entry in batch if not isinstance(entry, asyncio.Future)]
+            if entries:
+                try:
+                    await asyncio.to_thread(self._run, lambda conn: self._write(conn, entries))
+                except Exception as e:
+                    print(f"Error logging run events: {e}")
+            for entry in batch:
+                if isinstance(entry, asyncio.Future) and not entry.done():
+                    entry.set_result(None)
+
+    def _write(self, conn: sqlite3.Connection, entries: List[Tuple]):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for entry in entries:
+                if entry[0] == "start":
+                    _, key, run_id, started_at = entry
+                    stale = [row["run_id"] for row in conn.execute(
+                        "SELECT run_id FROM runs WHERE key = ? OR started_at < ?", (key, started_at - self.ttl)
+                    )]
+                    conn.executemany("DELETE FROM run_events WHERE run_id = ?", [(stale_id,) for stale_id in stale])
+                    conn.executemany("DELETE FROM runs WHERE run_id = ?", [(stale_id,) for stale_id in stale])
+                    conn.execute("INSERT INTO runs (key, run_id, started_at) VALUES (?, ?, ?)", (key, run_id, started_at))
+                else:
+                    _, run_id, seq, event = entry
+                    conn.execute("INSERT INTO run_events (run_id, seq, data) VALUES (?, ?, ?)", (run_id, seq, event))
+                    if _status(event) in FINAL_STATUSES:
+                        conn.execute("UPDATE runs SET finished = 1 WHERE run_id = ?", (run_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def finished_events(self, key: Hashable, after: int = 0) -> Optional[List[str]]:
+        """Events after `after` of the finished run logged for `key`, or None when there is none."""
+        def select(conn: sqlite3.Connection):
+            run = conn.execute(
+                "SELECT run_id FROM runs WHERE key = ? AND finished = 1 AND started_at >= ?",
+                (json.dumps(key), time.time() - self.ttl)
+            ).fetchone()
+            if run is None:
+                return None
+            rows = conn.execute(
+                "SELECT seq, data FROM run_events WHERE run_id = ? AND seq > ? ORDER BY seq", (run["run_id"], after)
+            ).fetchall()
+            return [f"id: {row['seq']}\n{row['data']}" for row in rows]
+
+        await self.flush()
+        return await asyncio.to_thread(self._run, select)
+
+
+class Run:
+    """One pipeline run's events, fanned out to every subscriber.
+
+    The run writes to it like a queue. Every event except transient ones is
+    numbered by the run, so its SSE id is the same for every subscriber, and
+    kept so a subscriber that joins late first gets everything sent so far.
+    With a `log`, numbered events are also handed to it as they go out.
+    Once the last subscriber leaves, the run is cancelled unless another one
+    joins within `idle_seconds`.
+    """
+
+    def __init__(self, key: Hashable, idle_seconds: float = RUN_IDLE_SECONDS, log: Optional[RunLog] = None):
+        self.key = key
+        self.idle_seconds = idle_seconds
+        self.log = log
+        self.run_id = str(uuid.uuid4())
+        self.history: List[str] = []
+        self.finished = False
+        self.task: Optional[asyncio.Task] = None
+        self.closing: Optional[asyncio.Future] = None
+        self._seq = 0
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._idle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    async def put(self, event: str):
+        status = _status(event)
+        if status in TRANSIENT_STATUSES:
+            for queue in self._subscribers:
+                queue.put_nowait((status, event))
+            return
+
+        self._seq += 1
+        if self.log:
+            self.log.add(self.run_id, self._seq, event)
+        event = f"id: {self._seq}\n{event}"
+        self.history.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait((status, event))
+        if status in FINAL_STATUSES:
+            self._finish()
+
+    def _finish(self):
+        self.finished = True
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        if self._idle:
+            self._idle.cancel()
+
+    def start(self, run: Awaitable[Any], heartbeat: Optional[Callable[["Run"], Awaitable[None]]] = None):
+        if self.log:
+            self.log.start(self.key, self.run_id)
+        self.task = asyncio.ensure_future(run)
+        if heartbeat:
+            self._heartbeat = asyncio.create_task(heartbeat(self))
+        self.task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error in generation run: {task.exception()}")
+        if not self.finished:
+            # A run that ends without a final event (cancelled or crashed early) still ends its streams
+            self.closing = asyncio.ensure_future(self.put(f"data: {json.dumps({'status': 'error', 'message': 'Generation run stopped'})}\n\n"))
+
+    def cancel(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    async def subscribe(self, after: int = 0) -> AsyncIterator[str]:
+        """Every event of the run after id `after`, starting with the ones already sent, until it finishes."""
+        queue: asyncio.Queue = asyncio.Queue()
+        # Events after this snapshot arrive through the queue
+        history, finished = self.history[after:], self.finished
+        self._subscribers.add(queue)
+        if self._idle:
+            self._idle.cancel()
+            self._idle = None
+        try:
+            for event in history:
+                yield event
+            if finished:
+                return
+            while True:
+                status, event = await queue.get()
+                yield event
+                if status in FINAL_STATUSES:
+                    return
+        finally:
+            self._subscribers.discard(queue)
+            if not self._subscribers and not self.finished:
+                self._idle = asyncio.get_running_loop().call_later(self.idle_seconds, self.cancel)
+
+
+class BroadcastHub:
+    """Runs in progress by key, so requests for the same work share one run.
+
+    Keys must be JSON-serializable when the hub has a `log`.
+    """
+
+    def __init__(self, idle_seconds: float = RUN_IDLE_SECONDS, log: Optional[RunLog] = None):
+        self.idle_seconds = idle_seconds
+        self.log = log
+        self.runs: Dict[Hashable, Run] = {}
+
+    def attach(self, key: Hashable, start: Callable[[Run], Awaitable[Any]],
+               heartbeat: Optional[Callable[[Run], Awaitable[None]]] = None) -> Tuple[Run, bool]:
+        """The run in progress for `key`, or a new one started with `start(run)`; also says whether it is new."""
+        run = self.runs.get(key)
+        if run is not None and not run.finished:
+            return run, False
+
+        run = Run(key, self.idle_seconds, self.log)
+        self.runs[key] = run
+        run.start(start(run), heartbeat)
+        run.task.add_done_callback(lambda _: self._forget(run))
+        return run, True
+
+    def _forget(self, run: Run):
+        if self.runs.get(run.key) is run:
+            del self.runs[run.key]
+
+    async def finished_events(self, key: Hashable, after: int = 0) -> Optional[List[str]]:
+        """Events after `after` of the last finished run for `key`, or None when it has none or one is in progress."""
+        run = self.runs.get(key)
+        if run is not None:
+            # A run that has sent its final event stays here until its task is done
+            return run.history[after:] if run.finished else None
+        if self.log is None:
+            return None
+        return await self.log.finished_events(key, after)
+
+    async def close(self):
+        runs = list(self.runs.values())
+        for run in runs:
+            run.cancel()
+        await asyncio.gather(*(run.task for run in runs if run.task), return_exceptions=True)
+        await asyncio.gather(*(run.closing for run in runs if run.closing), return_exceptions=True)
+        if self.log:
+            await self.log.close()
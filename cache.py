@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+MISSING = object()
+
+
+def cache_key(*parts: Any) -> str:
+    """SHA-256 of the JSON encoding of `parts`, used to key values by their inputs."""
+    encoded = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class LRUDirectory:
+    """One file per key under `directory`, evicted least-recently-used once `max_bytes` is exceeded."""
+
+    suffix = ""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}{self.suffix}")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _ensure_total(self):
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _touch(self, path: str):
+        # Reads refresh the entry's position in the LRU order
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _temp_path(self, key: str) -> str:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{threading.get_ident()}.{time.monotonic_ns()}.tmp"
+
+    def _commit(self, key: str, temp_path: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            self._ensure_total()
+            try:
+                previous = os.path.getsize(path)
+            except FileNotFoundError:
+                previous = 0
+
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+
+            self._total_bytes += size - previous
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._ensure_total()
+            path = self._path(key)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._total_bytes = total
+
+
+class DiskCache(LRUDirectory):
+    """JSON values stored one file per key."""
+
+    suffix = ".json"
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False, MISSING
+
+        self._touch(path)
+        return True, value
+
+    def set(self, key: str, value: Any):
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        temp_path = self._temp_path(key)
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        self._commit(key, temp_path)
+
+
+class BlobCache(LRUDirectory):
+    """Opaque files, written through a temp file and served straight from disk."""
+
+    def lookup(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        self._touch(path)
+        return path
+
+    def open_temp(self, key: str) -> Tuple[str, Any]:
+        temp_path = self._temp_path(key)
+        return temp_path, open(temp_path, 'wb')
+
+    def commit(self, key: str, temp_path: str):
+        self._commit(key, temp_path)
+
+    def add_file(self, key: str, source: str):
+        """Store a copy of `source`, hard-linking it when both live on the same filesystem."""
+        temp_path = self._temp_path(key)
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copyfile(source, temp_path)
+        self._commit(key, temp_path)
+
+    def discard(self, temp_path: str):
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+
+class TTLCache:
+    """Small in-memory map whose entries expire after `ttl` seconds, dropping the oldest past `max_entries`."""
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
@@ -0,0 +1,189 @@
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from extraction import estimate_tokens, CHARS_PER_TOKEN
+
+PAPER_COMPACTION = os.getenv("PAPER_COMPACTION", "true").lower() == "true"
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "12000"))
+COMPACTION_KEEP_APPENDIX = os.getenv("COMPACTION_KEEP_APPENDIX", "false").lower() == "true"
+
+# Section kinds recognised from heading text, checked in order
+SECTION_KINDS = (
+    ("abstract", r"abstract"),
+    ("references", r"references|bibliography|works cited"),
+    ("acknowledgments", r"acknowledge?ments?"),
+    ("appendix", r"appendi(x|ces)|supplementary"),
+    ("related", r"related work|background|prior work|preliminaries"),
+    ("intro", r"introduction|overview|motivation"),
+    ("method", r"method|approach|model|architecture|algorithm|framework|implementation|proposed|formulation"),
+    ("experiments", r"experiment|setup|training|dataset|evaluation|benchmark|hyperparameter"),
+    ("results", r"result|analysis|ablation|discussion|findings"),
+    ("conclusion", r"conclusion|future work|limitations|summary"),
+)
+DROPPED_KINDS = ("references", "acknowledgments", "dropped")
+# Kinds that remove text from the prompts; only a heading that is exactly their name starts them
+OMITTED_KINDS = ("references", "acknowledgments", "appendix")
+
+# Kinds each stage reads, most important first; the budget is filled in this order
+STAGE_SECTIONS = {
+    "generate_plan": ("abstract", "method", "other", "experiments", "intro", "results", "conclusion"),
+    "implement_code": ("method", "other", "experiments", "abstract"),
+    "analyze_code": ("method", "other", "abstract", "experiments"),
+}
+
+HEADING = re.compile(
+    r"^(?:(?P<number>(?:\d+(?:\.\d+)*|[IVX]+|[A-H](?:\.\d+)*)\.?)\s+)?(?P<title>[A-Z][\w\-,:&/' ]{1,80})$"
+)
+BOILERPLATE = re.compile(r"^(?:\d{1,4}|page \d+( of \d+)?|arxiv:\S+.*|preprint\b.*|under review\b.*)$", re.IGNORECASE)
+
+
+def _section_kind(title: str) -> Optional[str]:
+    lowered = title.lower()
+    for kind, pattern in SECTION_KINDS:
+        if re.search(rf"\b(?:{pattern})", lowered):
+            return kind
+    return None
+
+
+def _named_kind(title: str) -> Optional[str]:
+    """The kind of a title that is nothing but a section name, such as "Related Work" or "Results and Discussion"."""
+    names = "|".join(pattern for _, pattern in SECTION_KINDS)
+    name = re.sub(r"^(?:experimental|our|the|proposed)\s+", "", title.lower().rstrip(":").strip())
+    if not re.fullmatch(rf"(?:{names})s?(?:\s+(?:and|&)\s+(?:{names})s?)?", name):
+        return None
+    return _section_kind(name)
+
+
+def _is_heading(line: str) -> Optional[re.Match]:
+    if len(line) > 90 or line.endswith(('.', ',', ';')) or len(line.split()) > 10:
+        return None
+    match = HEADING.match(line)
+    if not match:
+        return None
+    # PDF text has one line per visual line, so wrapped sentences look like short
+    # capitalised lines; without a number only a bare section name counts
+    if not match.group("number") and _named_kind(match.group("title")) is None:
+        return None
+    return match
+
+
+def _follows(number: str, section: int) -> bool:
+    """Whether an arabic heading number can come after top-level section `section`.
+
+    Papers number sections in order, so a line starting with some other count
+    ("8 GPUs were used") is body text. One skipped number is allowed for a
+    heading lost in extraction.
+    """
+    first = number.rstrip(".").split(".")[0]
+    if not first.isdigit():
+        return True
+    if "." in number.rstrip("."):
+        return section <= int(first) <= section + 2
+    return section < int(first) <= section + 2
+
+
+def _heading_kind(title: str, numbered: bool) -> Optional[str]:
+    if not numbered:
+        return _named_kind(title)
+    kind = _section_kind(title)
+    # "7 References" starts the bibliography, "7 References to Prior Designs" does not
+    if kind in OMITTED_KINDS and _named_kind(title) != kind:
+        return None
+    return kind
+
+
+def clean_lines(text: str) -> List[str]:
+    """Paper lines without page numbers, running headers and line-break hyphenation."""
+    text = re.sub(r"(\w)-\n(\w)", r"\1\2", text)
+    lines = [re.sub(r"\s+", " ", line).strip() for line in text.splitlines()]
+
+    # Short lines repeated on many pages are running headers and footers
+    repeated = {line for line, count in Counter(line for line in lines if 0 < len(line) <= 80).items() if count >= 3}
+    return [line for line in lines if line and line not in repeated and not BOILERPLATE.match(line)]
+
+
+def compact_paper(text: str, keep_appendix: Optional[bool] = None) -> Dict[str, Any]:
+    """Split a paper into typed sections, dropping references, acknowledgments and (by default) appendices."""
+    keep_appendix = COMPACTION_KEEP_APPENDIX if keep_appendix is None else keep_appendix
+    # The title is taken before cleaning, which would drop it when it is also the running header
+    title = next((re.sub(r"\s+", " ", line).strip() for line in text.splitlines() if line.strip()), "")
+    lines = clean_lines(text)
+    if lines and lines[0] == title:
+        lines = lines[1:]
+
+    sections: List[Dict[str, Any]] = []
+    current = {"title": "", "kind": "front", "lines": []}
+    parent_kind = "other"
+    after_references = False
+    section_number = 0
+
+    for line in lines:
+        match = _is_heading(line)
+        number = (match.group("number") or "") if match else ""
+        if match and not _follows(number, section_number):
+            match = None
+        if match:
+            sections.append(current)
+            if number.split(".")[0].isdigit():
+                section_number = int(number.split(".")[0])
+            kind = _heading_kind(match.group("title"), bool(number))
+            if kind is None:
+                # Subsections take the kind of the section they belong to
+                kind = parent_kind if "." in number.rstrip(".") else "other"
+            if "." not in number.rstrip("."):
+                parent_kind = kind
+            if kind == "references":
+                after_references = True
+            elif after_references and kind not in DROPPED_KINDS:
+                # Whatever follows the bibliography is supplementary material
+                kind = "appendix"
+            current = {"title": line, "kind": kind, "lines": []}
+        else:
+            current["lines"].append(line)
+    sections.append(current)
+
+    # Text before the first heading is author boilerplate when the paper has an
+    # Abstract heading, and is the abstract itself when it does not
+    has_abstract = any(section["kind"] == "abstract" for section in sections)
+    for section in sections:
+        if section["kind"] == "front":
+            section["kind"] = "dropped" if has_abstract else "abstract"
+
+    kept = []
+    for section in sections:
+        body = " ".join(section["lines"]).strip()
+        if not body or section["kind"] in DROPPED_KINDS or (section["kind"] == "appendix" and not keep_appendix):
+            continue
+        kept.append({"title": section["title"], "kind": section["kind"], "text": body, "tokens": estimate_tokens(body)})
+
+    return {"title": title, "sections": kept, "tokens": sum(section["tokens"] for section in kept)}
+
+
+def stage_context(compact: Dict[str, Any], stage: str, max_tokens: Optional[int] = None) -> str:
+    """The sections `stage` needs, in document order, cut to about `max_tokens` tokens."""
+    max_tokens = max_tokens or CONTEXT_MAX_TOKENS
+    kinds = STAGE_SECTIONS.get(stage)
+    sections = compact["sections"]
+    if kinds is None:
+        kinds = tuple(dict.fromkeys(section["kind"] for section in sections))
+
+    # Fill the budget by importance, then restore the paper's own order
+    chosen: Dict[int, str] = {}
+    remaining = max_tokens - estimate_tokens(compact["title"])
+    for kind in kinds:
+        for index, section in enumerate(sections):
+            if section["kind"] != kind or remaining <= 0:
+                continue
+            text = section["text"]
+            if section["tokens"] > remaining:
+                text = text[:remaining * CHARS_PER_TOKEN].rsplit(" ", 1)[0] + " ..."
+            chosen[index] = text
+            remaining -= estimate_tokens(text) + estimate_tokens(section["title"])
+
+    parts = [compact["title"]]
+    for index in sorted(chosen):
+        title = sections[index]["title"]
+        parts.append(f"## {title}\n{chosen[index]}" if title else chosen[index])
+    return "\n\n".join(parts)
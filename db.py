@@ -1,87 +1,767 @@
+from abc import ABC, abstractmethod
 from datetime import datetime, timedelta, timezone
+import asyncio
 import os
-import shutil
-import zipfile
-from supabase import create_client, Client
+import sqlite3
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterable, AsyncIterator, Collection, Dict, List, Optional, Union
 from dotenv import load_dotenv
+from archive import aiter_zip, ZIP_COMPRESSLEVEL
+from metrics import storage_seconds, storage_reclaimed_bytes, expired_projects_swept, expired_pdfs_swept
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
 
 load_dotenv()
 
 url = os.getenv("SUPABASE_URL")
 key = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
 
-async def store_project_info(project_id: str, download_url: str):
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+STORAGE_CONCURRENCY = int(os.getenv("STORAGE_CONCURRENCY", "16"))
+# Uploads hold their slot while the body streams in, so they have their own limit
+STORAGE_UPLOAD_CONCURRENCY = int(os.getenv("STORAGE_UPLOAD_CONCURRENCY", str(STORAGE_CONCURRENCY)))
+STORAGE_MAX_CONNECTIONS = int(os.getenv("STORAGE_MAX_CONNECTIONS", "32"))
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "local_storage")
+SIGNED_URL_SECONDS = 60 * 60 * 24  # valid for 24 hours
+SIGNED_URL_REFRESH_SECONDS = int(os.getenv("SIGNED_URL_REFRESH_SECONDS", str(60 * 60)))
+PROJECT_TTL_SECONDS = int(os.getenv("PROJECT_TTL_SECONDS", str(SIGNED_URL_SECONDS)))
+# PDFs are deduplicated across uploads, so each is kept this long after it was last uploaded or used
+PDF_TTL_SECONDS = int(os.getenv("PDF_TTL_SECONDS", str(PROJECT_TTL_SECONDS)))
+# Staged uploads, written by earlier versions of /upload, are abandoned once older than this
+STAGING_MAX_AGE_SECONDS = int(os.getenv("STAGING_MAX_AGE_SECONDS", str(60 * 60)))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "100"))
+SWEEP_CONCURRENCY = int(os.getenv("SWEEP_CONCURRENCY", "4"))
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+ObjectData = Union[bytes, AsyncIterable[bytes]]
+
+# Schema for project reuse and the expiry sweeper. LocalBackend applies it
+# itself; a Supabase database needs MIGRATION_FILE applied once, and the server
+# checks these columns at startup rather than failing its first generation
+MIGRATION_FILE = "migrations/001_project_and_pdf_expiry.sql"
+SCHEMA_COLUMNS = {
+    "projects": ("id", "download_url", "expires_at", "file_id", "url_expires_at"),
+    "pdfs": ("file_id", "expires_at")
+}
+
+
+class SchemaError(Exception):
+    pass
+
+
+class StorageBackend(ABC):
+    """Async object storage and the `projects` and `pdfs` tables used by the server.
+
+    Short calls wait on a shared semaphore, so at most `concurrency` storage
+    round trips are in flight at once. Uploads stream from clients and URLs
+    that may be slow, so they wait on a separate one of `upload_concurrency`
+    and cannot hold up the short calls. Downloads stream without either.
+    """
+
+    def __init__(self, concurrency: int = STORAGE_CONCURRENCY, upload_concurrency: int = STORAGE_UPLOAD_CONCURRENCY):
+        self.limit = asyncio.Semaphore(concurrency)
+        self.upload_limit = asyncio.Semaphore(upload_concurrency)
+
+    @abstractmethod
+    async def put_object(self, bucket: str, path: str, data: ObjectData, content_type: str):
+        ...
+
+    @abstractmethod
+    async def object_exists(self, bucket: str, path: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def object_size(self, bucket: str, path: str) -> Optional[int]:
+        """Size in bytes, or None when the object does not exist."""
+
+    @abstractmethod
+    async def move_object(self, bucket: str, from_path: str, to_path: str):
+        ...
+
+    @abstractmethod
+    async def remove_objects(self, bucket: str, paths: List[str]):
+        ...
+
+    @abstractmethod
+    async def signed_url(self, bucket: str, path: str, expires_in: int) -> str:
+        ...
+
+    @abstractmethod
+    def iter_object(self, bucket: str, path: str) -> AsyncIterator[bytes]:
+        ...
+
+    @abstractmethod
+    async def list_objects(self, bucket: str, folder: str, created_before: str, limit: int) -> List[Dict[str, Any]]:
+        """Up to `limit` objects directly in `folder` created before `created_before`, oldest first, with `path` and `size`."""
+
+    @abstractmethod
+    async def insert_project(self, data: Dict[str, str]) -> List[Dict[str, str]]:
+        ...
+
+    @abstractmethod
+    async def get_project(self, project_id: str) -> Optional[Dict[str, str]]:
+        ...
+
+    @abstractmethod
+    async def find_project_by_file(self, file_id: str, expires_after: str) -> Optional[Dict[str, str]]:
+        ...
+
+    @abstractmethod
+    async def update_project(self, project_id: str, data: Dict[str, str]):
+        ...
+
+    @abstractmethod
+    async def find_expired_projects(self, expired_before: str, limit: int) -> List[Dict[str, str]]:
+        """Up to `limit` projects that expired before `expired_before`, oldest first."""
+
+    @abstractmethod
+    async def delete_projects(self, project_ids: List[str]):
+        ...
+
+    @abstractmethod
+    async def touch_pdf(self, file_id: str, expires_at: str):
+        """Keep the PDF until `expires_at`, adding its row if it has none."""
+
+    @abstractmethod
+    async def find_expired_pdfs(self, expired_before: str, limit: int) -> List[str]:
+        """File ids of up to `limit` PDFs that expired before `expired_before`, oldest first."""
+
+    @abstractmethod
+    async def delete_expired_pdfs(self, file_ids: List[str], expired_before: str) -> List[str]:
+        """Delete the rows of `file_ids` that still expired before `expired_before`, returning the ids deleted."""
+
+    async def warm_up(self):
+        """Open connections ahead of the first call; backends without any have nothing to do."""
+        pass
+
+    async def check_schema(self):
+        """Raise SchemaError when a table lacks SCHEMA_COLUMNS; backends that migrate themselves have nothing to check."""
+        pass
+
+    async def close(self):
+        pass
+
+
+class SupabaseBackend(StorageBackend):
+    """Supabase storage and Postgres through the async SDK.
+
+    Object bodies go through a pooled httpx client against the storage REST
+    API so they can be streamed instead of read into memory.
+    """
+
+    def __init__(self, supabase_url: str, supabase_key: str, concurrency: int = STORAGE_CONCURRENCY,
+                 max_connections: int = STORAGE_MAX_CONNECTIONS, upload_concurrency: int = STORAGE_UPLOAD_CONCURRENCY):
+        super().__init__(concurrency, upload_concurrency)
+        # The SDKs are imported with the backend rather than the module, so
+        # starting the server does not pay for them before storage is used
+        import httpx
+
+        self.supabase_url = supabase_url
+        self.supabase_key = supabase_key
+        self.http = httpx.AsyncClient(
+            base_url=f"{supabase_url}/storage/v1",
+            headers={"Authorization": f"Bearer {supabase_key}", "apikey": supabase_key},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(30.0, write=None)
+        )
+        self._client: Optional["AsyncClient"] = None
+        self._client_lock = asyncio.Lock()
+
+    async def client(self) -> "AsyncClient":
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    from supabase import acreate_client
+                    self._client = await acreate_client(self.supabase_url, self.supabase_key)
+        return self._client
+
+    async def warm_up(self):
+        await self.client()
+
+    async def check_schema(self):
+        # Asked of the REST API directly, so startup does not wait for the SDK import
+        for table, columns in SCHEMA_COLUMNS.items():
+            async with self.limit:
+                response = await self.http.get(
+                    f"{self.supabase_url}/rest/v1/{table}", params={"select": ",".join(columns), "limit": "0"}
+                )
+            # PostgREST answers 400 for an unknown column and 404 for an unknown table
+            if response.status_code in (400, 404):
+                raise SchemaError(f"Table {table} needs columns {', '.join(columns)}; apply {MIGRATION_FILE}")
+            response.raise_for_status()
+
+    async def put_object(self, bucket: str, path: str, data: ObjectData, content_type: str):
+        async with self.upload_limit:
+            response = await self.http.post(
+                f"/object/{bucket}/{path}",
+                content=data,
+                headers={"Content-Type": content_type}
+            )
+            response.raise_for_status()
+
+    async def object_exists(self, bucket: str, path: str) -> bool:
+        client = await self.client()
+        async with self.limit:
+            return await client.storage.from_(bucket).exists(path)
+
+    async def object_size(self, bucket: str, path: str) -> Optional[int]:
+        async with self.limit:
+            response = await self.http.head(f"/object/authenticated/{bucket}/{path}")
+        if response.status_code in (400, 404):
+            return None
+        response.raise_for_status()
+        length = response.headers.get("content-length")
+        return int(length) if length and length.isdigit() else 0
+
+    async def move_object(self, bucket: str, from_path: str, to_path: str):
+        client = await self.client()
+        async with self.limit:
+            await client.storage.from_(bucket).move(from_path, to_path)
+
+    async def remove_objects(self, bucket: str, paths: List[str]):
+        client = await self.client()
+        async with self.limit:
+            await client.storage.from_(bucket).remove(paths)
+
+    async def signed_url(self, bucket: str, path: str, expires_in: int) -> str:
+        client = await self.client()
+        async with self.limit:
+            signed_url_data = await client.storage.from_(bucket).create_signed_url(path, expires_in)
+        return signed_url_data.get("signedURL")
+
+    async def iter_object(self, bucket: str, path: str) -> AsyncIterator[bytes]:
+        async with self.http.stream("GET", f"/object/authenticated/{bucket}/{path}") as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                yield chunk
+
+    async def list_objects(self, bucket: str, folder: str, created_before: str, limit: int) -> List[Dict[str, Any]]:
+        client = await self.client()
+        async with self.limit:
+            items = await client.storage.from_(bucket).list(
+                folder, {"limit": limit, "sortBy": {"column": "created_at", "order": "asc"}}
+            )
+        cutoff = datetime.fromisoformat(created_before)
+        return [
+            {"path": f"{folder}/{item['name']}", "size": (item.get("metadata") or {}).get("size", 0)}
+            for item in items
+            # Subfolders are listed too, without an id
+            if item.get("id") and datetime.fromisoformat(item["created_at"].replace("Z", "+00:00")) < cutoff
+        ]
+
+    async def insert_project(self, data: Dict[str, str]) -> List[Dict[str, str]]:
+        client = await self.client()
+        async with self.limit:
+            result = await client.table("projects").insert(data).execute()
+        return result.data
+
+    async def get_project(self, project_id: str) -> Optional[Dict[str, str]]:
+        client = await self.client()
+        async with self.limit:
+            result = await client.table("projects").select("*").eq("id", project_id).execute()
+        return result.data[0] if result.data else None
+
+    async def find_project_by_file(self, file_id: str, expires_after: str) -> Optional[Dict[str, str]]:
+        client = await self.client()
+        async with self.limit:
+            result = await (
+                client.table("projects")
+                .select("id, download_url")
+                .eq("file_id", file_id)
+                .gt("expires_at", expires_after)
+                .order("expires_at", desc=True)
+                .limit(1)
+                .execute()
+            )
+        return result.data[0] if result.data else None
+
+    async def update_project(self, project_id: str, data: Dict[str, str]):
+        client = await self.client()
+        async with self.limit:
+            await client.table("projects").update(data).eq("id", project_id).execute()
+
+    async def find_expired_projects(self, expired_before: str, limit: int) -> List[Dict[str, str]]:
+        client = await self.client()
+        async with self.limit:
+            result = await (
+                client.table("projects")
+                .select("id, file_id")
+                .lt("expires_at", expired_before)
+                .order("expires_at")
+                .limit(limit)
+                .execute()
+            )
+        return result.data
+
+    async def delete_projects(self, project_ids: List[str]):
+        client = await self.client()
+        async with self.limit:
+            await client.table("projects").delete().in_("id", project_ids).execute()
+
+    async def touch_pdf(self, file_id: str, expires_at: str):
+        client = await self.client()
+        async with self.limit:
+            await client.table("pdfs").upsert({"file_id": file_id, "expires_at": expires_at}).execute()
+
+    async def find_expired_pdfs(self, expired_before: str, limit: int) -> List[str]:
+        client = await self.client()
+        async with self.limit:
+            result = await (
+                client.table("pdfs")
+                .select("file_id")
+                .lt("expires_at", expired_before)
+                .order("expires_at")
+                .limit(limit)
+                .execute()
+            )
+        return [row["file_id"] for row in result.data]
+
+    async def delete_expired_pdfs(self, file_ids: List[str], expired_before: str) -> List[str]:
+        client = await self.client()
+        async with self.limit:
+            result = await client.table("pdfs").delete().in_("file_id", file_ids).lt("expires_at", expired_before).execute()
+        return [row["file_id"] for row in result.data]
+
+    async def close(self):
+        await self.http.aclose()
+
+
+class LocalBackend(StorageBackend):
+    """Filesystem buckets and SQLite `projects` and `pdfs` tables for tests and offline runs."""
+
+    def __init__(self, root: str = LOCAL_STORAGE_DIR, concurrency: int = STORAGE_CONCURRENCY,
+                 upload_concurrency: int = STORAGE_UPLOAD_CONCURRENCY):
+        super().__init__(concurrency, upload_concurrency)
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db_path = str(self.root / "projects.sqlite3")
+        self._run_db(self._migrate)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS projects (id TEXT PRIMARY KEY, download_url TEXT, expires_at TEXT, file_id TEXT)"
+        )
+        columns = [row["name"] for row in conn.execute("PRAGMA table_info(projects)")]
+        if "url_expires_at" not in columns:
+            conn.execute("ALTER TABLE projects ADD COLUMN url_expires_at TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS projects_expires_at ON projects (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS projects_file_id ON projects (file_id, expires_at)")
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pdfs'").fetchone():
+            conn.execute("CREATE TABLE pdfs (file_id TEXT PRIMARY KEY, expires_at TEXT NOT NULL)")
+            conn.execute("CREATE INDEX pdfs_expires_at ON pdfs (expires_at)")
+            conn.execute(
+                "INSERT INTO pdfs (file_id, expires_at) SELECT file_id, max(expires_at) FROM projects "
+                "WHERE file_id IS NOT NULL GROUP BY file_id"
+            )
+
+    def _object_path(self, bucket: str, path: str) -> Path:
+        return self.root / bucket / path
+
+    def _run_db(self, fn):
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            return fn(conn)
+        finally:
+            conn.close()
+
+    async def put_object(self, bucket: str, path: str, data: ObjectData, content_type: str):
+        target = self._object_path(bucket, path)
+        if await asyncio.to_thread(target.exists):
+            raise FileExistsError(f"{bucket}/{path} already exists")
+
+        async with self.upload_limit:
+            await asyncio.to_thread(target.parent.mkdir, parents=True, exist_ok=True)
+            partial = target.with_name(f"{target.name}.partial")
+            f = await asyncio.to_thread(open, partial, 'wb')
+            try:
+                if isinstance(data, (bytes, bytearray)):
+                    await asyncio.to_thread(f.write, data)
+                else:
+                    async for chunk in data:
+                        await asyncio.to_thread(f.write, chunk)
+            except BaseException:
+                await asyncio.to_thread(f.close)
+                await asyncio.to_thread(partial.unlink, missing_ok=True)
+                raise
+            await asyncio.to_thread(f.close)
+            await asyncio.to_thread(os.replace, partial, target)
+
+    async def object_exists(self, bucket: str, path: str) -> bool:
+        return await asyncio.to_thread(self._object_path(bucket, path).exists)
+
+    async def object_size(self, bucket: str, path: str) -> Optional[int]:
+        try:
+            return (await asyncio.to_thread(self._object_path(bucket, path).stat)).st_size
+        except FileNotFoundError:
+            return None
+
+    async def move_object(self, bucket: str, from_path: str, to_path: str):
+        target = self._object_path(bucket, to_path)
+        async with self.limit:
+            await asyncio.to_thread(target.parent.mkdir, parents=True, exist_ok=True)
+            await asyncio.to_thread(os.replace, self._object_path(bucket, from_path), target)
+
+    async def remove_objects(self, bucket: str, paths: List[str]):
+        async with self.limit:
+            for path in paths:
+                await asyncio.to_thread(self._object_path(bucket, path).unlink, missing_ok=True)
+
+    async def signed_url(self, bucket: str, path: str, expires_in: int) -> str:
+        return self._object_path(bucket, path).resolve().as_uri()
+
+    async def iter_object(self, bucket: str, path: str) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self._object_path(bucket, path), 'rb')
+        try:
+            while chunk := await asyncio.to_thread(f.read, STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+    async def list_objects(self, bucket: str, folder: str, created_before: str, limit: int) -> List[Dict[str, Any]]:
+        cutoff = datetime.fromisoformat(created_before).timestamp()
+
+        def scan() -> List[Dict[str, Any]]:
+            found = []
+            try:
+                entries = list(os.scandir(self._object_path(bucket, folder)))
+            except FileNotFoundError:
+                return []
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Moved to its content address while the folder was read
+                    continue
+                if entry.is_file() and stat.st_mtime < cutoff:
+                    found.append((stat.st_mtime, entry.name, stat.st_size))
+            return [{"path": f"{folder}/{name}", "size": size} for _, name, size in sorted(found)[:limit]]
+
+        async with self.limit:
+            return await asyncio.to_thread(scan)
+
+    async def insert_project(self, data: Dict[str, str]) -> List[Dict[str, str]]:
+        columns = ", ".join(data)
+        placeholders = ", ".join("?" for _ in data)
+        async with self.limit:
+            await asyncio.to_thread(self._run_db, lambda conn: conn.execute(
+                f"INSERT INTO projects ({columns}) VALUES ({placeholders})", tuple(data.values())
+            ))
+        return [data]
+
+    async def get_project(self, project_id: str) -> Optional[Dict[str, str]]:
+        async with self.limit:
+            row = await asyncio.to_thread(self._run_db, lambda conn: conn.execute(
+                "SELECT * FROM projects WHERE id = ?", (project_id,)
+            ).fetchone())
+        return dict(row) if row else None
+
+    async def find_project_by_file(self, file_id: str, expires_after: str) -> Optional[Dict[str, str]]:
+        async with self.limit:
+            row = await asyncio.to_thread(self._run_db, lambda conn: conn.execute(
+                "SELECT id, download_url FROM projects WHERE file_id = ? AND expires_at > ? "
+                "ORDER BY expires_at DESC LIMIT 1",
+                (file_id, expires_after)
+            ).fetchone())
+        return dict(row) if row else None
+
+    async def update_project(self, project_id: str, data: Dict[str, str]):
+        assignments = ", ".join(f"{column} = ?" for column in data)
+        async with self.limit:
+            await asyncio.to_thread(self._run_db, lambda conn: conn.execute(
+                f"UPDATE projects SET {assignments} WHERE id = ?", (*data.values(), project_id)
+            ))
+
+    async def find_expired_projects(self, expired_before: str, limit: int) -> List[Dict[str, str]]:
+        async with self.limit:
+            rows = await asyncio.to_thread(self._run_db, lambda conn: conn.execute(
+                "SELECT id, file_id FROM projects WHERE expires_at < ? ORDER BY expires_at LIMIT ?",
+                (expired_before, limit)
+            ).fetchall())
+        return [dict(row) for row in rows]
+
+    async def delete_projects(self, project_ids: List[str]):
+        placeholders = ", ".join("?" for _ in project_ids)
+        async with self.limit:
+            await asyncio.to_thread(self._run_db, lambda conn: conn.execute(
+                f"DELETE FROM projects WHERE id IN ({placeholders})", tuple(project_ids)
+            ))
+
+    async def touch_pdf(self, file_id: str, expires_at: str):
+        async with self.limit:
+            await asyncio.to_thread(self._run_db, lambda conn: conn.execute(
+                "INSERT INTO pdfs (file_id, expires_at) VALUES (?, ?) "
+                "ON CONFLICT (file_id) DO UPDATE SET expires_at = excluded.expires_at",
+                (file_id, expires_at)
+            ))
+
+    async def find_expired_pdfs(self, expired_before: str, limit: int) -> List[str]:
+        async with self.limit:
+            rows = await asyncio.to_thread(self._run_db, lambda conn: conn.execute(
+                "SELECT file_id FROM pdfs WHERE expires_at < ? ORDER BY expires_at LIMIT ?",
+                (expired_before, limit)
+            ).fetchall())
+        return [row["file_id"] for row in rows]
+
+    async def delete_expired_pdfs(self, file_ids: List[str], expired_before: str) -> List[str]:
+        placeholders = ", ".join("?" for _ in file_ids)
+        async with self.limit:
+            rows = await asyncio.to_thread(self._run_db, lambda conn: conn.execute(
+                f"DELETE FROM pdfs WHERE file_id IN ({placeholders}) AND expires_at < ? RETURNING file_id",
+                (*file_ids, expired_before)
+            ).fetchall())
+        return [row["file_id"] for row in rows]
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            _storage = LocalBackend()
+        else:
+            _storage = SupabaseBackend(url, key)
+    return _storage
+
+
+def set_storage(backend: Optional[StorageBackend]):
+    global _storage
+    _storage = backend
+
+
+async def close_storage():
+    global _storage
+    if _storage is not None:
+        await _storage.close()
+        _storage = None
+
+
+async def store_project_info(project_id: str, download_url: str, file_id: Optional[str] = None):
     try:
+        now = datetime.now(timezone.utc)
         data = {
             "id": project_id,
             "download_url": download_url,
-            "expires_at": (datetime.now(timezone.utc) + timedelta(hours=24)).isoformat()
+            "expires_at": (now + timedelta(seconds=PROJECT_TTL_SECONDS)).isoformat(),
+            "url_expires_at": (now + timedelta(seconds=SIGNED_URL_SECONDS)).isoformat()
         }
-        
-        result = supabase.table("projects").insert(data).execute()
-        return result.data
+        if file_id:
+            data["file_id"] = file_id
+            await touch_pdf(file_id, now)
+
+        with storage_seconds.time(operation="store_project_info"):
+            return await get_storage().insert_project(data)
     except Exception as e:
         print(f"Error storing project info: {e}")
         raise
 
-async def upload_pdf(file_id: str, pdf_path: str):
+async def upload_pdf_stream(object_key: str, chunks: AsyncIterator[bytes]):
     try:
-        with open(pdf_path, 'rb') as f:
-            supabase.storage.from_('pdf').upload(
-                f"{file_id}.pdf",
-                f.read(),
-                {"content-type": "application/pdf"}
-            )
+        with storage_seconds.time(operation="upload_pdf"):
+            await get_storage().put_object('pdf', f"{object_key}.pdf", chunks, "application/pdf")
         return True
     except Exception as e:
-        print(f"Error uploading PDF to Supabase Storage: {e}")
+        print(f"Error streaming PDF to Supabase Storage: {e}")
         raise
 
-async def get_pdf_url(file_id: str):
+async def move_pdf(object_key: str, file_id: str):
     try:
-        signed_url_data = supabase.storage.from_('pdf').create_signed_url(f"{file_id}.pdf", 60 * 60 * 24)  # valid for 24 hours
-        url = signed_url_data.get("signedURL")
-        return url
+        with storage_seconds.time(operation="move_pdf"):
+            await get_storage().move_object('pdf', f"{object_key}.pdf", f"{file_id}.pdf")
+        return True
     except Exception as e:
-        print(f"Error getting PDF URL: {e}")
+        print(f"Error moving PDF in Supabase Storage: {e}")
         raise
 
-async def upload_project(project_id: str, project_path: str):
+async def remove_pdf(object_key: str):
     try:
-        # Create zip file
-        zip_path = f"{project_path}.zip"
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(project_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, project_path)
-                    zipf.write(file_path, arcname)
-        
-        with open(zip_path, 'rb') as f:
-            supabase.storage.from_('project-code').upload(
-                f"{project_id}.zip",
-                f.read(),
-                {"content-type": "application/zip"}
-            )
-        
-        signed_url_data = supabase.storage.from_('project-code').create_signed_url(f"{project_id}.zip", 60 * 60 * 24)  # valid for 24 hours
-        url = signed_url_data.get("signedURL")
-        
-        os.remove(zip_path)
-        shutil.rmtree(project_path)
-        
-        return url
+        with storage_seconds.time(operation="remove_pdf"):
+            await get_storage().remove_objects('pdf', [f"{object_key}.pdf"])
+        return True
+    except Exception as e:
+        print(f"Error removing PDF from Supabase Storage: {e}")
+        raise
+
+async def pdf_exists(file_id: str):
+    try:
+        with storage_seconds.time(operation="pdf_exists"):
+            return await get_storage().object_exists('pdf', f"{file_id}.pdf")
+    except Exception as e:
+        print(f"Error checking PDF in Supabase Storage: {e}")
+        raise
+
+def iter_pdf(file_id: str) -> AsyncIterator[bytes]:
+    return get_storage().iter_object('pdf', f"{file_id}.pdf")
+
+async def touch_pdf(file_id: str, now: Optional[datetime] = None):
+    """Keep the PDF for another PDF_TTL_SECONDS; called whenever it is uploaded or used.
+
+    A failure only means the PDF may be swept earlier, so it is logged rather than raised.
+    """
+    now = now or datetime.now(timezone.utc)
+    try:
+        with storage_seconds.time(operation="touch_pdf"):
+            await get_storage().touch_pdf(file_id, (now + timedelta(seconds=PDF_TTL_SECONDS)).isoformat())
+    except Exception as e:
+        print(f"Error recording PDF use: {e}")
+
+async def upload_project(project_id: str, files: Dict[str, Optional[str]], compresslevel: int = ZIP_COMPRESSLEVEL):
+    try:
+        storage = get_storage()
+        with storage_seconds.time(operation="upload_project"):
+            # The archive is compressed and streamed from the file contents, nothing is written to disk
+            await storage.put_object('project-code', f"{project_id}.zip", aiter_zip(files, compresslevel), "application/zip")
+
+            return await storage.signed_url('project-code', f"{project_id}.zip", SIGNED_URL_SECONDS)
     except Exception as e:
         print(f"Error uploading to Supabase Storage: {e}")
         raise
 
+def iter_project_archive(project_id: str) -> AsyncIterator[bytes]:
+    return get_storage().iter_object('project-code', f"{project_id}.zip")
+
 async def get_project_download_url(project_id: str):
     try:
-        result = supabase.table("projects").select("download_url").eq("id", project_id).execute()
-        if not result.data:
+        with storage_seconds.time(operation="get_project"):
+            project = await get_storage().get_project(project_id)
+        # Expired projects are gone or about to be swept, so they count as missing
+        now = datetime.now(timezone.utc)
+        if not project or datetime.fromisoformat(project["expires_at"]) <= now:
             return None
-        return result.data[0]["download_url"]
+
+        url_expires_at = project.get("url_expires_at") or project["expires_at"]
+        if datetime.fromisoformat(url_expires_at) - now > timedelta(seconds=SIGNED_URL_REFRESH_SECONDS):
+            return project["download_url"]
+        return await refresh_project_url(project_id, now)
     except Exception as e:
         print(f"Error retrieving project info: {e}")
-        raise
\ No newline at end of file
+        raise
+
+async def refresh_project_url(project_id: str, now: datetime) -> str:
+    """Sign a new download URL for a project whose current one is about to expire."""
+    storage = get_storage()
+    with storage_seconds.time(operation="refresh_project_url"):
+        download_url = await storage.signed_url('project-code', f"{project_id}.zip", SIGNED_URL_SECONDS)
+        await storage.update_project(project_id, {
+            "download_url": download_url,
+            "url_expires_at": (now + timedelta(seconds=SIGNED_URL_SECONDS)).isoformat()
+        })
+    return download_url
+
+async def get_cached_project(file_id: str) -> Optional[Dict[str, str]]:
+    try:
+        with storage_seconds.time(operation="get_cached_project"):
+            return await get_storage().find_project_by_file(file_id, datetime.now(timezone.utc).isoformat())
+    except Exception as e:
+        print(f"Error retrieving cached project: {e}")
+        raise
+
+async def _sized(storage: StorageBackend, bucket: str, paths: List[str], concurrency: int) -> Dict[str, int]:
+    """Sizes of the objects in `paths` that still exist, looked up `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def size(path: str) -> Optional[int]:
+        async with semaphore:
+            return await storage.object_size(bucket, path)
+
+    sizes = await asyncio.gather(*(size(path) for path in paths))
+    return {path: size for path, size in zip(paths, sizes) if size is not None}
+
+async def sweep_expired_projects(now: Optional[datetime] = None, batch_size: int = SWEEP_BATCH_SIZE,
+                                 concurrency: int = SWEEP_CONCURRENCY) -> Dict[str, Any]:
+    """Delete expired projects with their archives.
+
+    Projects are taken oldest first in batches of `batch_size` through the
+    `expires_at` index; archives are removed in one call per batch. The PDFs
+    they were generated from expire on their own, see sweep_expired_pdfs.
+    """
+    now = now or datetime.now(timezone.utc)
+    storage = get_storage()
+    swept: List[str] = []
+    reclaimed = 0
+    try:
+        while True:
+            with storage_seconds.time(operation="find_expired_projects"):
+                projects = await storage.find_expired_projects(now.isoformat(), batch_size)
+            if not projects:
+                break
+
+            archives = await _sized(storage, 'project-code', [f"{project['id']}.zip" for project in projects], concurrency)
+
+            with storage_seconds.time(operation="sweep_expired_projects"):
+                if archives:
+                    await storage.remove_objects('project-code', list(archives))
+                    reclaimed += sum(archives.values())
+                    storage_reclaimed_bytes.inc(sum(archives.values()), bucket='project-code')
+                project_ids = [project["id"] for project in projects]
+                await storage.delete_projects(project_ids)
+
+            swept.extend(project_ids)
+            expired_projects_swept.inc(len(project_ids))
+            if len(projects) < batch_size:
+                break
+        return {"projects": swept, "reclaimed_bytes": reclaimed}
+    except Exception as e:
+        print(f"Error sweeping expired projects: {e}")
+        raise
+
+async def sweep_expired_pdfs(now: Optional[datetime] = None, keep_file_ids: Collection[str] = (),
+                             batch_size: int = SWEEP_BATCH_SIZE, concurrency: int = SWEEP_CONCURRENCY) -> Dict[str, Any]:
+    """Delete PDFs nobody has uploaded or used for PDF_TTL_SECONDS, and abandoned staged uploads.
+
+    Expired PDFs are taken oldest first in batches of `batch_size`, whether or
+    not a project was ever generated from them. Those in `keep_file_ids`, such
+    as the PDFs of runs in progress, are still in use and get a new expiry
+    instead. Staged objects older than STAGING_MAX_AGE_SECONDS are removed too.
+    """
+    now = now or datetime.now(timezone.utc)
+    storage = get_storage()
+    swept: List[str] = []
+    staged: List[str] = []
+    reclaimed = 0
+    try:
+        while True:
+            with storage_seconds.time(operation="find_expired_pdfs"):
+                file_ids = await storage.find_expired_pdfs(now.isoformat(), batch_size)
+            if not file_ids:
+                break
+
+            unused = [file_id for file_id in file_ids if file_id not in keep_file_ids]
+            await asyncio.gather(*(touch_pdf(file_id, now) for file_id in file_ids if file_id in keep_file_ids))
+
+            with storage_seconds.time(operation="sweep_expired_pdfs"):
+                # A PDF uploaded again since it was listed has a new expiry and keeps its row;
+                # only the objects whose rows were deleted go
+                deleted = await storage.delete_expired_pdfs(unused, now.isoformat()) if unused else []
+                pdfs = await _sized(storage, 'pdf', [f"{file_id}.pdf" for file_id in deleted], concurrency)
+                if pdfs:
+                    await storage.remove_objects('pdf', list(pdfs))
+                    reclaimed += sum(pdfs.values())
+                    storage_reclaimed_bytes.inc(sum(pdfs.values()), bucket='pdf')
+
+            swept.extend(deleted)
+            expired_pdfs_swept.inc(len(deleted))
+            if len(file_ids) < batch_size:
+                break
+
+        # Uploads used to be staged under staging/ and moved within their request; old ones were abandoned
+        staged_before = (now - timedelta(seconds=STAGING_MAX_AGE_SECONDS)).isoformat()
+        while True:
+            with storage_seconds.time(operation="find_staged_pdfs"):
+                objects = await storage.list_objects('pdf', 'staging', staged_before, batch_size)
+            if objects:
+                await storage.remove_objects('pdf', [obj["path"] for obj in objects])
+                reclaimed += sum(obj["size"] for obj in objects)
+                storage_reclaimed_bytes.inc(sum(obj["size"] for obj in objects), bucket='pdf')
+                staged.extend(obj["path"] for obj in objects)
+                expired_pdfs_swept.inc(len(objects))
+            if len(objects) < batch_size:
+                break
+        return {"pdfs": swept, "staging": staged, "reclaimed_bytes": reclaimed}
+    except Exception as e:
+        print(f"Error sweeping expired PDFs: {e}")
+        raise
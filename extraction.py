@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACTION_PAGES_PER_TASK = int(os.getenv("EXTRACTION_PAGES_PER_TASK", "8"))
+EXTRACTION_MAX_PAGES = int(os.getenv("EXTRACTION_MAX_PAGES", "0")) or None
+EXTRACTION_MAX_TOKENS = int(os.getenv("EXTRACTION_MAX_TOKENS", "0")) or None
+CHARS_PER_TOKEN = 4
+
+_pool: Optional[ProcessPoolExecutor] = None
+# Extractions run in worker threads, so two of them may ask for the pool at once
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers do not inherit the server's threads and event loop
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    # PyPDF2 is imported on first use, keeping it off the server's import path
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(pdf_path)
+    return [reader.pages[index].extract_text() or "" for index in range(start, end)]
+
+
+def extract_text(pdf_path: str, max_pages: Optional[int] = None, max_tokens: Optional[int] = None) -> str:
+    """Extract the text of a PDF, parsing batches of pages in worker processes.
+
+    Stops after `max_pages` pages or once roughly `max_tokens` tokens have been
+    collected, whichever comes first. Batches are submitted a few at a time so
+    pages past the budget are never parsed.
+    """
+    max_pages = max_pages or EXTRACTION_MAX_PAGES
+    max_tokens = max_tokens or EXTRACTION_MAX_TOKENS
+
+    from PyPDF2 import PdfReader
+    page_count = len(PdfReader(pdf_path).pages)
+    if max_pages:
+        page_count = min(page_count, max_pages)
+
+    ranges = deque(
+        (start, min(start + EXTRACTION_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, EXTRACTION_PAGES_PER_TASK)
+    )
+    use_pool = EXTRACTION_WORKERS > 1 and len(ranges) > 1
+    window = deque()
+
+    def submit():
+        while ranges and len(window) < EXTRACTION_WORKERS * 2:
+            start, end = ranges.popleft()
+            window.append(get_pool().submit(extract_page_range, pdf_path, start, end))
+
+    pages = []
+    tokens = 0
+    try:
+        while ranges or window:
+            if use_pool:
+                submit()
+                batch = window.popleft().result()
+            else:
+                batch = extract_page_range(pdf_path, *ranges.popleft())
+
+            for text in batch:
+                if max_tokens and tokens + estimate_tokens(text) > max_tokens:
+                    pages.append(text[:(max_tokens - tokens) * CHARS_PER_TOKEN])
+                    return "\n".join(pages)
+                pages.append(text)
+                tokens += estimate_tokens(text)
+    finally:
+        for future in window:
+            future.cancel()
+
+    return "\n".join(pages)
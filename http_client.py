@@ -0,0 +1,108 @@
+import asyncio
+import os
+import random
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "64"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "8"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF_SECONDS = float(os.getenv("HTTP_BACKOFF_SECONDS", "0.5"))
+HTTP_BACKOFF_MAX_SECONDS = float(os.getenv("HTTP_BACKOFF_MAX_SECONDS", "8"))
+HTTP_CHUNK_SIZE = 1024 * 1024
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+_client: Optional["httpx.AsyncClient"] = None
+_host_slots: Dict[str, asyncio.Semaphore] = {}
+
+
+class FetchError(Exception):
+    pass
+
+
+class ResponseTooLargeError(FetchError):
+    pass
+
+
+def get_client() -> "httpx.AsyncClient":
+    """The process-wide client, so outbound fetches reuse keep-alive connections."""
+    global _client
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_slots.clear()
+
+
+def _host_slot(host: str) -> asyncio.Semaphore:
+    # httpx only caps connections pool-wide, so one slow host could hold them all
+    if host not in _host_slots:
+        _host_slots[host] = asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+    return _host_slots[host]
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After seconds when given, capped either way."""
+    if retry_after and retry_after.strip().isdigit():
+        return min(float(retry_after), HTTP_BACKOFF_MAX_SECONDS)
+    return random.uniform(0, min(HTTP_BACKOFF_MAX_SECONDS, HTTP_BACKOFF_SECONDS * 2 ** attempt))
+
+
+async def iter_url(url: str, max_bytes: int, chunk_size: int = HTTP_CHUNK_SIZE, retries: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Stream the body of a GET request, stopping with ResponseTooLargeError past `max_bytes`.
+
+    Connection errors, timeouts and retryable statuses are retried with backoff
+    until the first byte has been yielded; after that a failure is final.
+    """
+    import httpx
+
+    retries = HTTP_RETRIES if retries is None else retries
+    try:
+        host = httpx.URL(url).host
+    except httpx.InvalidURL as e:
+        raise FetchError(f"Invalid URL: {url}") from e
+
+    async with _host_slot(host):
+        for attempt in range(retries + 1):
+            retry_after = None
+            started = False
+            try:
+                async with get_client().stream("GET", url) as response:
+                    if response.status_code in RETRY_STATUSES and attempt < retries:
+                        retry_after = response.headers.get("retry-after")
+                    elif response.status_code != 200:
+                        raise FetchError(f"GET {url} returned {response.status_code}")
+                    else:
+                        length = response.headers.get("content-length")
+                        if length and length.isdigit() and int(length) > max_bytes:
+                            raise ResponseTooLargeError(f"Response exceeds the {max_bytes} byte limit")
+
+                        size = 0
+                        async for chunk in response.aiter_bytes(chunk_size):
+                            size += len(chunk)
+                            if size > max_bytes:
+                                raise ResponseTooLargeError(f"Response exceeds the {max_bytes} byte limit")
+                            started = True
+                            yield chunk
+                        return
+            except httpx.TransportError as e:
+                if started or attempt >= retries or isinstance(e, httpx.UnsupportedProtocol):
+                    raise FetchError(f"GET {url} failed: {type(e).__name__}") from e
+
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
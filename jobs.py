@@ -0,0 +1,410 @@
+import asyncio
+import heapq
+import json
+import os
+import sqlite3
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "50"))
+JOB_HEARTBEAT_SECONDS = 20
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_QUEUE_MAX = int(os.getenv("BATCH_QUEUE_MAX", "1000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    tenant TEXT,
+    batch_id TEXT,
+    batch_index INTEGER,
+    pdf_url TEXT,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+FINISHED_STATUSES = ("complete", "error")
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class BatchTooLargeError(Exception):
+    pass
+
+
+class JobEventSink:
+    """Queue-like object handed to the runner; every event is persisted for the job."""
+
+    def __init__(self, job_queue: "JobQueue", job_id: str):
+        self.job_queue = job_queue
+        self.job_id = job_id
+
+    async def put(self, event: str):
+        await self.job_queue.add_event(self.job_id, event)
+
+
+Runner = Callable[[Dict[str, Any], JobEventSink], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobQueue:
+    """Persistent queue of generation jobs drained by a fixed pool of asyncio workers.
+
+    Jobs are claimed oldest first among the tenants with the fewest running jobs.
+    Single jobs and batch items are capped separately, at `max_depth` and
+    `max_batch_depth` queued jobs.
+    """
+
+    def __init__(self, path: str, runner: Runner, workers: int = JOB_WORKERS, max_depth: int = JOB_QUEUE_MAX,
+                 max_batch_depth: int = BATCH_QUEUE_MAX):
+        self.path = path
+        self.runner = runner
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_batch_depth = max_batch_depth
+        self._worker_tasks: List[asyncio.Task] = []
+        self._changed: Optional[asyncio.Condition] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._version = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        conn = self._connect()
+        try:
+            return fn(conn)
+        finally:
+            conn.close()
+
+    async def _db(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.to_thread(self._run, fn)
+
+    async def start(self):
+        def init(conn: sqlite3.Connection):
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+            for column, column_type in (("tenant", "TEXT"), ("batch_id", "TEXT"), ("batch_index", "INTEGER"), ("pdf_url", "TEXT")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id, batch_index)")
+            # Jobs interrupted by a restart are picked up again from the start
+            conn.execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (_now(),))
+
+        await self._db(init)
+        self._changed = asyncio.Condition()
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def submit(self, file_id: str, tenant: Optional[str] = None) -> Dict[str, Any]:
+        job_id = str(uuid.uuid4())
+
+        def insert(conn: sqlite3.Connection):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Batch items have their own cap
+                depth = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND batch_id IS NULL").fetchone()[0]
+                if depth >= self.max_depth:
+                    raise QueueFullError(f"Job queue is full ({depth} jobs waiting)")
+                now = _now()
+                conn.execute(
+                    "INSERT INTO jobs (id, file_id, tenant, status, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                    (job_id, file_id, tenant, now, now)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        await self._db(insert)
+        self._wakeup.set()
+        return await self.get(job_id)
+
+    async def submit_batch(self, items: List[Dict[str, Optional[str]]], tenant: Optional[str] = None) -> Dict[str, Any]:
+        """Queue one job per distinct item, where each item has either a `file_id` or a `pdf_url`.
+
+        A batch is rejected whole when it has more than BATCH_MAX_ITEMS items, or
+        when its items would take the queued batch items past `max_batch_depth`.
+        """
+        batch_id = str(uuid.uuid4())
+        distinct = list(dict.fromkeys((item.get("file_id"), item.get("pdf_url")) for item in items))
+        if len(distinct) > BATCH_MAX_ITEMS:
+            raise BatchTooLargeError(f"Batch has {len(distinct)} items, the limit is {BATCH_MAX_ITEMS}")
+
+        def insert(conn: sqlite3.Connection):
+            now = _now()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                depth = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND batch_id IS NOT NULL").fetchone()[0]
+                if depth + len(distinct) > self.max_batch_depth:
+                    raise QueueFullError(f"Batch queue is full ({depth} batch items waiting)")
+                conn.executemany(
+                    "INSERT INTO jobs (id, file_id, tenant, batch_id, batch_index, pdf_url, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?)",
+                    [
+                        (str(uuid.uuid4()), file_id or "", tenant, batch_id, index, pdf_url, now, now)
+                        for index, (file_id, pdf_url) in enumerate(distinct)
+                    ]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        await self._db(insert)
+        self._wakeup.set()
+        return {**await self.get_batch(batch_id), "duplicates": len(items) - len(distinct)}
+
+    async def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        def select(conn: sqlite3.Connection):
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE batch_id = ? ORDER BY batch_index", (batch_id,)
+            ).fetchall()
+            if not rows:
+                return None
+            items = []
+            counts = {"queued": 0, "running": 0, "complete": 0, "error": 0}
+            for row in rows:
+                result = json.loads(row["result"]) if row["result"] else {}
+                counts[row["status"]] += 1
+                items.append({
+                    "index": row["batch_index"],
+                    "job_id": row["id"],
+                    "file_id": row["file_id"] or None,
+                    "pdf_url": row["pdf_url"],
+                    "status": row["status"],
+                    "project_id": result.get("project_id"),
+                    "error": row["error"]
+                })
+            finished = counts["complete"] + counts["error"]
+            return {
+                "id": batch_id,
+                "status": "complete" if finished == len(items) else "running",
+                "total": len(items),
+                "counts": counts,
+                "items": items
+            }
+
+        return await self._db(select)
+
+    async def stream_batch(self, batch_id: str) -> AsyncIterator[str]:
+        """Follow a batch as SSE: aggregate counts on every change and one event per finished item."""
+        reported = set()
+        counts = None
+        while True:
+            seen = self._version
+            batch = await self.get_batch(batch_id)
+            if batch is None:
+                return
+
+            for item in batch["items"]:
+                if item["status"] in FINISHED_STATUSES and item["index"] not in reported:
+                    reported.add(item["index"])
+                    yield f"data: {json.dumps({**item, 'status': 'item_' + item['status']})}\n\n"
+            if batch["counts"] != counts:
+                counts = batch["counts"]
+                yield f"data: {json.dumps({'status': 'batch_progress', 'total': batch['total'], **counts})}\n\n"
+            if batch["status"] == "complete":
+                yield f"data: {json.dumps({'status': 'batch_complete', 'batch_id': batch_id, 'total': batch['total'], **counts})}\n\n"
+                return
+
+            try:
+                async with self._changed:
+                    await asyncio.wait_for(self._changed.wait_for(lambda: self._version != seen), JOB_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield f"data: {json.dumps({'status': 'heartbeat', 'message': 'Still processing...', 'timestamp': datetime.now().isoformat()})}\n\n"
+
+    async def active_file_ids(self) -> List[str]:
+        """PDFs that queued or running jobs still have to read."""
+        rows = await self._db(lambda conn: conn.execute(
+            "SELECT DISTINCT file_id FROM jobs WHERE status IN ('queued', 'running') AND file_id != ''"
+        ).fetchall())
+        return [row["file_id"] for row in rows]
+
+    async def set_file_id(self, job_id: str, file_id: str):
+        await self._db(lambda conn: conn.execute(
+            "UPDATE jobs SET file_id = ?, updated_at = ? WHERE id = ?", (file_id, _now(), job_id)
+        ))
+
+    async def find_earlier_duplicate(self, job: Dict[str, Any], file_id: str) -> Optional[Dict[str, Any]]:
+        """An earlier job of the same batch for the same PDF that has already been claimed, if any."""
+        def select(conn: sqlite3.Connection):
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE batch_id = ? AND file_id = ? AND batch_index < ? AND status != 'queued' "
+                "ORDER BY batch_index LIMIT 1",
+                (job["batch_id"], file_id, job["batch_index"])
+            ).fetchone()
+            return dict(row) if row is not None else None
+
+        return await self._db(select)
+
+    async def wait_finished(self, job_id: str) -> Optional[Dict[str, Any]]:
+        while True:
+            seen = self._version
+            job = await self.get(job_id)
+            if job is None or job["status"] in FINISHED_STATUSES:
+                return job
+            async with self._changed:
+                await self._changed.wait_for(lambda: self._version != seen)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        def select(conn: sqlite3.Connection):
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            job["result"] = json.loads(job["result"]) if job["result"] else None
+            if job["status"] == "queued":
+                job["position"] = self._position(conn, job_id)
+            return job
+
+        return await self._db(select)
+
+    @staticmethod
+    def _position(conn: sqlite3.Connection, job_id: str) -> int:
+        """How many queued jobs `_claim` takes before `job_id`, if no running job finishes meanwhile."""
+        running = {row["tenant"]: row["count"] for row in conn.execute(
+            "SELECT tenant, COUNT(*) AS count FROM jobs WHERE status = 'running' GROUP BY tenant"
+        )}
+        queues: Dict[Optional[str], deque] = {}
+        for row in conn.execute("SELECT id, tenant, created_at, rowid FROM jobs WHERE status = 'queued' ORDER BY created_at, rowid"):
+            queues.setdefault(row["tenant"], deque()).append(row)
+
+        # Replay the claims: every claimed job counts as running for its tenant
+        heads = [(running.get(tenant, 0), queue[0]["created_at"], queue[0]["rowid"], tenant) for tenant, queue in queues.items()]
+        heapq.heapify(heads)
+        position = 0
+        while heads:
+            count, _, _, tenant = heapq.heappop(heads)
+            queue = queues[tenant]
+            if queue.popleft()["id"] == job_id:
+                return position
+            position += 1
+            if queue:
+                heapq.heappush(heads, (count + 1, queue[0]["created_at"], queue[0]["rowid"], tenant))
+        return position
+
+    async def add_event(self, job_id: str, event: str):
+        def insert(conn: sqlite3.Connection):
+            conn.execute(
+                "INSERT INTO job_events (job_id, seq, data) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ? FROM job_events WHERE job_id = ?",
+                (job_id, event, job_id)
+            )
+
+        await self._db(insert)
+        await self._notify()
+
+    async def events(self, job_id: str, after: int = 0) -> List[Tuple[int, str]]:
+        def select(conn: sqlite3.Connection):
+            rows = conn.execute(
+                "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after)
+            ).fetchall()
+            return [(row["seq"], row["data"]) for row in rows]
+
+        return await self._db(select)
+
+    async def stream_events(self, job_id: str, after: int = 0) -> AsyncIterator[str]:
+        """Yield the stored events after `after` as SSE, then follow the job until it finishes."""
+        while True:
+            seen = self._version
+            for seq, event in await self.events(job_id, after):
+                after = seq
+                yield f"id: {seq}\n{event}"
+
+            job = await self.get(job_id)
+            if job is None or job["status"] in FINISHED_STATUSES:
+                if not await self.events(job_id, after):
+                    return
+                continue
+
+            try:
+                async with self._changed:
+                    await asyncio.wait_for(self._changed.wait_for(lambda: self._version != seen), JOB_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield f"data: {json.dumps({'status': 'heartbeat', 'message': 'Still processing...', 'timestamp': datetime.now().isoformat()})}\n\n"
+
+    async def _notify(self):
+        async with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        def claim(conn: sqlite3.Connection):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # The oldest job of the tenant with the fewest running jobs goes
+                # next, so one tenant's backlog cannot hold every worker
+                row = conn.execute(
+                    "SELECT * FROM jobs AS queued WHERE status = 'queued' ORDER BY "
+                    "(SELECT COUNT(*) FROM jobs AS running WHERE running.status = 'running' AND running.tenant IS queued.tenant), "
+                    "created_at, rowid LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                        (_now(), row["id"])
+                    )
+                conn.execute("COMMIT")
+                return dict(row) if row is not None else None
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        return await self._db(claim)
+
+    async def _finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        await self._db(lambda conn: conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, _now(), job_id)
+        ))
+        await self._notify()
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            job = await self._claim()
+            if job is None:
+                await self._wakeup.wait()
+                continue
+
+            await self._notify()
+            try:
+                result = await self.runner(job, JobEventSink(self, job["id"]))
+                await self._finish(job["id"], "complete", result=result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error running job {job['id']}: {e}")
+                await self._finish(job["id"], "error", error=str(e))
@@ -0,0 +1,213 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cache import cache_key
+from metrics import llm_cache_lookups
+
+LLM_CACHE = os.getenv("LLM_CACHE", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "brss_llm_cache.sqlite3"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Request options that change how a call is sent but not what the model answers;
+# extra_body and extra_query can carry model parameters, so they stay in the key
+TRANSPORT_PARAMS = ("timeout", "extra_headers")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+CREATE INDEX IF NOT EXISTS responses_created ON responses (created_at);
+"""
+
+
+def request_key(params: Dict[str, Any]) -> str:
+    """Hash of a chat completion request's model, messages and sampling parameters."""
+    params = {name: value for name, value in params.items() if name not in TRANSPORT_PARAMS}
+    return cache_key("chat.completions", params.pop("model", None), params.pop("messages", None), params)
+
+
+class LLMCache:
+    """LLM responses in SQLite, expired after `ttl` seconds and evicted least-recently-used past `max_bytes`."""
+
+    def __init__(self, path: str, ttl: float = LLM_CACHE_TTL_SECONDS, max_bytes: int = LLM_CACHE_MAX_BYTES,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._ready = True
+        return conn
+
+    def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        # Calls come from the stage worker threads, each with its own short-lived connection
+        with self._lock:
+            conn = self._connect()
+            try:
+                return fn(conn)
+            finally:
+                conn.close()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        def lookup(conn: sqlite3.Connection):
+            now = self.clock()
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+        try:
+            value = self._run(lookup)
+        except sqlite3.Error as e:
+            print(f"Error reading LLM cache: {e}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+            llm_cache_lookups.inc(result="miss")
+            return False, None
+        self.hits += 1
+        llm_cache_lookups.inc(result="hit")
+        return True, json.loads(value)
+
+    def set(self, key: str, value: Any, model: Optional[str] = None):
+        data = json.dumps(value, ensure_ascii=False)
+
+        def store(conn: sqlite3.Connection):
+            now = self.clock()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, data, len(data.encode('utf-8')), now, now)
+            )
+            self._evict(conn, now)
+
+        try:
+            self._run(store)
+        except sqlite3.Error as e:
+            print(f"Error writing LLM cache: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop the least recently used responses until the rest fit
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at, rowid"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def stats(self) -> Dict[str, Any]:
+        entries, size = self._run(lambda conn: conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone())
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size
+        }
+
+
+def _load_response(value: Any) -> Any:
+    # Responses are stored as plain JSON and rebuilt into the SDK type the caller expects
+    if isinstance(value, dict) and value.get("object") == "chat.completion":
+        from openai.types.chat import ChatCompletion
+        return ChatCompletion.model_validate(value)
+    return value
+
+
+class CachedCompletions:
+    def __init__(self, completions, cache: LLMCache):
+        self._completions = completions
+        self._cache = cache
+
+    def create(self, **params):
+        # Streamed responses are consumed by the caller as they arrive and are not cached
+        if params.get("stream"):
+            return self._completions.create(**params)
+
+        # A client underneath that rewrites requests, such as the model router, does so
+        # before the key is taken, so answers to different final requests are kept apart
+        prepare = getattr(self._completions, "prepare", None)
+        if prepare is not None:
+            params = prepare(params)
+
+        key = request_key(params)
+        hit, value = self._cache.get(key)
+        if hit:
+            return _load_response(value)
+
+        response = self._completions.create(**params)
+        value = response.model_dump(mode="json") if hasattr(response, "model_dump") else response
+        # An answer cut off at the output cap is not what an uncapped request would get
+        if isinstance(value, dict) and any(choice.get("finish_reason") == "length" for choice in value.get("choices") or []):
+            return response
+        try:
+            self._cache.set(key, value, params.get("model"))
+        except (TypeError, ValueError) as e:
+            print(f"Error caching LLM response: {e}")
+        return response
+
+
+class _CachedChat:
+    def __init__(self, chat, cache: LLMCache):
+        self._chat = chat
+        self.completions = CachedCompletions(chat.completions, cache)
+
+    def __getattr__(self, name: str):
+        return getattr(self._chat, name)
+
+
+class CachedClient:
+    """OpenAI-compatible client whose `chat.completions.create` answers repeated requests from the cache."""
+
+    def __init__(self, client, cache: LLMCache):
+        self._client = client
+        self.chat = _CachedChat(client.chat, cache)
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+llm_cache = LLMCache(LLM_CACHE_PATH)
+
+
+def install(generator, cache: Optional[LLMCache] = None):
+    """Route the generator's OpenAI calls through the response cache.
+
+    ProjectGenerator keeps its OpenAI client on `client`; generators without
+    one, such as the benchmark fakes, are returned unchanged.
+    """
+    client = getattr(generator, "client", None)
+    if LLM_CACHE and client is not None and hasattr(client, "chat") and not isinstance(client, CachedClient):
+        generator.client = CachedClient(client, cache or llm_cache)
+    return generator
@@ -0,0 +1,21 @@
+-- Columns, tables and indexes for project reuse, download URL refresh and the
+-- expiry sweeper. LocalBackend applies the same schema itself; a Supabase
+-- database needs this applied once, e.g. with `psql "$DATABASE_URL" -f` or the
+-- SQL editor. The server checks for it at startup. Safe to run again.
+
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS file_id text;
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS url_expires_at timestamptz;
+CREATE INDEX IF NOT EXISTS projects_expires_at ON projects (expires_at);
+CREATE INDEX IF NOT EXISTS projects_file_id ON projects (file_id, expires_at);
+
+-- PDFs are deduplicated across uploads and expire on their own last use
+CREATE TABLE IF NOT EXISTS pdfs (
+    file_id text PRIMARY KEY,
+    expires_at timestamptz NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pdfs_expires_at ON pdfs (expires_at);
+
+-- PDFs that already have projects are kept as long as their latest project
+INSERT INTO pdfs (file_id, expires_at)
+    SELECT file_id, max(expires_at) FROM projects WHERE file_id IS NOT NULL GROUP BY file_id
+    ON CONFLICT (file_id) DO NOTHING;
@@ -0,0 +1,370 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from cache import DiskCache, cache_key
+from compaction import compact_paper, stage_context, PAPER_COMPACTION, COMPACTION_KEEP_APPENDIX, STAGE_SECTIONS
+from db import upload_project, store_project_info
+from extraction import extract_text, estimate_tokens, EXTRACTION_MAX_PAGES, EXTRACTION_MAX_TOKENS
+from metrics import stage_seconds, stage_tokens, executor_queue_depth, scheduler_waiting
+from scheduler import FairScheduler, PRIORITIES
+from routing import current_stage, current_budget, start_run
+
+PIPELINE_MODES = ("sequential", "parallel", "dataflow")
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "sequential")
+FILE_CONCURRENCY = int(os.getenv("FILE_CONCURRENCY", "8"))
+FILE_TIMEOUT_SECONDS = float(os.getenv("FILE_TIMEOUT_SECONDS", "300"))
+DATAFLOW_MAX_IN_FLIGHT = int(os.getenv("DATAFLOW_MAX_IN_FLIGHT", os.getenv("FILE_CONCURRENCY", "8")))
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "4"))
+PDF_EXTRACTOR = os.getenv("PDF_EXTRACTOR", "parallel")
+SSE_STAGE_METRICS = os.getenv("SSE_STAGE_METRICS", "false").lower() == "true"
+FILE_EVENT_CHUNK_CHARS = int(os.getenv("FILE_EVENT_CHUNK_CHARS", str(64 * 1024)))
+
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", os.path.join(tempfile.gettempdir(), "brss_checkpoints"))
+CHECKPOINT_MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", str(512 * 1024 * 1024)))
+
+thread_pool = ThreadPoolExecutor(max_workers=STAGE_WORKERS)
+
+# Per-file calls get their own threads so a fan-out cannot starve whole-stage calls
+file_pool = ThreadPoolExecutor(max_workers=FILE_CONCURRENCY)
+
+# Stage calls wait here rather than in the executors' FIFO queues, so clients
+# are served fairly and interactive runs go before batch jobs
+schedulers = {
+    thread_pool: FairScheduler(STAGE_WORKERS),
+    file_pool: FairScheduler(FILE_CONCURRENCY)
+}
+
+stage_checkpoints = DiskCache(CHECKPOINT_DIR, CHECKPOINT_MAX_BYTES)
+
+# Stages that do not call the LLM are timed but not counted towards tokens
+LOCAL_STAGES = ("extract_text", "read_paper", "compact_paper")
+
+executor_queue_depth.set_function(lambda: thread_pool._work_queue.qsize(), executor="stages")
+executor_queue_depth.set_function(lambda: file_pool._work_queue.qsize(), executor="files")
+for executor_name, executor in (("stages", thread_pool), ("files", file_pool)):
+    for priority in PRIORITIES:
+        scheduler_waiting.set_function(
+            lambda executor=executor, priority=priority: schedulers[executor].waiting(priority),
+            executor=executor_name, priority=priority
+        )
+
+
+async def run_in_thread(func, *args, executor: Executor = thread_pool):
+    # The call sees the caller's context variables, so the LLM client knows which stage and run it serves
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, func, *args))
+
+async def load_checkpoint(stage: str, key_inputs: tuple) -> Tuple[bool, Any]:
+    hit, value = await asyncio.to_thread(stage_checkpoints.get, cache_key(stage, *key_inputs))
+    if hit:
+        stage_seconds.observe(0, stage=stage, cached="true")
+    return hit, value
+
+async def run_stage(stage: str, key_inputs: tuple, func, *args, use_cache: bool = True, executor: Executor = thread_pool):
+    # Stage outputs are checkpointed under the hash of their inputs, so a retry
+    # resumes after the last stage that completed
+    key = cache_key(stage, *key_inputs)
+    if use_cache:
+        hit, value = await load_checkpoint(stage, key_inputs)
+        if hit:
+            return value
+
+    async with schedulers[executor].slot():
+        with stage_seconds.time(stage=stage, cached="false"):
+            token = current_stage.set(stage)
+            try:
+                value = await run_in_thread(func, *args, executor=executor)
+            finally:
+                current_stage.reset(token)
+    if stage not in LOCAL_STAGES:
+        stage_tokens.inc(estimate_tokens(json.dumps(key_inputs, default=str)), stage=stage, direction="input")
+        stage_tokens.inc(estimate_tokens(json.dumps(value, default=str)), stage=stage, direction="output")
+    try:
+        await asyncio.to_thread(stage_checkpoints.set, key, value)
+    except (TypeError, ValueError, OSError) as e:
+        print(f"Error checkpointing stage {stage}: {e}")
+    return value
+
+def file_events(path: str, content: str, chunk_chars: Optional[int] = None) -> List[str]:
+    """SSE `file` events for one file, split so no single event carries more than `chunk_chars` characters."""
+    chunk_chars = chunk_chars or FILE_EVENT_CHUNK_CHARS
+    pieces = [content[start:start + chunk_chars] for start in range(0, len(content), chunk_chars)] or [""]
+    return [
+        f"data: {json.dumps({'status': 'file', 'path': path, 'chunk': index, 'chunks': len(pieces), 'content': piece})}\n\n"
+        for index, piece in enumerate(pieces)
+    ]
+
+def file_manifest(files: Dict[str, Optional[str]], chunk_chars: Optional[int] = None) -> List[Dict[str, Any]]:
+    chunk_chars = chunk_chars or FILE_EVENT_CHUNK_CHARS
+    return [
+        {'path': path, 'size': len(content), 'chunks': max(1, -(-len(content) // chunk_chars))}
+        for path, content in files.items()
+        if content is not None
+    ]
+
+def complete_event(project_id: str, files: Dict[str, Optional[str]], **extra) -> str:
+    return f"data: {json.dumps({'status': 'complete', 'message': 'Code generation complete', 'project_id': project_id, 'files': file_manifest(files), **extra})}\n\n"
+
+async def send_file(queue: asyncio.Queue, path: str, content: str):
+    for event in file_events(path, content):
+        await queue.put(event)
+
+async def map_files(
+    items: Dict[str, Any],
+    worker: Callable[[str, Any], Awaitable[Any]],
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None
+) -> AsyncIterator[Tuple[str, Any, Optional[Exception]]]:
+    """Run `worker` for every file concurrently and yield `(path, result, error)` as each one finishes.
+
+    A timed-out call stops being awaited, but its executor thread runs until the
+    blocking call returns.
+    """
+    semaphore = asyncio.Semaphore(concurrency or FILE_CONCURRENCY)
+    timeout = timeout or FILE_TIMEOUT_SECONDS
+
+    async def run(path: str, item: Any):
+        async with semaphore:
+            try:
+                return path, await asyncio.wait_for(worker(path, item), timeout), None
+            except Exception as e:
+                return path, None, e
+
+    tasks = [asyncio.create_task(run(path, item)) for path, item in items.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def works_per_file(generator) -> bool:
+    """Whether the generator can list the planned files and implement them one at a time."""
+    return hasattr(generator, "list_files") and hasattr(generator, "implement_file")
+
+async def file_error(queue: asyncio.Queue, stage: str, path: str, error: Exception):
+    await queue.put(f"data: {json.dumps({'status': 'file_error', 'stage': stage, 'path': path, 'message': str(error) or type(error).__name__})}\n\n")
+
+async def implement_files(generator, paper_content, plan, queue: asyncio.Queue, use_cache: bool = True) -> Dict[str, str]:
+    # Generators that can list the planned files and implement one at a time are
+    # fanned out per file; otherwise implementation stays a single call
+    if not works_per_file(generator):
+        return await run_stage("implement_code", (paper_content, plan), generator.implement_code, paper_content, plan, use_cache=use_cache)
+
+    paths = await run_stage("list_files", (plan,), generator.list_files, plan, use_cache=use_cache)
+
+    async def implement(path: str, _):
+        return await run_stage("implement_file", (paper_content, plan, path), generator.implement_file, paper_content, plan, path, use_cache=use_cache, executor=file_pool)
+
+    code_blocks = {}
+    async for path, content, error in map_files({path: None for path in paths}, implement):
+        if error:
+            await file_error(queue, 'implementing_code', path, error)
+            continue
+        code_blocks[path] = content
+        await queue.put(f"data: {json.dumps({'status': 'file_complete', 'stage': 'implementing_code', 'path': path})}\n\n")
+
+    return {path: code_blocks[path] for path in paths if path in code_blocks}
+
+async def improve_files(generator, code_blocks: Dict[str, str], analysis, queue: asyncio.Queue, use_cache: bool = True) -> Dict[str, str]:
+    async def improve(path: str, content: str):
+        return await run_stage("improve_code", ({path: content}, analysis), generator.improve_code, {path: content}, analysis, use_cache=use_cache, executor=file_pool)
+
+    improved = {}
+    files = {path: content for path, content in code_blocks.items() if content is not None}
+    async for path, result, error in map_files(files, improve):
+        if error:
+            # The implemented version is kept when a file cannot be improved in time
+            improved[path] = code_blocks[path]
+            await file_error(queue, 'improving_code', path, error)
+            await send_file(queue, path, improved[path])
+            continue
+        improved[path] = (result or {}).get(path, code_blocks[path])
+        for extra_path, extra_content in (result or {}).items():
+            if extra_path != path:
+                improved[extra_path] = extra_content
+                if extra_content is not None:
+                    await send_file(queue, extra_path, extra_content)
+        await send_file(queue, path, improved[path])
+
+    ordered = {path: improved.get(path, content) for path, content in code_blocks.items()}
+    ordered.update({path: content for path, content in improved.items() if path not in ordered})
+    return ordered
+
+async def dataflow_files(generator, contexts: Dict[str, str], plan, queue: asyncio.Queue, use_cache: bool = True) -> Dict[str, str]:
+    """Implement, analyze and improve every planned file as its own chain.
+
+    A file is analyzed and improved as soon as it is implemented, overlapping
+    the implementation of later files; at most DATAFLOW_MAX_IN_FLIGHT chains
+    run at once. Files that cannot be analyzed or improved keep their
+    implemented version.
+    """
+    paths = await run_stage("list_files", (plan,), generator.list_files, plan, use_cache=use_cache)
+    announced = set()
+
+    async def announce(status: str, message: str):
+        # Stages overlap, so each one is announced when its first file reaches it
+        if status not in announced:
+            announced.add(status)
+            await queue.put(f"data: {json.dumps({'status': status, 'message': message})}\n\n")
+
+    async def step(stage: str, key_inputs: tuple, func, *args):
+        return await asyncio.wait_for(
+            run_stage(stage, key_inputs, func, *args, use_cache=use_cache, executor=file_pool),
+            FILE_TIMEOUT_SECONDS
+        )
+
+    async def chain(path: str, _) -> Dict[str, Optional[str]]:
+        content = await step("implement_file", (contexts["implement_code"], plan, path), generator.implement_file, contexts["implement_code"], plan, path)
+        await queue.put(f"data: {json.dumps({'status': 'file_complete', 'stage': 'implementing_code', 'path': path})}\n\n")
+
+        files = {path: content}
+        stage = 'analyzing_code'
+        try:
+            await announce(stage, 'Analyzing files as they are implemented...')
+            analysis = await step("analyze_code", (contexts["analyze_code"], plan, files), generator.analyze_code, contexts["analyze_code"], plan, files)
+            stage = 'improving_code'
+            await announce(stage, 'Improving analyzed files...')
+            improved = await step("improve_code", (files, analysis), generator.improve_code, files, analysis) or {}
+        except Exception as e:
+            await file_error(queue, stage, path, e)
+            improved = {}
+
+        result = {path: improved.get(path, content)}
+        result.update({extra_path: extra for extra_path, extra in improved.items() if extra_path != path})
+        for result_path, result_content in result.items():
+            if result_content is not None:
+                await send_file(queue, result_path, result_content)
+        return result
+
+    # The outer timeout only backstops the per-step ones
+    results = {}
+    items = {path: None for path in paths}
+    async for path, result, error in map_files(items, chain, concurrency=DATAFLOW_MAX_IN_FLIGHT, timeout=3 * FILE_TIMEOUT_SECONDS):
+        if error:
+            await file_error(queue, 'implementing_code', path, error)
+            continue
+        results[path] = result
+
+    # Files keep the planned order, each followed by any files its improvement added
+    improved_blocks = {}
+    for path in paths:
+        improved_blocks.update(results.get(path, {}))
+    return improved_blocks
+
+async def report_stage(queue: asyncio.Queue, stage: str, started: float):
+    if SSE_STAGE_METRICS:
+        await queue.put(f"data: {json.dumps({'status': 'stage_metrics', 'stage': stage, 'seconds': round(time.perf_counter() - started, 3)})}\n\n")
+
+    # Model routing decisions made during the stage, then a stop if the run is over budget
+    budget = current_budget.get()
+    if budget:
+        for decision in budget.take_decisions():
+            await queue.put(f"data: {json.dumps({'status': 'model_route', **decision})}\n\n")
+        budget.check()
+
+PdfSource = Union[str, Callable[[], Awaitable[str]]]
+
+async def read_paper(generator, pdf_path: PdfSource, file_id: str) -> str:
+    # Extraction is deterministic, so the text is always reused for the same PDF hash and budget
+    if PDF_EXTRACTOR == "generator":
+        stage, key_inputs, func = "read_paper", (file_id,), generator.read_paper
+    else:
+        stage, key_inputs, func = "extract_text", (file_id, EXTRACTION_MAX_PAGES, EXTRACTION_MAX_TOKENS), extract_text
+
+    # A callable source is only awaited when the text is not checkpointed, so
+    # a rerun never downloads the PDF again
+    if callable(pdf_path):
+        hit, value = await load_checkpoint(stage, key_inputs)
+        if hit:
+            return value
+        pdf_path = await pdf_path()
+    return await run_stage(stage, key_inputs, func, pdf_path)
+
+async def paper_contexts(paper_content: str, use_cache: bool = True) -> Dict[str, str]:
+    """The paper text each LLM stage is prompted with, keyed by stage."""
+    if not PAPER_COMPACTION:
+        return {stage: paper_content for stage in STAGE_SECTIONS}
+    compact = await run_stage("compact_paper", (paper_content, COMPACTION_KEEP_APPENDIX), compact_paper, paper_content, use_cache=use_cache)
+    return {stage: stage_context(compact, stage) for stage in STAGE_SECTIONS}
+
+async def generate_progress_stream(generator, pdf_path: PdfSource, file_id: str, queue: asyncio.Queue, use_cache: bool = True, mode: str = PIPELINE_MODE):
+    try:
+        #await run_in_thread(generator.create_project_directory)
+        project_id = str(uuid.uuid4())
+        budget = start_run()
+
+        # Read paper
+        await queue.put(f"data: {json.dumps({'status': 'reading_paper', 'message': 'Reading PDF file...'})}\n\n")
+        started = time.perf_counter()
+        paper_content = await read_paper(generator, pdf_path, file_id)
+        contexts = await paper_contexts(paper_content, use_cache=use_cache)
+        await report_stage(queue, 'reading_paper', started)
+
+        # Generate plan
+        await queue.put(f"data: {json.dumps({'status': 'generating_plan', 'message': 'Generating implementation plan...'})}\n\n")
+        started = time.perf_counter()
+        plan = await run_stage("generate_plan", (contexts["generate_plan"],), generator.generate_plan, contexts["generate_plan"], use_cache=use_cache)
+        await report_stage(queue, 'generating_plan', started)
+
+        # Dataflow mode streams each file through implementation, analysis and
+        # improvement on its own; generators that cannot work per file run sequentially
+        dataflow = mode == "dataflow" and works_per_file(generator)
+
+        # Implement code
+        await queue.put(f"data: {json.dumps({'status': 'implementing_code', 'message': 'Implementing code...'})}\n\n")
+        started = time.perf_counter()
+        if dataflow:
+            improved_blocks = await dataflow_files(generator, contexts, plan, queue, use_cache=use_cache)
+            await report_stage(queue, 'dataflow', started)
+        else:
+            if mode == "parallel":
+                code_blocks = await implement_files(generator, contexts["implement_code"], plan, queue, use_cache=use_cache)
+            else:
+                code_blocks = await run_stage("implement_code", (contexts["implement_code"], plan), generator.implement_code, contexts["implement_code"], plan, use_cache=use_cache)
+            await report_stage(queue, 'implementing_code', started)
+
+            # Analyze code
+            await queue.put(f"data: {json.dumps({'status': 'analyzing_code', 'message': 'Analyzing code...'})}\n\n")
+            started = time.perf_counter()
+            analysis = await run_stage("analyze_code", (contexts["analyze_code"], plan, code_blocks), generator.analyze_code, contexts["analyze_code"], plan, code_blocks, use_cache=use_cache)
+            await report_stage(queue, 'analyzing_code', started)
+
+            # Improve code
+            await queue.put(f"data: {json.dumps({'status': 'improving_code', 'message': 'Improving code based on analysis...'})}\n\n")
+            started = time.perf_counter()
+            if mode == "parallel":
+                improved_blocks = await improve_files(generator, code_blocks, analysis, queue, use_cache=use_cache)
+            else:
+                improved_blocks = await run_stage("improve_code", (code_blocks, analysis), generator.improve_code, code_blocks, analysis, use_cache=use_cache)
+            await report_stage(queue, 'improving_code', started)
+
+        # Upload project archive
+        await queue.put(f"data: {json.dumps({'status': 'writing_files', 'message': 'Uploading project archive...'})}\n\n")
+        started = time.perf_counter()
+        download_url = await upload_project(project_id, improved_blocks)
+        await store_project_info(project_id, download_url, file_id)
+        await report_stage(queue, 'writing_files', started)
+
+        # Parallel and dataflow modes have already streamed every file as it was improved
+        if mode != "parallel" and not dataflow:
+            for path, content in improved_blocks.items():
+                if content is not None:
+                    await send_file(queue, path, content)
+
+        # Finish with a manifest instead of the file contents
+        await queue.put(complete_event(project_id, improved_blocks, usage=budget.usage()))
+        return project_id
+
+    except Exception as e:
+        await queue.put(f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n")
+        raise
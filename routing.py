@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from extraction import estimate_tokens
+from metrics import routed_calls
+
+# Routes replace the model, output cap and temperature the generator asked for, so they are
+# opt-in; without them calls are still counted against the run's budget
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "false").lower() == "true"
+ROUTING_SMALL_MODEL = os.getenv("ROUTING_SMALL_MODEL", "gpt-4o-mini")
+JOB_TOKEN_BUDGET = int(os.getenv("JOB_TOKEN_BUDGET", "0")) or None
+JOB_COST_BUDGET_USD = float(os.getenv("JOB_COST_BUDGET_USD", "0")) or None
+
+# Routes per stage, tried in order; the first whose `max_input_tokens` covers the
+# prompt applies. Settings a route leaves out keep what the generator asked for.
+DEFAULT_ROUTES: Dict[str, List[Dict[str, Any]]] = {
+    "generate_plan": [
+        {"max_input_tokens": 6000, "model": ROUTING_SMALL_MODEL, "max_tokens": 4000},
+        {"max_tokens": 8000}
+    ],
+    "list_files": [{"model": ROUTING_SMALL_MODEL, "max_tokens": 1000, "temperature": 0}],
+    "implement_code": [{"max_tokens": 16000}],
+    "implement_file": [
+        {"max_input_tokens": 4000, "model": ROUTING_SMALL_MODEL, "max_tokens": 4000},
+        {"max_tokens": 8000}
+    ],
+    "analyze_code": [{"model": ROUTING_SMALL_MODEL, "max_tokens": 4000, "temperature": 0}],
+    "improve_code": [{"max_tokens": 16000}]
+}
+MODEL_ROUTES: Dict[str, List[Dict[str, Any]]] = {**DEFAULT_ROUTES, **json.loads(os.getenv("MODEL_ROUTES", "{}"))}
+
+# USD per million input and output tokens
+DEFAULT_PRICES = {
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6)
+}
+MODEL_PRICES: Dict[str, Any] = {**DEFAULT_PRICES, **json.loads(os.getenv("MODEL_PRICES", "{}"))}
+
+# The pipeline stage making the current LLM call; set by run_stage around each call
+current_stage: ContextVar[Optional[str]] = ContextVar("current_stage", default=None)
+
+
+class BudgetExceededError(Exception):
+    pass
+
+
+def price(model: str, input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def route(stage: Optional[str], input_tokens: int, routes: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> Dict[str, Any]:
+    """Model settings for a call from `stage` with a prompt of about `input_tokens` tokens."""
+    routes = MODEL_ROUTES if routes is None else routes
+    for candidate in routes.get(stage or "", []):
+        limit = candidate.get("max_input_tokens")
+        if limit is None or input_tokens <= limit:
+            return {name: value for name, value in candidate.items() if name != "max_input_tokens"}
+    return {}
+
+
+class RunBudget:
+    """Tokens and cost spent by one pipeline run, and the routing decisions made for it.
+
+    Calls come from several stage threads at once, so updates take a lock.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = JOB_TOKEN_BUDGET, max_cost: Optional[float] = JOB_COST_BUDGET_USD):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.tokens = 0
+        self.cost = 0.0
+        self._decisions: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def check(self):
+        if self.max_tokens and self.tokens >= self.max_tokens:
+            raise BudgetExceededError(f"Token budget of {self.max_tokens} exceeded ({self.tokens} used)")
+        if self.max_cost and self.cost >= self.max_cost:
+            raise BudgetExceededError(f"Cost budget of ${self.max_cost:.2f} exceeded (${self.cost:.4f} used)")
+
+    def remaining_tokens(self) -> Optional[int]:
+        return None if not self.max_tokens else max(0, self.max_tokens - self.tokens)
+
+    def record(self, decision: Dict[str, Any], input_tokens: int, output_tokens: int):
+        with self._lock:
+            self.tokens += input_tokens + output_tokens
+            self.cost += price(decision.get("model") or "", input_tokens, output_tokens)
+            self._decisions.append(decision)
+
+    def take_decisions(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            decisions, self._decisions = self._decisions, []
+        return decisions
+
+    def usage(self) -> Dict[str, Any]:
+        return {"tokens": self.tokens, "cost_usd": round(self.cost, 6)}
+
+
+current_budget: ContextVar[Optional[RunBudget]] = ContextVar("current_budget", default=None)
+
+
+def start_run(max_tokens: Optional[int] = JOB_TOKEN_BUDGET, max_cost: Optional[float] = JOB_COST_BUDGET_USD) -> RunBudget:
+    """Give the current pipeline run, and every stage it starts, its own budget."""
+    budget = RunBudget(max_tokens, max_cost)
+    current_budget.set(budget)
+    return budget
+
+
+def _prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(estimate_tokens(message["content"] if isinstance(message.get("content"), str) else json.dumps(message.get("content"), default=str))
+               for message in messages)
+
+
+def _limit_name(params: Dict[str, Any]) -> str:
+    # Newer models take the output cap as max_completion_tokens; the caller's choice of name is kept
+    return "max_completion_tokens" if "max_completion_tokens" in params else "max_tokens"
+
+
+class RoutedCompletions:
+    def __init__(self, completions):
+        self._completions = completions
+
+    def prepare(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """The request as it is sent: routed by stage and prompt size, and capped by the run's budget.
+
+        Preparing a prepared request changes nothing, so the response cache in
+        front of this client keys on the final request and then passes it on.
+        """
+        budget = current_budget.get()
+        if budget:
+            budget.check()
+
+        params = dict(params)
+        input_tokens = _prompt_tokens(params.get("messages") or [])
+        settings = route(current_stage.get(), input_tokens) if MODEL_ROUTING else {}
+        limit_name = _limit_name(params)
+        if "max_tokens" in settings:
+            settings[limit_name] = settings.pop("max_tokens")
+        params.update(settings)
+
+        # The answer is capped by what is left of the run's token budget
+        remaining = budget.remaining_tokens() if budget else None
+        if remaining is not None:
+            if remaining <= input_tokens:
+                raise BudgetExceededError(f"Token budget of {budget.max_tokens} exceeded ({budget.tokens} used, {input_tokens} more needed)")
+            allowed = remaining - input_tokens
+            params[limit_name] = min(params.get(limit_name) or allowed, allowed)
+        return params
+
+    def create(self, **params):
+        stage = current_stage.get()
+        budget = current_budget.get()
+        params = self.prepare(params)
+        limit_name = _limit_name(params)
+
+        response = self._completions.create(**params)
+
+        usage = getattr(response, "usage", None)
+        if usage is not None and not params.get("stream"):
+            input_tokens, output_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            input_tokens, output_tokens = _prompt_tokens(params.get("messages") or []), 0
+        decision = {
+            "stage": stage,
+            "model": params.get("model"),
+            "max_tokens": params.get(limit_name),
+            "temperature": params.get("temperature"),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens
+        }
+        routed_calls.inc(stage=stage or "unknown", model=decision["model"] or "unknown")
+        if budget:
+            budget.record(decision, input_tokens, output_tokens)
+        return response
+
+
+class _RoutedChat:
+    def __init__(self, chat):
+        self._chat = chat
+        self.completions = RoutedCompletions(chat.completions)
+
+    def __getattr__(self, name: str):
+        return getattr(self._chat, name)
+
+
+class RoutedClient:
+    """OpenAI-compatible client that picks each call's model settings from its stage and prompt size."""
+
+    def __init__(self, client):
+        self._client = client
+        self.chat = _RoutedChat(client.chat)
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+def install(generator):
+    """Route the generator's OpenAI calls by stage, when MODEL_ROUTING is on, and charge them to the run's budget.
+
+    Installed before the response cache, which then wraps it: the cache keys on
+    the request as prepared here, and hits never reach the routed client, so
+    they are neither charged nor reported as routed.
+    """
+    client = getattr(generator, "client", None)
+    if client is not None and hasattr(client, "chat") and not isinstance(client, RoutedClient):
+        generator.client = RoutedClient(client)
+    return generator
@@ -0,0 +1,157 @@
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+PRIORITIES = ("interactive", "batch")
+DEFAULT_TENANT = "anonymous"
+TENANT_MAX_CONCURRENCY = int(os.getenv("TENANT_MAX_CONCURRENCY", "0")) or None
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+# Who the current pipeline run works for; set once per run and inherited by every task it starts
+current_client: ContextVar[Tuple[str, str, Optional[PositionCallback]]] = ContextVar(
+    "current_client", default=(DEFAULT_TENANT, "interactive", None)
+)
+
+
+def set_client(tenant: Optional[str], priority: str = "interactive", on_wait: Optional[PositionCallback] = None):
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    current_client.set((tenant or DEFAULT_TENANT, priority, on_wait))
+
+
+class Waiter:
+    def __init__(self, tenant: str, priority: str):
+        self.tenant = tenant
+        self.priority = priority
+        self.granted = asyncio.get_running_loop().create_future()
+        self.moved = asyncio.Event()
+
+
+class FairScheduler:
+    """Hands out `slots` concurrent slots across tenants.
+
+    Interactive waiters always go before batch ones. Within a priority class
+    the next slot goes to the tenant holding the fewest slots, and among those
+    to the one served longest ago, so one tenant's backlog cannot delay others
+    by more than a turn. No tenant holds more than `tenant_limit` slots at once.
+    """
+
+    def __init__(self, slots: int, tenant_limit: Optional[int] = TENANT_MAX_CONCURRENCY):
+        self.slots = slots
+        self.tenant_limit = tenant_limit
+        self.active = 0
+        self._running: Dict[str, int] = {}
+        self._served: Dict[str, int] = {}
+        self._grants = 0
+        self._queues: Dict[str, Dict[str, Deque[Waiter]]] = {priority: {} for priority in PRIORITIES}
+
+    def waiting(self, priority: Optional[str] = None) -> int:
+        priorities = [priority] if priority else PRIORITIES
+        return sum(len(queue) for name in priorities for queue in self._queues[name].values())
+
+    def _turn_order(self, tenants) -> list:
+        return sorted(tenants, key=lambda tenant: (self._running.get(tenant, 0), self._served.get(tenant, 0)))
+
+    def position(self, waiter: Waiter) -> int:
+        """How many waiters are served before `waiter`, ignoring tenant caps."""
+        ahead = sum(self.waiting(priority) for priority in PRIORITIES[:PRIORITIES.index(waiter.priority)])
+        tenants = self._queues[waiter.priority]
+        queue = tenants.get(waiter.tenant)
+        if queue is None or waiter not in queue:
+            return ahead
+        index = queue.index(waiter)
+
+        # Tenants take turns: each one ahead in the order gets index + 1 turns first, the rest index
+        ahead += index
+        before = True
+        for tenant in self._turn_order(tenants):
+            if tenant == waiter.tenant:
+                before = False
+                continue
+            ahead += min(len(tenants[tenant]), index + 1 if before else index)
+        return ahead
+
+    def _next(self) -> Optional[Waiter]:
+        for priority in PRIORITIES:
+            tenants = self._queues[priority]
+            for tenant in self._turn_order(tenants):
+                if self.tenant_limit and self._running.get(tenant, 0) >= self.tenant_limit:
+                    continue
+                queue = tenants[tenant]
+                waiter = queue.popleft()
+                if not queue:
+                    del tenants[tenant]
+                return waiter
+        return None
+
+    def _dispatch(self):
+        while self.active < self.slots:
+            waiter = self._next()
+            if waiter is None:
+                break
+            self.active += 1
+            self._grants += 1
+            self._running[waiter.tenant] = self._running.get(waiter.tenant, 0) + 1
+            self._served[waiter.tenant] = self._grants
+            waiter.granted.set_result(None)
+        for tenants in self._queues.values():
+            for queue in tenants.values():
+                for waiter in queue:
+                    waiter.moved.set()
+
+    def _release(self, tenant: str):
+        self.active -= 1
+        self._running[tenant] -= 1
+        if not self._running[tenant]:
+            del self._running[tenant]
+            if not any(tenant in tenants for tenants in self._queues.values()):
+                self._served.pop(tenant, None)
+        self._dispatch()
+
+    def _remove(self, waiter: Waiter):
+        tenants = self._queues[waiter.priority]
+        queue = tenants.get(waiter.tenant)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del tenants[waiter.tenant]
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tenant: Optional[str] = None, priority: Optional[str] = None, on_wait: Optional[PositionCallback] = None):
+        """Hold one slot for the body of the block; the caller's identity defaults to `current_client`."""
+        client_tenant, client_priority, client_on_wait = current_client.get()
+        waiter = Waiter(tenant or client_tenant, priority or client_priority)
+        on_wait = on_wait or client_on_wait
+
+        self._queues[waiter.priority].setdefault(waiter.tenant, deque()).append(waiter)
+        self._dispatch()
+        try:
+            reported = None
+            while not waiter.granted.done():
+                waiter.moved.clear()
+                position = self.position(waiter)
+                if on_wait and position != reported:
+                    reported = position
+                    await on_wait(position)
+                moved = asyncio.ensure_future(waiter.moved.wait())
+                try:
+                    await asyncio.wait([waiter.granted, moved], return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    moved.cancel()
+        except BaseException:
+            if waiter.granted.done():
+                self._release(waiter.tenant)
+            else:
+                waiter.granted.cancel()
+                self._remove(waiter)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(waiter.tenant)
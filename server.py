@@ -1,38 +1,125 @@
-from io import BytesIO
-from typing import Union, Dict, Optional
+from typing import TYPE_CHECKING, AsyncIterator, Union, Dict, List, Optional, Tuple
 import uuid
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-import httpx
 from pydantic import BaseModel, HttpUrl
 import tempfile
 import os
 import sys
-import aiohttp
 import json
 import asyncio
+import hashlib
+import importlib
+import ipaddress
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
 
 # Add the current directory to Python path to ensure brss_paper_to_code is found
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from brss_paper_to_code.src.main import ProjectGenerator
+if TYPE_CHECKING:
+    from brss_paper_to_code.src.main import ProjectGenerator
 import tempfile
 from dotenv import load_dotenv
 from db import (
-    upload_pdf, 
+    upload_pdf_stream,
     get_project_download_url, 
-    store_project_info,
-    upload_project,
-    get_pdf_url
+    iter_pdf,
+    iter_project_archive,
+    close_storage,
+    get_storage,
+    SchemaError,
+    sweep_expired_projects,
+    sweep_expired_pdfs,
+    pdf_exists,
+    touch_pdf,
+    get_cached_project
 )
+from jobs import JobQueue, JobEventSink, QueueFullError, BatchTooLargeError, JOBS_DB_PATH
+from pipeline import (
+    generate_progress_stream,
+    run_in_thread,
+    file_events,
+    complete_event,
+    PIPELINE_MODE,
+    PIPELINE_MODES
+)
+from archive import read_zip, ZipStream
+from extraction import shutdown_pool as shutdown_extraction
+from metrics import registry as metrics_registry, active_streams, active_runs, storage_seconds, pdf_cache_lookups
+from cache import BlobCache, TTLCache, MISSING
+from scheduler import set_client, PRIORITIES
+from workspace import JobWorkspace, DiskQuotaError, sweep_workspaces
+from http_client import iter_url, close_client as close_http_client, FetchError, ResponseTooLargeError
+from llm_cache import install as install_llm_cache
+from routing import install as install_routing
+from broadcast import BroadcastHub, RunLog, TRANSIENT_STATUSES
 
 load_dotenv()
 
-app = FastAPI()
+# Modules the first generation needs; importing them at startup would delay every cold start
+WARMUP_MODULES = ("brss_paper_to_code.src.main", "PyPDF2", "httpx", "supabase", "openai")
+
+async def warm_up():
+    """Import the pipeline's heavy dependencies and open the storage client ahead of the first request."""
+    for name in WARMUP_MODULES:
+        try:
+            await asyncio.to_thread(importlib.import_module, name)
+        except ImportError as e:
+            print(f"Error warming up {name}: {e}")
+    try:
+        await get_storage().warm_up()
+    except Exception as e:
+        print(f"Error warming up storage: {e}")
+
+async def sweep_expired():
+    """Delete expired projects, expired PDFs and their local copies every EXPIRY_SWEEP_SECONDS."""
+    while True:
+        try:
+            result = await sweep_expired_projects()
+            for project_id in result["projects"]:
+                project_urls.pop(project_id)
+                await asyncio.to_thread(archive_cache.delete, project_id)
+
+            # PDFs that a run in progress or a waiting job still has to read are kept
+            keep = {key[0] for key in runs.runs} | set(await job_queue.active_file_ids())
+            result = await sweep_expired_pdfs(keep_file_ids=keep)
+            for file_id in result["pdfs"]:
+                await asyncio.to_thread(pdf_cache.delete, file_id)
+        except Exception as e:
+            print(f"Error in expiry sweeper: {e}")
+        await asyncio.sleep(EXPIRY_SWEEP_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Without the expiry migration every generation would fail, so the server does not start
+    try:
+        await get_storage().check_schema()
+    except SchemaError:
+        raise
+    except Exception as e:
+        print(f"Error checking storage schema: {e}")
+    await asyncio.to_thread(sweep_workspaces)
+    await job_queue.start()
+    # Warm-up runs behind the first requests instead of holding back readiness
+    if STARTUP_WARMUP:
+        spawn(warm_up())
+    sweeper = asyncio.create_task(sweep_expired()) if EXPIRY_SWEEP_SECONDS > 0 else None
+    try:
+        yield
+    finally:
+        if sweeper:
+            sweeper.cancel()
+        await job_queue.stop()
+        await runs.close()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await close_storage()
+        await close_http_client()
+        shutdown_extraction()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -49,105 +136,258 @@ app.add_middleware(
     allowed_hosts=["*"]  # Allows all hosts
 )
 
-thread_pool = ThreadPoolExecutor(max_workers=4)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "false").lower() == "true"
+EXPIRY_SWEEP_SECONDS = float(os.getenv("EXPIRY_SWEEP_SECONDS", "3600"))
+DOWNLOAD_CACHE_DIR = os.getenv("DOWNLOAD_CACHE_DIR", os.path.join(tempfile.gettempdir(), "brss_downloads"))
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+PROJECT_LOOKUP_TTL_SECONDS = float(os.getenv("PROJECT_LOOKUP_TTL_SECONDS", "300"))
+
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "brss_pdfs"))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Comma-separated addresses or networks of the proxies that authenticate clients
+# and set X-Tenant-ID; from anywhere else the header is ignored
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip(), strict=False)
+    for proxy in os.getenv("TRUSTED_PROXIES", "").split(",") if proxy.strip()
+]
+
+archive_cache = BlobCache(DOWNLOAD_CACHE_DIR, DOWNLOAD_CACHE_MAX_BYTES)
+pdf_cache = BlobCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+
+# Strong references to fire-and-forget tasks, which asyncio would otherwise let be collected mid-run
+background_tasks = set()
+
+def spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+project_urls = TTLCache(PROJECT_LOOKUP_TTL_SECONDS)
 
 async def send_heartbeat(queue: asyncio.Queue):
     while True:
         await asyncio.sleep(20)
         await queue.put(f"data: {json.dumps({'status': 'heartbeat', 'message': 'Still processing...', 'timestamp': datetime.now().isoformat()})}\n\n")
 
-async def run_in_thread(func, *args):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(thread_pool, func, *args)
+async def cached_project_stream(project: Dict[str, str]):
+    # The archive of a finished run for the same PDF is reused instead of running the pipeline again
+    yield f"data: {json.dumps({'status': 'loading_cached', 'message': 'Loading previously generated project...'})}\n\n"
+    try:
+        archive = b"".join([chunk async for chunk in iter_project_archive(project['id'])])
 
-async def write_files(improved_blocks: Dict[str, str], temp_dir: str):
-    for file_path, content in improved_blocks.items():
-        full_path = os.path.join(temp_dir, file_path)
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        files = await run_in_thread(read_zip, archive)
+        for path, content in files.items():
+            for event in file_events(path, content):
+                yield event
+        yield complete_event(project['id'], files, cached=True)
+    except Exception as e:
+        yield f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n"
 
-        if content is None and file_path.endswith('/'):
-            os.makedirs(full_path, exist_ok=True)
-            continue
-        
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+async def pdf_available(file_id: str) -> bool:
+    """Whether a run for `file_id` can get its PDF, from the local cache or storage."""
+    return bool(await asyncio.to_thread(pdf_cache.lookup, file_id)) or await pdf_exists(file_id)
 
-async def generate_progress_stream(generator: ProjectGenerator, temp_file_path: str, queue: asyncio.Queue):
+async def fetch_pdf(workspace: JobWorkspace, file_id: str) -> str:
+    # Recently uploaded PDFs are linked in from the local staging cache; the
+    # job's own link keeps the file readable if the cache evicts it meanwhile
+    cached_path = await asyncio.to_thread(pdf_cache.lookup, file_id)
+    if cached_path:
+        try:
+            path = await workspace.link_file(f"{file_id}.pdf", cached_path)
+            pdf_cache_lookups.inc(result="hit")
+            return path
+        except FileNotFoundError:
+            pass
+    pdf_cache_lookups.inc(result="miss")
+    
+    # Otherwise stream the PDF from storage into the job's workspace
+    with storage_seconds.time(operation="download_pdf"):
+        try:
+            path = await workspace.write_stream(f"{file_id}.pdf", iter_pdf(file_id))
+        except DiskQuotaError:
+            raise
+        except Exception as e:
+            raise RuntimeError("Failed to download PDF from storage") from e
+    
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            #await run_in_thread(generator.create_project_directory)
-            project_id = str(uuid.uuid4())
+        await asyncio.to_thread(pdf_cache.add_file, file_id, path)
+    except OSError as e:
+        print(f"Error caching PDF: {e}")
+    return path
 
-            # Read paper
-            await queue.put(f"data: {json.dumps({'status': 'reading_paper', 'message': 'Reading PDF file...'})}\n\n")
-            paper_content = await run_in_thread(generator.read_paper, temp_file_path)
-            
-            # Generate plan
-            await queue.put(f"data: {json.dumps({'status': 'generating_plan', 'message': 'Generating implementation plan...'})}\n\n")
-            plan = await run_in_thread(generator.generate_plan, paper_content)
-            
-            # Implement code
-            await queue.put(f"data: {json.dumps({'status': 'implementing_code', 'message': 'Implementing code...'})}\n\n")
-            code_blocks = await run_in_thread(generator.implement_code, paper_content, plan)
-            
-            # Analyze code
-            await queue.put(f"data: {json.dumps({'status': 'analyzing_code', 'message': 'Analyzing code...'})}\n\n")
-            analysis = await run_in_thread(generator.analyze_code, paper_content, plan, code_blocks)
-            
-            # Improve code
-            await queue.put(f"data: {json.dumps({'status': 'improving_code', 'message': 'Improving code based on analysis...'})}\n\n")
-            improved_blocks = await run_in_thread(generator.improve_code, code_blocks, analysis)
-            
-            # Write files
-            await queue.put(f"data: {json.dumps({'status': 'writing_files', 'message': 'Writing files...'})}\n\n")
-            await write_files(improved_blocks, temp_dir)
-            
-            download_url = await upload_project(project_id, temp_dir)
-            await store_project_info(project_id, download_url)
-            
-            # Send final result with file contents
-            await queue.put(f"data: {json.dumps({'status': 'complete', 'message': 'Code generation complete', 'project_id': project_id, 'files': improved_blocks})}\n\n")
-        
-    except Exception as e:
-        await queue.put(f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n")
-        raise
+def new_generator(use_cache: bool = True) -> "ProjectGenerator":
+    # The generator module (OpenAI SDK, PyPDF2) is only imported once a run needs it.
+    # Runs that may reuse earlier results also answer repeated LLM requests from the response cache.
+    # Routing sits behind the cache, which keys on the routed request; only requests that reach the API are charged
+    from brss_paper_to_code.src.main import ProjectGenerator
 
-async def stream_generator(generator: ProjectGenerator, temp_file_path: str):
-    queue = asyncio.Queue()
-    
-    # Start heartbeat task
-    heartbeat_task = asyncio.create_task(send_heartbeat(queue))
+    generator = install_routing(ProjectGenerator())
+    if use_cache:
+        install_llm_cache(generator)
+    return generator
+
+async def run_pipeline(
+    generator: "ProjectGenerator",
+    file_id: str,
+    queue,
+    use_cache: bool = True,
+    mode: str = PIPELINE_MODE,
+    workspace: Optional[JobWorkspace] = None,
+    pdf_path: Optional[str] = None,
+    tenant: Optional[str] = None,
+    priority: str = "interactive",
+    report_position: bool = True
+) -> str:
+    # Every stage this run starts is scheduled as this tenant and priority, and
+    # reports its place in line while it waits for a slot
+    async def on_wait(position: int):
+        await queue.put(f"data: {json.dumps({'status': 'queued', 'message': 'Waiting for a free worker...', 'position': position})}\n\n")
+    set_client(tenant, priority, on_wait if report_position else None)
     
+    # The PDF is only fetched if the paper text is not checkpointed, and it lives
+    # exactly as long as the pipeline run that reads it. Using it keeps the stored copy
+    workspace = workspace or JobWorkspace()
+    spawn(touch_pdf(file_id))
     try:
-        # Start progress stream
-        progress_task = asyncio.create_task(generate_progress_stream(generator, temp_file_path, queue))
-        
-        # Yield events from the queue
-        while True:
-            try:
-                event = await queue.get()
-                yield event
-                
-                # If we get a complete or error event, we're done
-                if '"status":"complete"' in event or '"status":"error"' in event:
-                    break
-                    
-            except asyncio.CancelledError:
-                break
-                
+        return await generate_progress_stream(generator, pdf_path or (lambda: fetch_pdf(workspace, file_id)), file_id, queue, use_cache, mode)
     finally:
-        # Clean up tasks
-        heartbeat_task.cancel()
-        try:
-            await heartbeat_task
-        except asyncio.CancelledError:
-            pass
+        await workspace.close()
 
-@app.post("/upload")
-async def upload(
-    file: Optional[UploadFile] = File(None),
-    pdf_url: Optional[str] = Form(None)
-):
+async def receive_job_pdf(job: Dict, workspace: JobWorkspace) -> Tuple[str, str]:
+    # Batch items given as a URL are downloaded and stored when the job runs, not when it is submitted
+    file_hash = hashlib.sha256()
+    pdf_path = await workspace.write_stream("paper.pdf", hash_chunks(iter_pdf_url(job["pdf_url"]), file_hash, MAX_UPLOAD_BYTES))
+    file_id = file_hash.hexdigest()
+    spawn(store_received_pdf(workspace.share(), file_id, pdf_path))
+    await job_queue.set_file_id(job["id"], file_id)
+    return file_id, pdf_path
+
+async def run_generation_job(job: Dict, queue: JobEventSink) -> Dict:
+    file_id = job["file_id"]
+    workspace = JobWorkspace()
+    pdf_path = None
+    pipeline_started = False
+    try:
+        if job.get("pdf_url"):
+            file_id, pdf_path = await receive_job_pdf(job, workspace)
+
+        # Two URLs in a batch can point at the same PDF; the later item reuses the earlier one's result
+        if job.get("batch_id"):
+            earlier = await job_queue.find_earlier_duplicate(job, file_id)
+            if earlier:
+                done = await job_queue.wait_finished(earlier["id"])
+                if done["status"] == "error":
+                    raise RuntimeError(done["error"])
+                return {**done["result"], "duplicate_of": earlier["id"]}
+
+        cached_project = await get_cached_project(file_id)
+        if cached_project:
+            async for event in cached_project_stream(cached_project):
+                await queue.put(event)
+            return {"project_id": cached_project["id"], "cached": True}
+
+        # Queued jobs already report their position through the job itself; the run owns the workspace from here
+        pipeline_started = True
+        project_id = await run_pipeline(
+            new_generator(), file_id, queue,
+            workspace=workspace, pdf_path=pdf_path, tenant=job.get("tenant"), priority="batch", report_position=False
+        )
+        return {"project_id": project_id, "cached": False}
+    finally:
+        if not pipeline_started:
+            await workspace.close()
+
+job_queue = JobQueue(JOBS_DB_PATH, run_generation_job)
+
+# Generation runs in progress, shared by every stream for the same paper and options,
+# with the events of recent ones kept for clients that reconnect after they finished
+runs = BroadcastHub(log=RunLog())
+active_runs.set_function(lambda: len(runs.runs))
+
+async def stream_generator(file_id: str, use_cache: bool = True, mode: str = PIPELINE_MODE, after: int = 0, **pipeline_args):
+    """Events of the run for this paper after id `after`, joining the one in progress if there is one.
+
+    The run numbers its events, so every subscriber sees the same ids. The run
+    and its heartbeat are shared, and the run is cancelled once every
+    subscriber has been gone for RUN_IDLE_SECONDS. A new run starts from its
+    first event whatever `after` was.
+    """
+    def start(run):
+        return run_pipeline(new_generator(use_cache), file_id, run, use_cache, mode, **pipeline_args)
+
+    run, started = runs.attach((file_id, mode, use_cache), start, heartbeat=send_heartbeat)
+    # A joining request's own upload is not needed; the PDF was stored when it was received
+    if not started and pipeline_args.get("workspace"):
+        await pipeline_args["workspace"].close()
+
+    async for event in run.subscribe(0 if started else after):
+        yield event
+
+async def replay_events(events: List[str]) -> AsyncIterator[str]:
+    for event in events:
+        yield event
+
+def event_status(event: str) -> Optional[str]:
+    return json.loads(event[len("data: "):]).get('status')
+
+def trusted_proxy(host: Optional[str]) -> bool:
+    try:
+        address = ipaddress.ip_address(host or "")
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+def client_tenant(request: Request, tenant: Optional[str]) -> str:
+    # Anyone can send X-Tenant-ID, so it only counts when a trusted proxy set it
+    host = request.client.host if request.client else None
+    if tenant and trusted_proxy(host):
+        return tenant
+    return host or "anonymous"
+
+def check_run_options(mode: str, priority: str):
+    if mode not in PIPELINE_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown pipeline mode: {mode}")
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority: {priority}")
+
+async def number_events(events: AsyncIterator[str]) -> AsyncIterator[str]:
+    # Run events arrive with the ids their run gave them. Other streams, such as
+    # cached project replays, are numbered here from 1 and always sent whole,
+    # so a client that resumes into one gets every event again
+    seq = 0
+    active_streams.inc()
+    try:
+        async for event in events:
+            if not event.startswith("id: ") and event_status(event) not in TRANSIENT_STATUSES:
+                seq += 1
+                event = f"id: {seq}\n{event}"
+            yield event
+    finally:
+        active_streams.dec()
+
+async def iter_upload_file(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+async def iter_pdf_url(pdf_url: str) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in iter_url(pdf_url, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE):
+            yield chunk
+    except ResponseTooLargeError:
+        raise HTTPException(status_code=413, detail=f"PDF exceeds the {MAX_UPLOAD_BYTES} byte limit")
+    except FetchError:
+        raise HTTPException(status_code=400, detail="Failed to download PDF from URL")
+
+async def copy_chunks(chunks: AsyncIterator[bytes], f) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        await asyncio.to_thread(f.write, chunk)
+        yield chunk
+
+def pdf_chunks(file: Optional[UploadFile], pdf_url: Optional[str]) -> AsyncIterator[bytes]:
     # Check if we have a valid file upload
     has_file = file is not None and file.filename and file.filename.endswith('.pdf')
     
@@ -160,102 +400,370 @@ async def upload(
     if has_file and has_url:
         raise HTTPException(status_code=400, detail="Cannot provide both file upload and PDF URL")
     
+    return iter_upload_file(file) if has_file else iter_pdf_url(pdf_url)
+
+async def iter_local_file(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    f = await asyncio.to_thread(open, path, 'rb')
     try:
-        file_id = str(uuid.uuid4())
-        
-        # Create a temporary file to store the PDF
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            if has_file:
-                content = await file.read()
-                temp_file.write(content)
-            elif has_url:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(pdf_url) as response:
-                        if response.status != 200:
-                            raise HTTPException(status_code=400, detail="Failed to download PDF from URL")
-                        content = await response.read()
-                        temp_file.write(content)
-            
-            temp_file_path = temp_file.name
-        
+        while chunk := await asyncio.to_thread(f.read, chunk_size):
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
+async def hash_chunks(chunks: AsyncIterator[bytes], file_hash, max_bytes: int) -> AsyncIterator[bytes]:
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"PDF exceeds the {max_bytes} byte limit")
+        file_hash.update(chunk)
+        yield chunk
+
+@app.post("/upload")
+async def upload(
+    file: Optional[UploadFile] = File(None),
+    pdf_url: Optional[str] = Form(None),
+    sha256: Optional[str] = Form(None)
+):
+    chunks = pdf_chunks(file, pdf_url)
+    
+    try:
+        # The PDF is hashed into a local file first, so a paper that is already
+        # stored is never sent to storage again. The local copy is kept so
+        # /generate does not have to download it either
+        file_hash = hashlib.sha256()
+        temp_path, f = await asyncio.to_thread(pdf_cache.open_temp, str(uuid.uuid4()))
         try:
-            # Upload to Supabase storage using file path
-            await upload_pdf(file_id, temp_file_path)
-            
-            return {"file_id": file_id, "message": "PDF uploaded successfully"}
+            try:
+                async for _ in copy_chunks(hash_chunks(chunks, file_hash, MAX_UPLOAD_BYTES), f):
+                    pass
+            finally:
+                await asyncio.to_thread(f.close)
+            file_id = file_hash.hexdigest()
+            # A client-supplied hash is only a check on what arrived
+            if sha256 and sha256.lower() != file_id:
+                raise HTTPException(status_code=400, detail="sha256 does not match the uploaded PDF")
             
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
+            duplicate = await pdf_exists(file_id)
+            if not duplicate:
+                try:
+                    await upload_pdf_stream(file_id, iter_local_file(temp_path))
+                except Exception:
+                    # Another upload of the same paper may have stored it first
+                    if not await pdf_exists(file_id):
+                        raise
+                    duplicate = True
+        except BaseException:
+            await asyncio.to_thread(pdf_cache.discard, temp_path)
+            raise
+        await asyncio.to_thread(pdf_cache.commit, file_id, temp_path)
+        await touch_pdf(file_id)
+        
+        if duplicate:
+            return {"file_id": file_id, "message": "PDF already uploaded", "duplicate": True}
+        return {"file_id": file_id, "message": "PDF uploaded successfully", "duplicate": False}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/generate/{file_id}")
-async def generate_code(file_id: str):
-    temp_file_path = None
+async def generate_code(
+    request: Request,
+    file_id: str,
+    use_cache: bool = True,
+    mode: str = PIPELINE_MODE,
+    priority: str = "interactive",
+    last_event_id: Optional[int] = Header(None),
+    x_tenant_id: Optional[str] = Header(None)
+):
+    check_run_options(mode, priority)
+    key = (file_id, mode, use_cache)
+    
     try:
-        # Get PDF from Supabase storage
-        pdf_url = await get_pdf_url(file_id)
-        pdf_content = None
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(pdf_url) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=400, detail="Failed to download PDF from URL")
-                pdf_content = await response.read()
+        # A client resuming a run that has finished since gets the rest of that run's events
+        if last_event_id:
+            events = await runs.finished_events(key, last_event_id)
+            if events is not None:
+                return StreamingResponse(number_events(replay_events(events)), media_type="text/event-stream")
         
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(pdf_content)
-            temp_file_path = temp_file.name
+        if use_cache:
+            cached_project = await get_cached_project(file_id)
+            if cached_project:
+                return StreamingResponse(
+                    number_events(cached_project_stream(cached_project)),
+                    media_type="text/event-stream"
+                )
         
-        # Initialize the project generator
-        generator = ProjectGenerator()
+        # A run already in progress for this paper is joined rather than started again
+        if key not in runs.runs and not await pdf_available(file_id):
+            raise HTTPException(status_code=404, detail="PDF not found")
         
-        # Create a background task to clean up the file after streaming is complete
-        async def cleanup_file():
-            try:
-                await asyncio.sleep(1)  # Give a small delay to ensure file is not being read
-                if temp_file_path and os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
-            except Exception as e:
-                print(f"Error cleaning up file: {e}")
-        
-        # Start cleanup task
-        asyncio.create_task(cleanup_file())
-        
-        # Return streaming response
         return StreamingResponse(
-            stream_generator(generator, temp_file_path),
+            number_events(stream_generator(file_id, use_cache, mode, last_event_id or 0, tenant=client_tenant(request, x_tenant_id), priority=priority)),
             media_type="text/event-stream"
         )
             
+    except HTTPException:
+        raise
     except Exception as e:
-        if 'generator' in locals():
-            generator.cleanup()
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def store_received_pdf(workspace: JobWorkspace, file_id: str, pdf_path: str):
+    # Runs alongside the pipeline; holding the workspace keeps the PDF on disk until it is stored
+    try:
+        await asyncio.to_thread(pdf_cache.add_file, file_id, pdf_path)
+        if not await pdf_exists(file_id):
+            await upload_pdf_stream(file_id, iter_local_file(pdf_path))
+        await touch_pdf(file_id)
+    except Exception as e:
+        print(f"Error storing uploaded PDF: {e}")
+    finally:
+        await workspace.close()
+
+async def prepend_event(event: str, events: AsyncIterator[str]) -> AsyncIterator[str]:
+    yield event
+    async for event in events:
+        yield event
+
+@app.post("/generate")
+async def upload_and_generate(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    pdf_url: Optional[str] = Form(None),
+    use_cache: bool = Form(True),
+    mode: str = Form(PIPELINE_MODE),
+    priority: str = Form("interactive"),
+    x_tenant_id: Optional[str] = Header(None)
+):
+    """Take a PDF or URL and stream generation progress on the same connection.
+
+    The pipeline reads the PDF from local disk while it is stored in the
+    background. The first event carries the file_id, so a dropped client can
+    resume with GET /generate/{file_id}.
+    """
+    check_run_options(mode, priority)
+    chunks = pdf_chunks(file, pdf_url)
+    
+    workspace = JobWorkspace()
+    try:
+        file_hash = hashlib.sha256()
+        pdf_path = await workspace.write_stream("paper.pdf", hash_chunks(chunks, file_hash, MAX_UPLOAD_BYTES))
+        file_id = file_hash.hexdigest()
+        spawn(store_received_pdf(workspace.share(), file_id, pdf_path))
+        
+        uploaded = f"data: {json.dumps({'status': 'uploaded', 'file_id': file_id})}\n\n"
+        cached_project = await get_cached_project(file_id) if use_cache else None
+        if cached_project:
+            await workspace.close()
+            events = cached_project_stream(cached_project)
+        else:
+            events = stream_generator(
+                file_id, use_cache, mode,
+                workspace=workspace, pdf_path=pdf_path, tenant=client_tenant(request, x_tenant_id), priority=priority
+            )
+    except HTTPException:
+        await workspace.close()
+        raise
+    except DiskQuotaError as e:
+        await workspace.close()
+        raise HTTPException(status_code=507, detail=str(e))
+    except Exception as e:
+        await workspace.close()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # The upload event is not numbered, so ids line up with a resumed GET /generate/{file_id}
+    return StreamingResponse(prepend_event(uploaded, number_events(events)), media_type="text/event-stream")
+
+class JobRequest(BaseModel):
+    file_id: str
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: JobRequest, http_request: Request, x_tenant_id: Optional[str] = Header(None)):
+    if not await pdf_available(request.file_id):
+        raise HTTPException(status_code=404, detail="PDF not found")
+    try:
+        job = await job_queue.submit(request.file_id, tenant=client_tenant(http_request, x_tenant_id))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return {"job_id": job["id"], "status": job["status"], "position": job.get("position")}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, after: int = 0, last_event_id: Optional[int] = Header(None)):
+    if not await job_queue.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    # Reconnecting EventSource clients send the id of the last event they received
+    if last_event_id is not None:
+        after = max(after, last_event_id)
+    
+    return StreamingResponse(
+        job_queue.stream_events(job_id, after),
+        media_type="text/event-stream"
+    )
+
+class BatchItem(BaseModel):
+    file_id: Optional[str] = None
+    pdf_url: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+
+@app.post("/batches", status_code=202)
+async def create_batch(request: BatchRequest, http_request: Request, x_tenant_id: Optional[str] = Header(None)):
+    if not request.items:
+        raise HTTPException(status_code=400, detail="A batch needs at least one item")
+    for index, item in enumerate(request.items):
+        if bool(item.file_id) == bool(item.pdf_url and item.pdf_url.strip()):
+            raise HTTPException(status_code=400, detail=f"Item {index} needs exactly one of file_id or pdf_url")
+    
+    items = [{"file_id": item.file_id.lower() if item.file_id else None, "pdf_url": item.pdf_url.strip() if item.pdf_url else None} for item in request.items]
+    file_ids = list(dict.fromkeys(item["file_id"] for item in items if item["file_id"]))
+    available = await asyncio.gather(*(pdf_available(file_id) for file_id in file_ids))
+    missing = [file_id for file_id, found in zip(file_ids, available) if not found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"PDF not found: {', '.join(missing)}")
+    try:
+        batch = await job_queue.submit_batch(items, tenant=client_tenant(http_request, x_tenant_id))
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return {"batch_id": batch["id"], "total": batch["total"], "duplicates": batch["duplicates"]}
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    batch = await job_queue.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+@app.get("/batches/{batch_id}/events")
+async def batch_events(batch_id: str):
+    if not await job_queue.get_batch(batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return StreamingResponse(job_queue.stream_batch(batch_id), media_type="text/event-stream")
+
+async def batch_archive(items: List[Dict]) -> AsyncIterator[bytes]:
+    # Projects are fetched and added one at a time, so only one is held in memory
+    stream = ZipStream()
+    for item in items:
+        archive = b"".join([chunk async for chunk in iter_project_archive(item["project_id"])])
+        files = await run_in_thread(read_zip, archive)
+        folder = f"{item['index'] + 1:03d}-{item['project_id']}"
+        for path, content in files.items():
+            if data := await asyncio.to_thread(stream.add, f"{folder}/{path}", content):
+                yield data
+    yield await asyncio.to_thread(stream.close)
+
+@app.get("/batches/{batch_id}/download")
+async def download_batch(batch_id: str):
+    batch = await job_queue.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    # Finished items only; duplicates point at the same project and are included once
+    items, project_ids = [], set()
+    for item in batch["items"]:
+        if item["project_id"] and item["project_id"] not in project_ids:
+            project_ids.add(item["project_id"])
+            items.append(item)
+    if not items:
+        raise HTTPException(status_code=409, detail="No project in this batch has finished yet")
+    return StreamingResponse(
+        batch_archive(items),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=batch-{batch_id}.zip"}
+    )
+
+async def lookup_project_download_url(project_id: str) -> Optional[str]:
+    download_url = project_urls.get(project_id)
+    if download_url is MISSING:
+        download_url = await get_project_download_url(project_id)
+        if download_url:
+            project_urls.set(project_id, download_url)
+    return download_url
+
+async def fill_archive_cache(project_id: str) -> str:
+    temp_path, f = await asyncio.to_thread(archive_cache.open_temp, project_id)
+    try:
+        async for chunk in iter_project_archive(project_id):
+            await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(archive_cache.discard, temp_path)
+        raise
+    await asyncio.to_thread(f.close)
+    await asyncio.to_thread(archive_cache.commit, project_id, temp_path)
+    return await asyncio.to_thread(archive_cache.lookup, project_id)
+
+async def tee_archive(project_id: str, first_chunk: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # Bytes go to the client as they arrive and are copied into the local cache;
+    # the copy is only kept if the whole archive made it through
+    temp_path, f = await asyncio.to_thread(archive_cache.open_temp, project_id)
+    try:
+        yield first_chunk
+        await asyncio.to_thread(f.write, first_chunk)
+        async for chunk in chunks:
+            yield chunk
+            await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(archive_cache.discard, temp_path)
+        raise
+    await asyncio.to_thread(f.close)
+    await asyncio.to_thread(archive_cache.commit, project_id, temp_path)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/download/{project_id}")
-async def download_project(project_id: str):
-    download_url = await get_project_download_url(project_id)
+async def download_project(
+    project_id: str,
+    range_header: Optional[str] = Header(None, alias="range"),
+    if_none_match: Optional[str] = Header(None)
+):
+    download_url = await lookup_project_download_url(project_id)
     if not download_url:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    async with httpx.AsyncClient() as client:
-        file_response = await client.get(download_url)
+    # An archive is never rewritten once uploaded, so the project id is a stable ETag
+    etag = f'"{project_id}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=86400",
+        "Content-Disposition": f"attachment; filename={project_id}.zip"
+    }
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        archive_path = await asyncio.to_thread(archive_cache.lookup, project_id)
+        if archive_path is None and range_header is not None:
+            # Ranges are served from the local copy, so fetch it whole first
+            archive_path = await fill_archive_cache(project_id)
 
-        if file_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to fetch file from storage")
+        if archive_path is None:
+            chunks = iter_project_archive(project_id)
+            first_chunk = await anext(chunks, b"")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Failed to fetch file from storage")
 
-        content_type = file_response.headers.get("content-type", "application/octet-stream")
+    if archive_path is not None:
+        return FileResponse(archive_path, media_type="application/zip", headers=headers)
 
-        # Step 3: Stream the file back to the client
-        return StreamingResponse(
-            BytesIO(file_response.content),
-            media_type=content_type,
-            headers={"Content-Disposition": f"attachment; filename={project_id}.zip"}
-        )
\ No newline at end of file
+    # Stream the file back to the client
+    return StreamingResponse(
+        tee_archive(project_id, first_chunk, chunks),
+        media_type="application/zip",
+        headers=headers
+    )
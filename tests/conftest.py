@@ -1,5 +1,33 @@
+import json
 import os
 import sys
 
+import pytest
+
 # Add the parent directory to the Python path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) 
\ No newline at end of file
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import pipeline
+from cache import DiskCache
+from db import LocalBackend
+
+
+class EventQueue:
+    """Stands in for a run's broadcast, keeping the events the pipeline puts on it."""
+
+    def __init__(self):
+        self.events = []
+
+    async def put(self, event):
+        self.events.append(json.loads(event[len("data: "):]))
+
+
+@pytest.fixture
+def local_pipeline(tmp_path, monkeypatch):
+    """Pipeline runs store projects and checkpoints under tmp_path and read papers through the generator."""
+    db.set_storage(LocalBackend(str(tmp_path / "storage")))
+    monkeypatch.setattr(pipeline, "stage_checkpoints", DiskCache(str(tmp_path / "checkpoints"), 10 * 1024 * 1024))
+    monkeypatch.setattr(pipeline, "PDF_EXTRACTOR", "generator")
+    yield
+    db.set_storage(None)
@@ -0,0 +1,47 @@
+import asyncio
+import zipfile
+from io import BytesIO
+
+from archive import ZipStream, aiter_zip, iter_zip, read_zip
+
+
+def test_zip_round_trip():
+    files = {"README.md": "# Project", "src/main.py": "print('hi')\n", "src/": None}
+    archive = b"".join(iter_zip(files))
+
+    assert read_zip(archive) == {"README.md": "# Project", "src/main.py": "print('hi')\n"}
+    with zipfile.ZipFile(BytesIO(archive)) as zipf:
+        assert zipf.testzip() is None
+
+
+def test_large_files_are_streamed_in_chunks():
+    files = {f"file_{i}.txt": "".join(str(j) for j in range(i * 7919, i * 7919 + 20000)) for i in range(8)}
+    chunks = list(iter_zip(files, compresslevel=1, chunk_size=16 * 1024))
+
+    assert len(chunks) > 2
+    assert read_zip(b"".join(chunks)) == files
+
+
+def test_compression_level_is_applied():
+    files = {"data.txt": "abcdefgh" * 50000}
+    fast = b"".join(iter_zip(files, compresslevel=0))
+    small = b"".join(iter_zip(files, compresslevel=9))
+
+    assert len(small) < len(fast)
+    assert read_zip(fast) == read_zip(small) == files
+
+
+def test_async_iterator_matches_sync_output():
+    files = {"a.py": "x = 1\n" * 1000, "b.py": "y = 2\n"}
+
+    async def collect():
+        return b"".join([chunk async for chunk in aiter_zip(files)])
+
+    assert read_zip(asyncio.run(collect())) == files
+
+
+def test_zip_stream_builds_archive_incrementally():
+    stream = ZipStream()
+    parts = [stream.add("a/main.py", "print('a')\n"), stream.add("b/main.py", "print('b')\n"), stream.close()]
+
+    assert read_zip(b"".join(parts)) == {"a/main.py": "print('a')\n", "b/main.py": "print('b')\n"}
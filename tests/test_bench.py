@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_benchmark_runs_offline():
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_e2e", "--flows", "4", "--concurrency", "2", "--stage-latency", "0.01"],
+        cwd=ROOT, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+
+    report = json.loads(result.stdout)
+    assert report["completed"] == 4
+    assert report["errors"] == []
+    assert report["latency_seconds"]["p50"] > 0
+    assert report["time_to_first_event_seconds"]["p99"] <= report["latency_seconds"]["max"]
+    assert report["peak_rss_mb"] > 0
+
+
+def test_benchmark_runs_with_combined_endpoint():
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_e2e", "--flows", "4", "--concurrency", "2", "--stage-latency", "0.01", "--combined"],
+        cwd=ROOT, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+
+    report = json.loads(result.stdout)
+    assert report["completed"] == 4
+    assert report["errors"] == []
+
+
+def test_startup_benchmark_loads_no_heavy_modules():
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--samples", "1", "--warmup"],
+        cwd=ROOT, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+
+    report = json.loads(result.stdout)
+    assert report["statuses"] == [200]
+    assert report["heavy_modules"] == []
+    assert 0 < report["import_seconds"]["max"] <= report["first_response_seconds"]["max"]
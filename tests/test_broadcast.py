@@ -0,0 +1,196 @@
+import asyncio
+import json
+import time
+
+from broadcast import BroadcastHub, RunLog
+
+
+def event(status, **fields):
+    return f"data: {json.dumps({'status': status, **fields})}\n\n"
+
+
+def statuses(events):
+    return [json.loads(e.split("data: ", 1)[1])["status"] for e in events]
+
+
+async def collect(run, into):
+    async for e in run.subscribe():
+        into.append(e)
+
+
+def test_late_subscriber_gets_history_and_shares_the_run():
+    async def main():
+        hub = BroadcastHub()
+        go, step = asyncio.Event(), asyncio.Event()
+        starts = []
+
+        async def pipeline(run):
+            starts.append(run)
+            await go.wait()
+            await run.put(event("reading_paper"))
+            await run.put(event("queued", position=1))
+            await step.wait()
+            await run.put(event("complete"))
+
+        first_run, started = hub.attach("paper", pipeline)
+        first, second = [], []
+        first_task = asyncio.create_task(collect(first_run, first))
+        await asyncio.sleep(0.01)
+        go.set()
+        await asyncio.sleep(0.01)
+
+        second_run, second_started = hub.attach("paper", pipeline)
+        second_task = asyncio.create_task(collect(second_run, second))
+        await asyncio.sleep(0.01)
+        step.set()
+        await asyncio.gather(first_task, second_task)
+        await first_run.task
+        return started, second_started, second_run is first_run, len(starts), first, second, hub.runs
+
+    started, second_started, same, starts, first, second, runs = asyncio.run(main())
+    assert (started, second_started, same, starts) == (True, False, True, 1)
+    assert statuses(first) == ["reading_paper", "queued", "complete"]
+    # The queue position was only meaningful when it was sent
+    assert statuses(second) == ["reading_paper", "complete"]
+    assert runs == {}
+
+
+def test_finished_run_is_replaced_by_a_new_one():
+    async def main():
+        hub = BroadcastHub()
+
+        async def pipeline(run):
+            await run.put(event("complete"))
+
+        run, _ = hub.attach("paper", pipeline)
+        await run.task
+        replay = [e async for e in run.subscribe()]
+        again, started = hub.attach("paper", pipeline)
+        await again.task
+        return statuses(replay), started, again is run
+
+    assert asyncio.run(main()) == (["complete"], True, False)
+
+
+def test_run_is_cancelled_after_last_subscriber_leaves():
+    async def main():
+        hub = BroadcastHub(idle_seconds=0.05)
+        cancelled = asyncio.Event()
+
+        async def pipeline(run):
+            await run.put(event("reading_paper"))
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        run, _ = hub.attach("paper", pipeline)
+        stream = run.subscribe()
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.gather(run.task, return_exceptions=True)
+        return run.finished, statuses(run.history), hub.runs
+
+    finished, history, runs = asyncio.run(main())
+    assert finished
+    assert history == ["reading_paper", "error"]
+    assert runs == {}
+
+
+def test_rejoining_within_idle_period_keeps_run_alive():
+    async def main():
+        hub = BroadcastHub(idle_seconds=0.05)
+        step = asyncio.Event()
+
+        async def pipeline(run):
+            await run.put(event("reading_paper"))
+            await step.wait()
+            await run.put(event("complete"))
+
+        run, _ = hub.attach("paper", pipeline)
+        stream = run.subscribe()
+        await stream.__anext__()
+        await stream.aclose()
+
+        rejoined, started = hub.attach("paper", pipeline)
+        events = []
+        task = asyncio.create_task(collect(rejoined, events))
+        await asyncio.sleep(0.1)
+        step.set()
+        await task
+        return started, statuses(events)
+
+    assert asyncio.run(main()) == (False, ["reading_paper", "complete"])
+
+
+def test_events_are_numbered_by_the_run_and_logged(tmp_path):
+    log_path = str(tmp_path / "runs.sqlite3")
+
+    async def main():
+        hub = BroadcastHub(log=RunLog(log_path))
+
+        async def pipeline(run):
+            await run.put(event("reading_paper"))
+            await run.put(event("heartbeat"))
+            await run.put(event("file", path="a.py"))
+            await run.put(event("complete"))
+
+        run, _ = hub.attach(("paper", "sequential", True), pipeline)
+        await run.task
+        resumed = [e async for e in run.subscribe(after=1)]
+        await hub.close()
+        # A restarted server still has the finished run's events
+        logged = await BroadcastHub(log=RunLog(log_path)).finished_events(("paper", "sequential", True), after=1)
+        missing = await hub.finished_events(("other", "sequential", True))
+        return run.history, resumed, logged, missing
+
+    history, resumed, logged, missing = asyncio.run(main())
+    assert [e.split("\n", 1)[0] for e in history] == ["id: 1", "id: 2", "id: 3"]
+    assert statuses(history) == ["reading_paper", "file", "complete"]
+    assert resumed == logged == history[1:]
+    assert missing is None
+
+
+def test_subscribers_do_not_wait_on_the_log(tmp_path):
+    class SlowLog(RunLog):
+        batches = []
+
+        def _write(self, conn, entries):
+            self.batches.append(len(entries))
+            time.sleep(0.2)
+            super()._write(conn, entries)
+
+    async def main():
+        hub = BroadcastHub(log=SlowLog(str(tmp_path / "runs.sqlite3")))
+        step = asyncio.Event()
+
+        async def pipeline(run):
+            for index in range(20):
+                await run.put(event("file", path=f"{index}.py"))
+            await step.wait()
+            await run.put(event("complete"))
+
+        key = ("paper", "sequential", True)
+        run, _ = hub.attach(key, pipeline)
+        received = []
+        started = time.monotonic()
+        task = asyncio.create_task(collect(run, received))
+        await asyncio.sleep(0.01)
+        in_progress = await hub.finished_events(key)
+        step.set()
+        await task
+        elapsed = time.monotonic() - started
+        await run.task
+        logged = await hub.finished_events(key)
+        await hub.close()
+        return elapsed, len(received), in_progress, len(logged), SlowLog.batches
+
+    elapsed, received, in_progress, logged, batches = asyncio.run(main())
+    assert received == logged == 21
+    assert elapsed < 0.2
+    # A resuming client is sent to the run still in progress
+    assert in_progress is None
+    # The events that piled up during the first write go out in one transaction
+    assert len(batches) <= 3 and sum(batches) == 22
@@ -0,0 +1,85 @@
+import os
+import time
+
+from cache import MISSING, BlobCache, DiskCache, TTLCache, cache_key
+
+
+def test_cache_key_depends_on_inputs():
+    assert cache_key("plan", "paper") == cache_key("plan", "paper")
+    assert cache_key("plan", "paper") != cache_key("plan", "other paper")
+    assert cache_key("implement", {"b": 1, "a": 2}) == cache_key("implement", {"a": 2, "b": 1})
+
+
+def test_get_returns_stored_value(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1024 * 1024)
+    assert cache.get("missing") == (False, MISSING)
+
+    cache.set("k1", {"main.py": "print('hi')"})
+    assert cache.get("k1") == (True, {"main.py": "print('hi')"})
+
+    cache.delete("k1")
+    assert cache.get("k1")[0] is False
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    cache.set("aa", "x" * 100)
+    cache.set("bb", "y" * 100)
+
+    # Age both entries, then touch "aa" so "bb" becomes the eviction candidate
+    past = time.time() - 60
+    for key in ("aa", "bb"):
+        os.utime(cache._path(key), (past, past))
+    cache.get("aa")
+
+    cache.set("cc", "z" * 100)
+    assert cache.get("aa")[0] is True
+    assert cache.get("bb")[0] is False
+    assert cache.get("cc")[0] is True
+
+
+def test_blob_cache_commits_complete_files_only(tmp_path):
+    cache = BlobCache(str(tmp_path), max_bytes=1024)
+    assert cache.lookup("project") is None
+
+    temp_path, f = cache.open_temp("project")
+    f.write(b"partial")
+    f.close()
+    cache.discard(temp_path)
+    assert cache.lookup("project") is None
+
+    temp_path, f = cache.open_temp("project")
+    f.write(b"PK archive")
+    f.close()
+    cache.commit("project", temp_path)
+    with open(cache.lookup("project"), "rb") as f:
+        assert f.read() == b"PK archive"
+
+
+def test_ttl_cache_expires_and_bounds_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = TTLCache(ttl=10, max_entries=2)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+
+    now[0] += 11
+    assert cache.get("a") is MISSING
+
+
+def test_blob_cache_adds_existing_files(tmp_path):
+    source = tmp_path / "paper.pdf"
+    source.write_bytes(b"%PDF-1.4")
+    cache = BlobCache(str(tmp_path / "cache"), max_bytes=1024)
+
+    cache.add_file("a" * 64, str(source))
+
+    path = cache.lookup("a" * 64)
+    with open(path, 'rb') as f:
+        assert f.read() == b"%PDF-1.4"
+    assert source.exists()
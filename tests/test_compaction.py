@@ -0,0 +1,124 @@
+from compaction import compact_paper, stage_context
+
+HEADER = "Sparse Widgets for Fast Inference"
+
+PAPER = f"""{HEADER}
+Jane Doe, John Roe
+Abstract
+We propose sparse widgets, a method for fast inference in large mod-
+els. Our approach beats baselines.
+arXiv:2401.00001v1 [cs.LG] 1 Jan 2024
+1 Introduction
+Inference is slow. We fix it.
+1
+{HEADER}
+2 Related Work
+Prior work used dense widgets.
+3 Sparse Widget Layers
+Each layer keeps the top k activations.
+3.1 Routing
+Tokens are routed by a learned gate.
+4 Experiments
+We train on ImageNet for 90 epochs with batch size 256.
+2
+{HEADER}
+5 Conclusion
+Sparse widgets are fast.
+Acknowledgments
+We thank our funders.
+References
+[1] A. Author. Dense widgets. 2020.
+A Additional Proofs
+Proof of theorem 1.
+"""
+
+
+def test_sections_are_typed_and_boilerplate_removed():
+    compact = compact_paper(PAPER)
+
+    assert compact["title"] == HEADER
+    assert [(section["title"], section["kind"]) for section in compact["sections"]] == [
+        ("Abstract", "abstract"),
+        ("1 Introduction", "intro"),
+        ("2 Related Work", "related"),
+        ("3 Sparse Widget Layers", "other"),
+        ("3.1 Routing", "other"),
+        ("4 Experiments", "experiments"),
+        ("5 Conclusion", "conclusion"),
+    ]
+    text = " ".join(section["text"] for section in compact["sections"])
+    assert "large models" in text
+    assert HEADER not in text and "arXiv" not in text
+    assert "funders" not in text and "Dense widgets" not in text and "Proof" not in text
+
+
+def test_appendix_can_be_kept():
+    compact = compact_paper(PAPER, keep_appendix=True)
+    appendix = compact["sections"][-1]
+    assert (appendix["title"], appendix["kind"], appendix["text"]) == ("A Additional Proofs", "appendix", "Proof of theorem 1.")
+
+
+def test_stage_context_selects_sections_in_document_order():
+    context = stage_context(compact_paper(PAPER), "analyze_code")
+    assert context.split("\n\n") == [
+        HEADER,
+        "## Abstract\nWe propose sparse widgets, a method for fast inference in large models. Our approach beats baselines.",
+        "## 3 Sparse Widget Layers\nEach layer keeps the top k activations.",
+        "## 3.1 Routing\nTokens are routed by a learned gate.",
+        "## 4 Experiments\nWe train on ImageNet for 90 epochs with batch size 256.",
+    ]
+
+
+def test_stage_context_respects_token_budget():
+    compact = compact_paper(PAPER)
+    context = stage_context(compact, "implement_code", max_tokens=20)
+    # Method sections are filled first and nothing else fits after them
+    assert context == HEADER + "\n\n## 3 Sparse Widget Layers\nEach layer keeps the top k activations."
+    assert len(context) < len(stage_context(compact, "implement_code"))
+
+
+def test_paper_without_headings_is_all_abstract():
+    compact = compact_paper("A short note\non widgets.")
+    assert compact["title"] == "A short note"
+    assert stage_context(compact, "generate_plan") == "A short note\n\n" + "on widgets."
+
+
+def test_wrapped_body_lines_are_not_headings():
+    paper = """Wrapped Lines
+Abstract
+We study wrapping.
+1 Introduction
+Lines break anywhere.
+2 Method
+We train our model on 8 GPUs
+8 GPUs with a batch size of 256
+In Table 2 we show the results
+Appendix B contains the full derivation of the
+update rule.
+3 Results
+The update rule converges.
+4 References to Prior Designs
+Earlier widgets were dense.
+References
+[1] A. Author. Wrapping. 2020.
+"""
+    compact = compact_paper(paper)
+    assert [(section["title"], section["kind"]) for section in compact["sections"]] == [
+        ("Abstract", "abstract"),
+        ("1 Introduction", "intro"),
+        ("2 Method", "method"),
+        ("3 Results", "results"),
+        ("4 References to Prior Designs", "other"),
+    ]
+    method = compact["sections"][2]["text"]
+    assert method.startswith("We train our model on 8 GPUs") and method.endswith("full derivation of the update rule.")
+    assert compact["sections"][3]["text"] == "The update rule converges."
+
+
+def test_unnumbered_section_names_must_match_exactly():
+    compact = compact_paper("Title\nAbstract\nText.\nRelated Work\nPrior text.\nConclusions and Future Work\nDone.\n")
+    assert [(section["title"], section["kind"]) for section in compact["sections"]] == [
+        ("Abstract", "abstract"),
+        ("Related Work", "related"),
+        ("Conclusions and Future Work", "conclusion"),
+    ]
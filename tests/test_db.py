@@ -2,9 +2,13 @@ import os
 import asyncio
 import tempfile
 import uuid
-from db import get_project_download_url, store_project_info, upload_pdf, get_pdf_url, upload_project
+from db import get_project_download_url, store_project_info, upload_pdf_stream, pdf_exists, upload_project
 from supabase.lib.client_options import ClientOptions
 
+async def read_chunks(path: str):
+    with open(path, "rb") as f:
+        yield f.read()
+
 def test_project_dir():
     # Create a temporary directory with some test files
     with tempfile.TemporaryDirectory() as temp_dir:
@@ -34,7 +38,7 @@ async def test_upload_and_retrieve():
             # Test upload
             print("Uploading to Supabase storage...")
             try:
-                download_url = await upload_project(project_id, temp_dir)
+                download_url = await upload_project(project_id, {"test.txt": "Test content"})
                 print(f"Upload successful! Download URL: {download_url}")
             except Exception as e:
                 print(f"❌ Upload failed with error: {str(e)}")
@@ -83,8 +87,8 @@ async def test_pdf_storage():
             # Test PDF upload
             print("Uploading test PDF to Supabase storage...")
             try:
-                url = await upload_pdf(file_id, temp_file_path)
-                print(f"PDF upload successful! URL: {url}")
+                await upload_pdf_stream(file_id, read_chunks(temp_file_path))
+                print("PDF upload successful!")
             except Exception as e:
                 print(f"❌ PDF upload failed with error: {str(e)}")
                 print("Please check:")
@@ -96,11 +100,10 @@ async def test_pdf_storage():
             # Test PDF retrieval
             print("Retrieving PDF from storage...")
             try:
-                pdf_content = await get_pdf_url(file_id)
-                if pdf_content:
-                    print("✅ Test passed: Successfully retrieved PDF content")
+                if await pdf_exists(file_id):
+                    print("✅ Test passed: Uploaded PDF is in storage")
                 else:
-                    print("❌ Test failed: Retrieved PDF content is empty")
+                    print("❌ Test failed: Uploaded PDF is not in storage")
             except Exception as e:
                 print(f"❌ PDF retrieval failed with error: {str(e)}")
                 print("Please check:")
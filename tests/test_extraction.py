@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import extraction
+from benchmarks.fakes import make_pdf
+from extraction import extract_text
+
+
+@pytest.fixture
+def paper(tmp_path):
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(make_pdf([f"Page {i} text" for i in range(7)]))
+    return str(path)
+
+
+def test_pages_are_extracted_in_order_across_workers(paper, monkeypatch):
+    monkeypatch.setattr(extraction, "EXTRACTION_WORKERS", 2)
+    monkeypatch.setattr(extraction, "EXTRACTION_PAGES_PER_TASK", 2)
+    try:
+        text = extract_text(paper)
+    finally:
+        extraction.shutdown_pool()
+
+    assert [line.strip() for line in text.splitlines()] == [f"Page {i} text" for i in range(7)]
+
+
+def test_page_budget(paper, monkeypatch):
+    monkeypatch.setattr(extraction, "EXTRACTION_WORKERS", 1)
+    text = extract_text(paper, max_pages=3)
+    assert [line.strip() for line in text.splitlines()] == ["Page 0 text", "Page 1 text", "Page 2 text"]
+
+
+def test_token_budget_truncates(paper, monkeypatch):
+    monkeypatch.setattr(extraction, "EXTRACTION_WORKERS", 1)
+    text = extract_text(paper, max_tokens=5)
+    assert len(text) <= 5 * extraction.CHARS_PER_TOKEN + 1
+    assert text.startswith("Page 0 text")
+
+
+def test_threads_share_one_pool(monkeypatch):
+    created = []
+
+    class SlowPool:
+        def __init__(self, **kwargs):
+            time.sleep(0.05)
+            created.append(self)
+
+        def shutdown(self, **kwargs):
+            pass
+
+    monkeypatch.setattr(extraction, "ProcessPoolExecutor", SlowPool)
+    try:
+        with ThreadPoolExecutor(4) as threads:
+            pools = list(threads.map(lambda _: extraction.get_pool(), range(4)))
+    finally:
+        extraction.shutdown_pool()
+
+    assert len(created) == 1 and all(pool is created[0] for pool in pools)
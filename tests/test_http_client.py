@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_client
+from http_client import FetchError, ResponseTooLargeError, iter_url
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    failures = {}
+    client_ports = []
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        type(self).client_ports.append(self.client_address[1])
+        if self.path.startswith("/flaky"):
+            remaining = self.failures.get(self.path, 0)
+            if remaining:
+                self.failures[self.path] = remaining - 1
+                return self.send_body(503, b"busy", [("Retry-After", "0")])
+            return self.send_body(200, b"%PDF after retry")
+        if self.path == "/missing":
+            return self.send_body(404, b"not found")
+        if self.path == "/large":
+            return self.send_body(200, b"x" * 5000)
+        if self.path == "/unsized":
+            # No Content-Length, so the limit has to be enforced while streaming
+            self.send_response(200)
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(b"y" * 5000)
+            self.close_connection = True
+            return
+        return self.send_body(200, b"%PDF-1.4 paper")
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(http_client, "HTTP_BACKOFF_SECONDS", 0.01)
+    StandInHandler.failures = {}
+    StandInHandler.client_ports = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fetch(url, max_bytes=1024, retries=None):
+    async def main():
+        try:
+            return b"".join([chunk async for chunk in iter_url(url, max_bytes, chunk_size=256, retries=retries)])
+        finally:
+            await http_client.close_client()
+
+    return asyncio.run(main())
+
+
+def test_requests_reuse_one_keep_alive_connection(server):
+    async def main():
+        try:
+            for _ in range(3):
+                assert b"".join([chunk async for chunk in iter_url(f"{server}/paper.pdf", 1024)]) == b"%PDF-1.4 paper"
+        finally:
+            await http_client.close_client()
+
+    asyncio.run(main())
+    assert len(StandInHandler.client_ports) == 3
+    assert len(set(StandInHandler.client_ports)) == 1
+
+
+def test_retryable_statuses_are_retried_up_to_the_limit(server):
+    StandInHandler.failures = {"/flaky-ok": 2, "/flaky-down": 5}
+
+    assert fetch(f"{server}/flaky-ok", retries=3) == b"%PDF after retry"
+    with pytest.raises(FetchError, match="503"):
+        fetch(f"{server}/flaky-down", retries=2)
+    assert StandInHandler.failures["/flaky-down"] == 2
+
+    with pytest.raises(FetchError, match="404"):
+        fetch(f"{server}/missing")
+
+
+def test_oversized_responses_are_cut_off(server):
+    with pytest.raises(ResponseTooLargeError):
+        fetch(f"{server}/large", max_bytes=1000)
+    with pytest.raises(ResponseTooLargeError):
+        fetch(f"{server}/unsized", max_bytes=1000)
+
+
+def test_connection_errors_become_fetch_errors(server):
+    with pytest.raises(FetchError):
+        fetch("http://127.0.0.1:9/paper.pdf", retries=1)
+    with pytest.raises(FetchError):
+        fetch("ftp://example.com/paper.pdf")
@@ -0,0 +1,222 @@
+import asyncio
+import json
+
+import pytest
+
+from jobs import JobQueue, QueueFullError, BatchTooLargeError, BATCH_MAX_ITEMS
+
+
+def event(status: str) -> str:
+    return f"data: {json.dumps({'status': status})}\n\n"
+
+
+async def wait_for_status(job_queue: JobQueue, job_id: str, status: str):
+    for _ in range(200):
+        job = await job_queue.get(job_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}")
+
+
+def test_job_runs_and_stores_events(tmp_path):
+    async def runner(job, queue):
+        await queue.put(event("reading_paper"))
+        await queue.put(event("complete"))
+        return {"project_id": f"project-{job['file_id']}"}
+
+    async def main():
+        job_queue = JobQueue(str(tmp_path / "jobs.sqlite3"), runner, workers=2)
+        await job_queue.start()
+        try:
+            job = await job_queue.submit("abc")
+            done = await wait_for_status(job_queue, job["id"], "complete")
+            assert done["result"] == {"project_id": "project-abc"}
+
+            streamed = [e async for e in job_queue.stream_events(job["id"])]
+            assert streamed == [f"id: 1\n{event('reading_paper')}", f"id: 2\n{event('complete')}"]
+
+            resumed = [e async for e in job_queue.stream_events(job["id"], after=1)]
+            assert resumed == [f"id: 2\n{event('complete')}"]
+        finally:
+            await job_queue.stop()
+
+    asyncio.run(main())
+
+
+def test_failed_job_records_error(tmp_path):
+    async def runner(job, queue):
+        raise RuntimeError("boom")
+
+    async def main():
+        job_queue = JobQueue(str(tmp_path / "jobs.sqlite3"), runner, workers=1)
+        await job_queue.start()
+        try:
+            job = await job_queue.submit("abc")
+            failed = await wait_for_status(job_queue, job["id"], "error")
+            assert failed["error"] == "boom"
+        finally:
+            await job_queue.stop()
+
+    asyncio.run(main())
+
+
+def test_queue_depth_limit(tmp_path):
+    release = None
+
+    async def runner(job, queue):
+        await release.wait()
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        job_queue = JobQueue(str(tmp_path / "jobs.sqlite3"), runner, workers=1, max_depth=2)
+        await job_queue.start()
+        try:
+            first = await job_queue.submit("a")
+            await wait_for_status(job_queue, first["id"], "running")
+            second = await job_queue.submit("b")
+            third = await job_queue.submit("c")
+            assert (await job_queue.get(third["id"]))["position"] == 1
+            with pytest.raises(QueueFullError):
+                await job_queue.submit("d")
+
+            release.set()
+            await wait_for_status(job_queue, second["id"], "complete")
+        finally:
+            await job_queue.stop()
+
+    asyncio.run(main())
+
+
+def test_running_jobs_are_requeued_on_restart(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    started = None
+
+    async def stuck(job, queue):
+        started.set()
+        await asyncio.Event().wait()
+
+    async def finish(job, queue):
+        return {"project_id": "p"}
+
+    async def main():
+        nonlocal started
+        started = asyncio.Event()
+        job_queue = JobQueue(path, stuck, workers=1)
+        await job_queue.start()
+        job = await job_queue.submit("abc")
+        await started.wait()
+        await job_queue.stop()
+
+        restarted = JobQueue(path, finish, workers=1)
+        await restarted.start()
+        try:
+            done = await wait_for_status(restarted, job["id"], "complete")
+            assert done["result"] == {"project_id": "p"}
+        finally:
+            await restarted.stop()
+
+    asyncio.run(main())
+
+
+def test_tenant_with_fewest_running_jobs_goes_next(tmp_path):
+    started = []
+
+    async def runner(job, queue):
+        started.append(job["file_id"])
+        await asyncio.sleep(0.05)
+        return {}
+
+    async def main():
+        job_queue = JobQueue(str(tmp_path / "jobs.sqlite3"), runner, workers=2)
+        jobs = []
+        await job_queue.start()
+        await job_queue.stop()
+        for file_id, tenant in [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b")]:
+            jobs.append(await job_queue.submit(file_id, tenant=tenant))
+        await job_queue.start()
+        try:
+            for job in jobs:
+                await wait_for_status(job_queue, job["id"], "complete")
+        finally:
+            await job_queue.stop()
+
+    asyncio.run(main())
+    assert started[:2] in (["a1", "b1"], ["b1", "a1"])
+
+
+def test_batch_dedupes_items_and_streams_progress(tmp_path):
+    async def runner(job, queue):
+        if job["file_id"] == "bad":
+            raise RuntimeError("broken pdf")
+        return {"project_id": f"project-{job['file_id'] or job['pdf_url']}"}
+
+    async def main():
+        job_queue = JobQueue(str(tmp_path / "jobs.sqlite3"), runner, workers=2)
+        await job_queue.start()
+        try:
+            batch = await job_queue.submit_batch([
+                {"file_id": "abc"},
+                {"pdf_url": "https://example.com/paper.pdf"},
+                {"file_id": "abc"},
+                {"file_id": "bad"},
+            ], tenant="lab")
+            assert (batch["total"], batch["duplicates"]) == (3, 1)
+
+            events = [json.loads(e[len("data: "):]) async for e in job_queue.stream_batch(batch["id"])]
+            done = await job_queue.get_batch(batch["id"])
+        finally:
+            await job_queue.stop()
+        return events, done
+
+    events, done = asyncio.run(main())
+
+    assert done["status"] == "complete"
+    assert done["counts"] == {"queued": 0, "running": 0, "complete": 2, "error": 1}
+    assert [item["project_id"] for item in done["items"]] == ["project-abc", "project-https://example.com/paper.pdf", None]
+    assert done["items"][2]["error"] == "broken pdf"
+
+    assert sorted(e["index"] for e in events if e["status"].startswith("item_")) == [0, 1, 2]
+    assert events[-1]["status"] == "batch_complete"
+    assert events[-1]["complete"] == 2
+
+
+def test_position_follows_claim_order(tmp_path):
+    async def runner(job, queue):
+        return {}
+
+    async def main():
+        job_queue = JobQueue(str(tmp_path / "jobs.sqlite3"), runner, workers=1)
+        await job_queue.start()
+        await job_queue.stop()
+        jobs = {}
+        for file_id, tenant in [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b")]:
+            jobs[file_id] = await job_queue.submit(file_id, tenant=tenant)
+        # b's only job goes right after a's first, ahead of a's backlog
+        return {file_id: (await job_queue.get(job["id"]))["position"] for file_id, job in jobs.items()}
+
+    assert asyncio.run(main()) == {"a1": 0, "a2": 2, "a3": 3, "b1": 1}
+
+
+def test_batch_items_are_capped_separately(tmp_path):
+    async def runner(job, queue):
+        return {}
+
+    async def main():
+        job_queue = JobQueue(str(tmp_path / "jobs.sqlite3"), runner, workers=1, max_depth=1, max_batch_depth=3)
+        await job_queue.start()
+        await job_queue.stop()
+        with pytest.raises(BatchTooLargeError):
+            await job_queue.submit_batch([{"file_id": str(index)} for index in range(BATCH_MAX_ITEMS + 1)])
+        await job_queue.submit_batch([{"file_id": "a"}, {"file_id": "b"}])
+        # Rejected whole: both items would not fit
+        with pytest.raises(QueueFullError):
+            await job_queue.submit_batch([{"file_id": "c"}, {"file_id": "d"}])
+        await job_queue.submit_batch([{"file_id": "c"}])
+        # Single jobs are not held up by queued batch items
+        await job_queue.submit("e")
+        with pytest.raises(QueueFullError):
+            await job_queue.submit("f")
+
+    asyncio.run(main())
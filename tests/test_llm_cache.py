@@ -0,0 +1,90 @@
+from openai.types.chat import ChatCompletion
+
+import llm_cache
+from benchmarks.fakes import FakeOpenAI
+from llm_cache import CachedClient, LLMCache, request_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def ask(client, content, **params):
+    return client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": content}], **params)
+
+
+def test_repeated_requests_are_served_from_cache(tmp_path):
+    fake = FakeOpenAI()
+    cache = LLMCache(str(tmp_path / "llm.sqlite3"))
+    client = CachedClient(fake, cache)
+
+    first = ask(client, "plan", temperature=0.2)
+    second = ask(client, "plan", temperature=0.2, timeout=30)
+    ask(client, "plan", temperature=0.7)
+
+    assert fake.chat.completions.calls == 2
+    assert isinstance(second, ChatCompletion)
+    assert second.choices[0].message.content == first.choices[0].message.content == "echo: plan"
+    assert {key: value for key, value in cache.stats().items() if key != "bytes"} == {
+        "hits": 1, "misses": 2, "hit_ratio": 1 / 3, "entries": 2
+    }
+
+
+def test_streamed_requests_bypass_cache(tmp_path):
+    fake = FakeOpenAI()
+    client = CachedClient(fake, LLMCache(str(tmp_path / "llm.sqlite3")))
+    ask(client, "plan", stream=True)
+    ask(client, "plan", stream=True)
+    assert fake.chat.completions.calls == 2
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    clock = Clock()
+    cache = LLMCache(str(tmp_path / "llm.sqlite3"), ttl=60, clock=clock)
+    cache.set("key", {"answer": 1})
+    assert cache.get("key") == (True, {"answer": 1})
+
+    clock.now += 61
+    assert cache.get("key") == (False, None)
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    clock = Clock()
+    value = "x" * 100
+    cache = LLMCache(str(tmp_path / "llm.sqlite3"), max_bytes=250, clock=clock)
+    for key in ("a", "b"):
+        clock.now += 1
+        cache.set(key, value)
+    clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.set("c", value)
+
+    assert [cache.get(key)[0] for key in ("a", "b", "c")] == [True, False, True]
+
+
+def test_request_key_ignores_transport_options():
+    messages = [{"role": "user", "content": "hi"}]
+    key = request_key({"model": "m", "messages": messages, "temperature": 0})
+    assert request_key({"model": "m", "messages": messages, "temperature": 0, "timeout": 5, "extra_headers": {"X-Trace": "1"}}) == key
+    assert request_key({"model": "m", "messages": messages, "temperature": 0, "extra_body": {"top_k": 5}}) != key
+    assert request_key({"model": "m", "messages": messages, "temperature": 0, "extra_query": {"api-version": "2"}}) != key
+    assert request_key({"model": "other", "messages": messages, "temperature": 0}) != key
+
+
+def test_install_wraps_generator_client(tmp_path):
+    class Generator:
+        def __init__(self):
+            self.client = FakeOpenAI()
+
+    generator = llm_cache.install(Generator(), LLMCache(str(tmp_path / "llm.sqlite3")))
+    assert isinstance(generator.client, CachedClient)
+    assert llm_cache.install(generator).client is generator.client
+
+    bare = object()
+    assert llm_cache.install(bare) is bare
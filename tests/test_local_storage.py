@@ -0,0 +1,252 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+import db
+from archive import read_zip
+from db import LocalBackend
+
+
+@pytest.fixture
+def local_storage(tmp_path):
+    backend = LocalBackend(str(tmp_path))
+    db.set_storage(backend)
+    yield backend
+    db.set_storage(None)
+
+
+async def chunked(data: bytes, size: int = 4):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def test_pdf_stream_move_and_read(local_storage):
+    async def main():
+        await db.upload_pdf_stream("staging/abc", chunked(b"%PDF-1.4 test"))
+        assert not await db.pdf_exists("hash")
+
+        await db.move_pdf("staging/abc", "hash")
+        assert await db.pdf_exists("hash")
+        assert not await db.pdf_exists("staging/abc")
+
+        content = b"".join([chunk async for chunk in db.iter_pdf("hash")])
+        assert content == b"%PDF-1.4 test"
+
+        await db.remove_pdf("hash")
+        assert not await db.pdf_exists("hash")
+
+    asyncio.run(main())
+
+
+def test_failed_stream_leaves_no_object(local_storage):
+    async def failing():
+        yield b"%PDF"
+        raise ValueError("client went away")
+
+    async def main():
+        with pytest.raises(ValueError):
+            await db.upload_pdf_stream("staging/broken", failing())
+        assert not await db.pdf_exists("staging/broken")
+
+    asyncio.run(main())
+
+
+def test_slow_uploads_do_not_hold_up_other_calls(tmp_path):
+    async def main():
+        backend = LocalBackend(str(tmp_path), concurrency=1, upload_concurrency=1)
+        release = asyncio.Event()
+
+        async def slow_body():
+            yield b"%PDF"
+            await release.wait()
+            yield b"-1.4"
+
+        upload = asyncio.create_task(backend.put_object("pdf", "slow.pdf", slow_body(), "application/pdf"))
+        await asyncio.sleep(0.05)
+        assert not await asyncio.wait_for(backend.object_exists("pdf", "other.pdf"), 1)
+        assert await asyncio.wait_for(backend.get_project("missing"), 1) is None
+
+        release.set()
+        await upload
+        assert await backend.object_size("pdf", "slow.pdf") == 8
+
+    asyncio.run(main())
+
+
+def test_project_rows(local_storage):
+    async def main():
+        await db.store_project_info("p1", "file:///p1.zip", "hash")
+        assert await db.get_project_download_url("p1") == "file:///p1.zip"
+        assert await db.get_project_download_url("missing") is None
+        assert await db.get_cached_project("hash") == {"id": "p1", "download_url": "file:///p1.zip"}
+
+        expired = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+        await local_storage.insert_project({"id": "p0", "download_url": "x", "expires_at": expired, "file_id": "old"})
+        assert await db.get_cached_project("old") is None
+
+    asyncio.run(main())
+
+
+def test_project_archive_round_trip(local_storage):
+    async def main():
+        url = await db.upload_project("p1", {"main.py": "print('hi')\n"})
+        assert url.startswith("file://")
+
+        archive = b"".join([chunk async for chunk in db.iter_project_archive("p1")])
+        assert read_zip(archive) == {"main.py": "print('hi')\n"}
+
+    asyncio.run(main())
+
+
+def test_expired_projects_are_swept_with_their_archives(local_storage):
+    now = datetime.now(timezone.utc)
+    expired = (now - timedelta(hours=1)).isoformat()
+
+    async def main():
+        for project_id in ("old1", "old2", "old3"):
+            await db.upload_project(project_id, {"main.py": "x = 1\n" * 100})
+            await local_storage.insert_project({"id": project_id, "download_url": "x", "expires_at": expired, "file_id": "paper"})
+        await db.upload_pdf_stream("paper", chunked(b"%PDF-1.4 paper"))
+        await db.upload_project("new", {"main.py": "y = 2\n"})
+        await db.store_project_info("new", "file:///new.zip", "other")
+
+        archive_bytes = sum([await local_storage.object_size("project-code", f"old{i}.zip") for i in (1, 2, 3)])
+
+        result = await db.sweep_expired_projects(now, batch_size=2)
+
+        assert sorted(result["projects"]) == ["old1", "old2", "old3"]
+        assert result["reclaimed_bytes"] == archive_bytes
+        for project_id in ("old1", "old2", "old3"):
+            assert await local_storage.get_project(project_id) is None
+            assert not await local_storage.object_exists("project-code", f"{project_id}.zip")
+        # PDFs are swept on their own expiry, not their projects'
+        assert await db.pdf_exists("paper")
+        assert await db.get_project_download_url("new") == "file:///new.zip"
+
+        assert (await db.sweep_expired_projects(now))["projects"] == []
+
+    asyncio.run(main())
+
+
+def test_pdfs_are_swept_on_their_own_expiry(local_storage, monkeypatch):
+    monkeypatch.setattr(db, "PDF_TTL_SECONDS", 3600)
+    now = datetime.now(timezone.utc)
+    long_ago = now - timedelta(hours=3)
+
+    async def main():
+        for file_id in ("reused", "never_used", "running", "fresh"):
+            await db.upload_pdf_stream(file_id, chunked(b"%PDF-1.4 " + file_id.encode()))
+            await db.touch_pdf(file_id, long_ago)
+        # A project from long ago, but the same PDF was uploaded again since
+        await local_storage.insert_project({"id": "old", "download_url": "x", "expires_at": long_ago.isoformat(), "file_id": "reused"})
+        await db.touch_pdf("reused", now)
+        await db.touch_pdf("fresh", now)
+
+        # One abandoned staged upload and one still in progress
+        await db.upload_pdf_stream("staging/abandoned", chunked(b"%PDF-1.4 staged"))
+        await db.upload_pdf_stream("staging/current", chunked(b"%PDF-1.4 staged"))
+        os.utime(local_storage._object_path("pdf", "staging/abandoned.pdf"), (long_ago.timestamp(),) * 2)
+
+        pdf_bytes = await local_storage.object_size("pdf", "never_used.pdf")
+        staged_bytes = await local_storage.object_size("pdf", "staging/abandoned.pdf")
+
+        result = await db.sweep_expired_pdfs(now, keep_file_ids={"running"}, batch_size=1)
+
+        assert result == {"pdfs": ["never_used"], "staging": ["staging/abandoned.pdf"], "reclaimed_bytes": pdf_bytes + staged_bytes}
+        assert [await db.pdf_exists(file_id) for file_id in ("reused", "never_used", "running", "fresh")] == [True, False, True, True]
+        assert await db.pdf_exists("staging/current")
+        # The running PDF was given a new expiry, so the next sweep leaves it alone
+        assert await local_storage.find_expired_pdfs(now.isoformat(), 10) == []
+
+    asyncio.run(main())
+
+
+def test_pdf_uploaded_again_during_a_sweep_is_kept(local_storage, monkeypatch):
+    now = datetime.now(timezone.utc)
+
+    async def main():
+        await db.upload_pdf_stream("paper", chunked(b"%PDF-1.4 paper"))
+        await db.touch_pdf("paper", now - timedelta(days=30))
+        find_expired_pdfs = local_storage.find_expired_pdfs
+
+        async def listed_then_uploaded(expired_before, limit):
+            file_ids = await find_expired_pdfs(expired_before, limit)
+            await db.touch_pdf("paper", now)
+            return file_ids
+
+        monkeypatch.setattr(local_storage, "find_expired_pdfs", listed_then_uploaded)
+        result = await db.sweep_expired_pdfs(now)
+
+        assert result["pdfs"] == [] and result["reclaimed_bytes"] == 0
+        assert await db.pdf_exists("paper")
+        assert await find_expired_pdfs((now + timedelta(seconds=db.PDF_TTL_SECONDS + 1)).isoformat(), 10) == ["paper"]
+
+    asyncio.run(main())
+
+
+def test_existing_projects_keep_their_pdfs(tmp_path):
+    async def main():
+        backend = LocalBackend(str(tmp_path))
+        expires_at = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+        await backend.insert_project({"id": "p1", "download_url": "x", "expires_at": expires_at, "file_id": "paper"})
+
+        # Databases from before the pdfs table get a row for each PDF with projects
+        await asyncio.to_thread(backend._run_db, lambda conn: conn.execute("DROP TABLE pdfs"))
+        backend = LocalBackend(str(tmp_path))
+        assert await backend.find_expired_pdfs(expires_at, 10) == []
+        assert await backend.find_expired_pdfs((datetime.now(timezone.utc) + timedelta(hours=2)).isoformat(), 10) == ["paper"]
+
+    asyncio.run(main())
+
+
+def test_download_urls_are_refreshed_near_expiry(local_storage):
+    now = datetime.now(timezone.utc)
+
+    async def main():
+        url = await db.upload_project("p1", {"main.py": "print('hi')\n"})
+        await local_storage.insert_project({
+            "id": "p1", "download_url": "stale", "file_id": "hash",
+            "expires_at": (now + timedelta(hours=1)).isoformat(),
+            "url_expires_at": (now + timedelta(minutes=5)).isoformat()
+        })
+        assert await db.get_project_download_url("p1") == url
+        project = await local_storage.get_project("p1")
+        assert project["download_url"] == url
+        assert datetime.fromisoformat(project["url_expires_at"]) > now + timedelta(hours=23)
+
+        # Expired projects are treated as missing rather than handing out a dead URL
+        await local_storage.update_project("p1", {"expires_at": (now - timedelta(minutes=1)).isoformat()})
+        assert await db.get_project_download_url("p1") is None
+
+    asyncio.run(main())
+
+
+def test_migration_adds_the_checked_columns():
+    with open(Path(__file__).parent.parent / db.MIGRATION_FILE) as f:
+        migration = f.read()
+    # The original projects table has id, download_url and expires_at
+    for column in ("file_id", "url_expires_at"):
+        assert f"ALTER TABLE projects ADD COLUMN IF NOT EXISTS {column} " in migration
+    assert "CREATE TABLE IF NOT EXISTS pdfs" in migration
+    assert all(f"{column} " in migration for column in db.SCHEMA_COLUMNS["pdfs"])
+
+
+def test_supabase_schema_check_names_the_migration():
+    import httpx
+
+    def handler(request):
+        columns = request.url.params["select"].split(",")
+        return httpx.Response(400 if "url_expires_at" in columns else 200, json=[])
+
+    async def main():
+        backend = db.SupabaseBackend("https://example.supabase.co", "key")
+        await backend.http.aclose()
+        backend.http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with pytest.raises(db.SchemaError, match=db.MIGRATION_FILE):
+            await backend.check_schema()
+        await backend.close()
+
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+from metrics import Registry
+
+
+def test_counter_and_gauge_exposition():
+    registry = Registry()
+    tokens = registry.counter("tokens_total", "Tokens")
+    depth = registry.gauge("queue_depth", "Depth")
+
+    tokens.inc(10, stage="plan", direction="input")
+    tokens.inc(5, stage="plan", direction="input")
+    depth.set_function(lambda: 3, executor="stages")
+    depth.set(1, executor="files")
+
+    text = registry.render()
+    assert "# TYPE tokens_total counter" in text
+    assert 'tokens_total{direction="input",stage="plan"} 15' in text
+    assert 'queue_depth{executor="stages"} 3' in text
+    assert 'queue_depth{executor="files"} 1' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    seconds = registry.histogram("stage_seconds", "Seconds", buckets=(0.1, 1))
+
+    seconds.observe(0.05, stage="plan")
+    seconds.observe(0.5, stage="plan")
+    seconds.observe(5, stage="plan")
+    with seconds.time(stage="analyze"):
+        pass
+
+    text = registry.render()
+    assert 'stage_seconds_bucket{stage="plan",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="plan",le="1"} 2' in text
+    assert 'stage_seconds_bucket{stage="plan",le="+Inf"} 3' in text
+    assert 'stage_seconds_sum{stage="plan"} 5.55' in text
+    assert seconds.count(stage="analyze") == 1
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("errors_total", "Errors").inc(stage='say "hi"\n')
+    assert 'errors_total{stage="say \\"hi\\"\\n"} 1' in registry.render()
@@ -0,0 +1,219 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import pipeline
+from conftest import EventQueue
+
+pytestmark = pytest.mark.usefixtures("local_pipeline")
+
+
+class FakeGenerator:
+    def __init__(self, files, improve_delay=0.0, slow_files=()):
+        self.files = files
+        self.improve_delay = improve_delay
+        self.slow_files = set(slow_files)
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def read_paper(self, path):
+        return "paper"
+
+    def generate_plan(self, paper_content):
+        return "plan"
+
+    def implement_code(self, paper_content, plan):
+        return dict(self.files)
+
+    def analyze_code(self, paper_content, plan, code_blocks):
+        return "analysis"
+
+    def improve_code(self, code_blocks, analysis):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            delay = 1.0 if self.slow_files & set(code_blocks) else self.improve_delay
+            time.sleep(delay)
+            return {path: content + "# improved\n" for path, content in code_blocks.items()}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def reassemble(events):
+    files = {}
+    for event in events:
+        if event["status"] == "file":
+            files.setdefault(event["path"], []).append(event["content"])
+    return {path: "".join(pieces) for path, pieces in files.items()}
+
+
+def test_parallel_mode_improves_files_concurrently():
+    files = {f"f{i}.py": f"x = {i}\n" for i in range(6)}
+    generator = FakeGenerator(files, improve_delay=0.2)
+    queue = EventQueue()
+
+    async def main():
+        return await pipeline.generate_progress_stream(generator, "paper.pdf", "hash", queue, mode="parallel")
+
+    asyncio.run(main())
+
+    assert generator.max_active > 1
+    streamed = reassemble(queue.events)
+    assert sorted(streamed) == sorted(files)
+    assert all(content.endswith("# improved\n") for content in streamed.values())
+    complete = queue.events[-1]
+    assert complete["status"] == "complete"
+    assert [entry["path"] for entry in complete["files"]] == list(files)
+
+
+def test_timed_out_files_keep_implemented_code(monkeypatch):
+    monkeypatch.setattr(pipeline, "FILE_TIMEOUT_SECONDS", 0.3)
+    files = {"fast.py": "a = 1\n", "slow.py": "b = 2\n"}
+    generator = FakeGenerator(files, slow_files={"slow.py"})
+    queue = EventQueue()
+
+    async def main():
+        return await pipeline.improve_files(generator, files, "analysis", queue)
+
+    improved = asyncio.run(main())
+
+    assert improved == {"fast.py": "a = 1\n# improved\n", "slow.py": "b = 2\n"}
+    errors = [e for e in queue.events if e["status"] == "file_error"]
+    assert [e["path"] for e in errors] == ["slow.py"]
+
+
+def test_completed_stages_are_not_rerun():
+    files = {"main.py": "print('hi')\n"}
+    calls = []
+
+    class CountingGenerator(FakeGenerator):
+        def generate_plan(self, paper_content):
+            calls.append("plan")
+            return "plan"
+
+    async def main():
+        await pipeline.generate_progress_stream(CountingGenerator(files), "paper.pdf", "hash", EventQueue())
+        await pipeline.generate_progress_stream(CountingGenerator(files), "paper.pdf", "hash", EventQueue())
+
+    asyncio.run(main())
+    assert calls == ["plan"]
+
+
+def test_large_files_are_sent_in_chunks(monkeypatch):
+    monkeypatch.setattr(pipeline, "FILE_EVENT_CHUNK_CHARS", 100)
+    files = {"big.py": "x" * 250, "small.py": "y = 1\n"}
+    queue = EventQueue()
+
+    async def main():
+        await pipeline.generate_progress_stream(FakeGenerator(files), "paper.pdf", "hash", queue)
+
+    asyncio.run(main())
+
+    chunks = [e for e in queue.events if e["status"] == "file" and e["path"] == "big.py"]
+    assert [(e["chunk"], e["chunks"]) for e in chunks] == [(0, 3), (1, 3), (2, 3)]
+    assert reassemble(queue.events) == {path: content + "# improved\n" for path, content in files.items()}
+
+    manifest = queue.events[-1]["files"]
+    assert manifest == [
+        {"path": "big.py", "size": 261, "chunks": 3},
+        {"path": "small.py", "size": 17, "chunks": 1},
+    ]
+
+
+def test_pdf_is_only_fetched_when_text_is_not_checkpointed():
+    files = {"main.py": "print('hi')\n"}
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        return "paper.pdf"
+
+    async def main():
+        await pipeline.generate_progress_stream(FakeGenerator(files), fetch, "hash", EventQueue())
+        await pipeline.generate_progress_stream(FakeGenerator(files), fetch, "hash", EventQueue(), use_cache=False)
+
+    asyncio.run(main())
+    assert fetches == [1]
+
+
+def test_stages_are_prompted_with_compacted_paper():
+    paper = "Widgets\nAbstract\nWe add widgets.\n1 Method\nStack them.\nReferences\n[1] Old widgets."
+    prompts = {}
+
+    class RecordingGenerator(FakeGenerator):
+        def read_paper(self, path):
+            return paper
+
+        def generate_plan(self, paper_content):
+            prompts["plan"] = paper_content
+            return "plan"
+
+        def analyze_code(self, paper_content, plan, code_blocks):
+            prompts["analyze"] = paper_content
+            return "analysis"
+
+    asyncio.run(pipeline.generate_progress_stream(RecordingGenerator({"main.py": ""}), "paper.pdf", "hash", EventQueue()))
+
+    assert prompts["plan"] == "Widgets\n\n## Abstract\nWe add widgets.\n\n## 1 Method\nStack them."
+    assert "Old widgets" not in prompts["analyze"]
+
+
+class PerFileGenerator(FakeGenerator):
+    """Implements one file at a time; later files take longer to write."""
+
+    def __init__(self, files, fail_analysis=()):
+        super().__init__(files)
+        self.fail_analysis = set(fail_analysis)
+        self.log = []
+
+    def list_files(self, plan):
+        return list(self.files)
+
+    def implement_file(self, paper_content, plan, path):
+        time.sleep(0.1 * (list(self.files).index(path) + 1))
+        with self.lock:
+            self.log.append(("implemented", path))
+        return self.files[path]
+
+    def analyze_code(self, paper_content, plan, code_blocks):
+        with self.lock:
+            self.log.append(("analyzed", *code_blocks))
+        if self.fail_analysis & set(code_blocks):
+            raise ValueError("analysis failed")
+        return "analysis"
+
+
+def test_dataflow_mode_analyzes_files_as_they_are_implemented():
+    files = {f"f{i}.py": f"x = {i}\n" for i in range(3)}
+    generator = PerFileGenerator(files, fail_analysis={"f1.py"})
+    queue = EventQueue()
+
+    asyncio.run(pipeline.generate_progress_stream(generator, "paper.pdf", "hash", queue, mode="dataflow"))
+
+    # The first file is analyzed before the last one has been implemented
+    assert generator.log.index(("analyzed", "f0.py")) < generator.log.index(("implemented", "f2.py"))
+    assert reassemble(queue.events) == {
+        "f0.py": "x = 0\n# improved\n",
+        "f1.py": "x = 1\n",
+        "f2.py": "x = 2\n# improved\n",
+    }
+    errors = [(e["stage"], e["path"]) for e in queue.events if e["status"] == "file_error"]
+    assert errors == [("analyzing_code", "f1.py")]
+    statuses = [e["status"] for e in queue.events if e["status"] not in ("file", "file_complete", "file_error")]
+    assert statuses == ["reading_paper", "generating_plan", "implementing_code", "analyzing_code", "improving_code", "writing_files", "complete"]
+    assert [entry["path"] for entry in queue.events[-1]["files"]] == list(files)
+
+
+def test_dataflow_mode_falls_back_to_sequential_stages():
+    files = {"main.py": "print('hi')\n"}
+    queue = EventQueue()
+
+    asyncio.run(pipeline.generate_progress_stream(FakeGenerator(files), "paper.pdf", "hash", queue, mode="dataflow"))
+
+    assert reassemble(queue.events) == {"main.py": "print('hi')\n# improved\n"}
+    assert queue.events[-1]["status"] == "complete"
@@ -0,0 +1,203 @@
+import asyncio
+import contextvars
+
+import pytest
+
+import llm_cache
+import pipeline
+import routing
+from benchmarks.fakes import FakeOpenAI
+from conftest import EventQueue
+from llm_cache import LLMCache
+from routing import BudgetExceededError, RunBudget, current_budget, current_stage, route
+
+pytestmark = pytest.mark.usefixtures("local_pipeline")
+
+
+def ask(client, content, model="gpt-4o", **params):
+    return client.chat.completions.create(model=model, messages=[{"role": "user", "content": content}], **params)
+
+
+def test_routes_are_picked_by_stage_and_input_size():
+    routes = {"generate_plan": [{"max_input_tokens": 100, "model": "small", "max_tokens": 10}, {"max_tokens": 50}]}
+    assert route("generate_plan", 80, routes) == {"model": "small", "max_tokens": 10}
+    assert route("generate_plan", 500, routes) == {"max_tokens": 50}
+    assert route("improve_code", 80, routes) == {}
+
+
+def in_stage(stage, budget, func):
+    # Stage and budget are set in a copied context so they do not leak into other tests
+    def run():
+        current_stage.set(stage)
+        current_budget.set(budget)
+        return func()
+    return contextvars.copy_context().run(run)
+
+
+def test_calls_are_routed_and_recorded(monkeypatch):
+    monkeypatch.setattr(routing, "MODEL_ROUTING", True)
+    client = routing.RoutedClient(FakeOpenAI())
+    budget = RunBudget(max_tokens=None, max_cost=None)
+
+    response = in_stage("analyze_code", budget, lambda: ask(client, "look at this code", temperature=0.7))
+
+    assert response.model == routing.ROUTING_SMALL_MODEL
+    assert budget.take_decisions() == [{
+        "stage": "analyze_code", "model": routing.ROUTING_SMALL_MODEL, "max_tokens": 4000,
+        "temperature": 0, "input_tokens": 1, "output_tokens": 1
+    }]
+    assert budget.usage()["tokens"] == 2
+    assert budget.usage()["cost_usd"] > 0
+
+
+def test_routes_are_opt_in_but_calls_are_still_charged(monkeypatch):
+    monkeypatch.setattr(routing, "MODEL_ROUTING", False)
+    client = routing.RoutedClient(FakeOpenAI())
+    budget = RunBudget(max_tokens=None, max_cost=None)
+
+    response = in_stage("analyze_code", budget, lambda: ask(client, "look at this code", temperature=0.7))
+
+    assert response.model == "gpt-4o"
+    assert budget.take_decisions() == [{
+        "stage": "analyze_code", "model": "gpt-4o", "max_tokens": None,
+        "temperature": 0.7, "input_tokens": 1, "output_tokens": 1
+    }]
+
+
+def test_output_is_capped_by_remaining_budget():
+    completions = []
+
+    class RecordingCompletions:
+        def create(self, **params):
+            completions.append(params)
+            return FakeOpenAI().chat.completions.create(**params)
+
+    class Client:
+        chat = type("Chat", (), {"completions": RecordingCompletions()})()
+
+    client = routing.RoutedClient(Client())
+    budget = RunBudget(max_tokens=20, max_cost=None)
+
+    in_stage("improve_code", budget, lambda: ask(client, "x" * 40))
+    assert completions[0]["max_tokens"] == 10
+
+    with pytest.raises(BudgetExceededError):
+        in_stage("improve_code", budget, lambda: ask(client, "x" * 80))
+
+
+class LLMGenerator:
+    """Generator whose stages each make one call through an OpenAI-style client."""
+
+    def __init__(self):
+        self.client = FakeOpenAI()
+
+    def read_paper(self, path):
+        return "paper"
+
+    def _call(self, prompt):
+        return ask(self.client, prompt).choices[0].message.content
+
+    def generate_plan(self, paper_content):
+        return self._call("plan " + paper_content)
+
+    def implement_code(self, paper_content, plan):
+        return {"main.py": self._call("implement") + "\n"}
+
+    def analyze_code(self, paper_content, plan, code_blocks):
+        return self._call("analyze")
+
+    def improve_code(self, code_blocks, analysis):
+        return {path: content + "# improved\n" for path, content in code_blocks.items()}
+
+
+def test_cache_hits_are_not_charged(tmp_path, monkeypatch):
+    monkeypatch.setattr(routing, "MODEL_ROUTING", True)
+    generator = routing.install(LLMGenerator())
+    llm_cache.install(generator, LLMCache(str(tmp_path / "llm.sqlite3")))
+    budget = RunBudget(max_tokens=None, max_cost=None)
+
+    first = in_stage("analyze_code", budget, lambda: generator._call("look at this code"))
+    second = in_stage("analyze_code", budget, lambda: generator._call("look at this code"))
+
+    assert first == second
+    assert [decision["model"] for decision in budget.take_decisions()] == [routing.ROUTING_SMALL_MODEL]
+    assert budget.usage()["tokens"] == 2
+
+
+def test_cache_keeps_answers_to_differently_routed_requests_apart(tmp_path, monkeypatch):
+    raw = FakeOpenAI()
+    generator = LLMGenerator()
+    generator.client = raw
+    routing.install(generator)
+    llm_cache.install(generator, LLMCache(str(tmp_path / "llm.sqlite3")))
+    unlimited = RunBudget(max_tokens=None, max_cost=None)
+
+    def analyze(budget):
+        return in_stage("analyze_code", budget, lambda: ask(generator.client, "look at this code")).model
+
+    monkeypatch.setattr(routing, "MODEL_ROUTING", True)
+    assert analyze(unlimited) == routing.ROUTING_SMALL_MODEL
+    monkeypatch.setattr(routing, "MODEL_ROUTING", False)
+    assert analyze(unlimited) == "gpt-4o"
+    assert analyze(unlimited) == "gpt-4o"
+    assert raw.chat.completions.calls == 2
+
+    # An output cap lowered by the budget is a different request as well
+    analyze(RunBudget(max_tokens=50, max_cost=None))
+    assert raw.chat.completions.calls == 3
+
+
+def test_answers_cut_off_at_the_cap_are_not_cached(tmp_path, monkeypatch):
+    raw = FakeOpenAI()
+    create = raw.chat.completions.create
+
+    def truncated(**params):
+        response = create(**params)
+        response.choices[0].finish_reason = "length"
+        return response
+
+    monkeypatch.setattr(raw.chat.completions, "create", truncated)
+    client = llm_cache.CachedClient(routing.RoutedClient(raw), LLMCache(str(tmp_path / "llm.sqlite3")))
+    budget = RunBudget(max_tokens=None, max_cost=None)
+    in_stage("improve_code", budget, lambda: ask(client, "x"))
+    in_stage("improve_code", budget, lambda: ask(client, "x"))
+    assert raw.chat.completions.calls == 2
+
+
+def test_pipeline_reports_routing_decisions_and_usage(monkeypatch):
+    monkeypatch.setattr(routing, "MODEL_ROUTING", True)
+    queue = EventQueue()
+    generator = routing.install(LLMGenerator())
+
+    asyncio.run(pipeline.generate_progress_stream(generator, "paper.pdf", "hash", queue))
+
+    routes = [(e["stage"], e["model"]) for e in queue.events if e["status"] == "model_route"]
+    assert routes == [
+        ("generate_plan", routing.ROUTING_SMALL_MODEL),
+        ("implement_code", "gpt-4o"),
+        ("analyze_code", routing.ROUTING_SMALL_MODEL),
+    ]
+    complete = queue.events[-1]
+    assert complete["status"] == "complete"
+    assert complete["usage"]["tokens"] == 6
+
+
+def test_pipeline_stops_when_budget_is_spent(monkeypatch):
+    monkeypatch.setattr(routing, "MODEL_ROUTING", True)
+    monkeypatch.setattr(pipeline, "start_run", lambda: _start_with_budget(max_tokens=3))
+    queue = EventQueue()
+    generator = routing.install(LLMGenerator())
+
+    with pytest.raises(BudgetExceededError):
+        asyncio.run(pipeline.generate_progress_stream(generator, "paper.pdf", "hash", queue))
+
+    statuses = [e["status"] for e in queue.events]
+    assert "complete" not in statuses and "analyzing_code" not in statuses
+    assert queue.events[-1]["status"] == "error"
+    assert "budget" in queue.events[-1]["message"]
+
+
+def _start_with_budget(**limits):
+    budget = RunBudget(max_cost=None, **limits)
+    current_budget.set(budget)
+    return budget
@@ -0,0 +1,95 @@
+import asyncio
+
+from scheduler import FairScheduler, set_client
+
+
+async def run_all(scheduler, requests, hold=0.01):
+    """Start one slot request per (tenant, priority, label) in order and return the labels in grant order."""
+    order = []
+
+    async def run(tenant, priority, label):
+        async with scheduler.slot(tenant, priority):
+            order.append(label)
+            await asyncio.sleep(hold)
+
+    tasks = []
+    for tenant, priority, label in requests:
+        tasks.append(asyncio.create_task(run(tenant, priority, label)))
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_tenants_take_turns():
+    requests = [("a", "interactive", f"a{i}") for i in range(4)] + [("b", "interactive", "b0"), ("c", "interactive", "c0")]
+    order = asyncio.run(run_all(FairScheduler(1), requests))
+    assert order == ["a0", "b0", "c0", "a1", "a2", "a3"]
+
+
+def test_interactive_goes_before_batch():
+    requests = [("a", "batch", f"batch{i}") for i in range(3)] + [("b", "interactive", "interactive")]
+    order = asyncio.run(run_all(FairScheduler(1), requests))
+    assert order == ["batch0", "interactive", "batch1", "batch2"]
+
+
+def test_tenant_limit_caps_concurrency():
+    scheduler = FairScheduler(4, tenant_limit=2)
+    peak = {"a": 0}
+    running = {"a": 0}
+
+    async def run():
+        async with scheduler.slot("a", "interactive"):
+            running["a"] += 1
+            peak["a"] = max(peak["a"], running["a"])
+            await asyncio.sleep(0.01)
+            running["a"] -= 1
+
+    async def main():
+        await asyncio.gather(*(run() for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak["a"] == 2
+    assert scheduler.active == 0
+
+
+def test_waiters_report_their_position():
+    scheduler = FairScheduler(1)
+    positions = []
+
+    async def report(position):
+        positions.append(position)
+
+    async def hold(tenant):
+        async with scheduler.slot(tenant, "interactive"):
+            await asyncio.sleep(0.02)
+
+    async def tracked():
+        set_client("c", "interactive", report)
+        async with scheduler.slot():
+            pass
+
+    async def main():
+        tasks = [asyncio.create_task(hold("a")), asyncio.create_task(hold("a")), asyncio.create_task(hold("b"))]
+        await asyncio.sleep(0)
+        await asyncio.create_task(tracked())
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    # Only b is ahead: a already holds the slot, so its second call goes after c
+    assert positions == [1, 0]
+
+
+def test_cancelled_waiters_give_up_their_place():
+    scheduler = FairScheduler(1)
+
+    async def main():
+        async with scheduler.slot("a", "interactive"):
+            waiter = asyncio.create_task(scheduler.slot("b", "interactive").__aenter__())
+            await asyncio.sleep(0)
+            assert scheduler.waiting() == 1
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            assert scheduler.waiting() == 0
+        assert scheduler.active == 0
+
+    asyncio.run(main())
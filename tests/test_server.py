@@ -0,0 +1,253 @@
+import hashlib
+import ipaddress
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+import db
+import pipeline
+import server
+import workspace
+from benchmarks.fakes import FakeProjectGenerator, make_pdf
+from broadcast import BroadcastHub, RunLog
+from cache import BlobCache, DiskCache, TTLCache
+from db import LocalBackend
+from jobs import JobQueue
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Everything the server writes goes under tmp_path, and runs use the fake generator
+    db.set_storage(LocalBackend(str(tmp_path / "storage")))
+    monkeypatch.setattr(FakeProjectGenerator, "stage_latency", 0)
+    monkeypatch.setattr(FakeProjectGenerator, "files", 3)
+    monkeypatch.setattr(server, "new_generator", lambda use_cache=True: FakeProjectGenerator())
+    monkeypatch.setattr(server, "archive_cache", BlobCache(str(tmp_path / "downloads"), 10 * 1024 * 1024))
+    monkeypatch.setattr(server, "pdf_cache", BlobCache(str(tmp_path / "pdfs"), 10 * 1024 * 1024))
+    monkeypatch.setattr(server, "project_urls", TTLCache(60))
+    monkeypatch.setattr(server, "job_queue", JobQueue(str(tmp_path / "jobs.sqlite3"), server.run_generation_job))
+    monkeypatch.setattr(server, "runs", BroadcastHub(log=RunLog(str(tmp_path / "runs.sqlite3"))))
+    monkeypatch.setattr(server, "EXPIRY_SWEEP_SECONDS", 0)
+    monkeypatch.setattr(pipeline, "stage_checkpoints", DiskCache(str(tmp_path / "checkpoints"), 10 * 1024 * 1024))
+    monkeypatch.setattr(pipeline, "PDF_EXTRACTOR", "generator")
+    monkeypatch.setattr(workspace, "WORKSPACE_DIR", str(tmp_path / "workspaces"))
+    with TestClient(server.app) as test_client:
+        yield test_client
+    db.set_storage(None)
+
+
+def read_events(response):
+    """(id, event) for every SSE event, with None for events sent without an id."""
+    events, event_id = [], None
+    for line in response.iter_lines():
+        if line.startswith("id: "):
+            event_id = int(line[len("id: "):])
+        elif line.startswith("data: "):
+            events.append((event_id, json.loads(line[len("data: "):])))
+            event_id = None
+    return events
+
+
+def upload(client, text="Paper"):
+    response = client.post("/upload", files={"file": ("paper.pdf", make_pdf([text]), "application/pdf")})
+    assert response.status_code == 200
+    return response.json()["file_id"]
+
+
+def generate(client, file_id, **headers):
+    with client.stream("GET", f"/generate/{file_id}", headers=headers) as response:
+        assert response.status_code == 200
+        return read_events(response)
+
+
+def test_resume_after_run_finished_continues_the_same_sequence(client):
+    file_id = upload(client)
+    events = generate(client, file_id)
+    numbered = [(event_id, event) for event_id, event in events if event_id is not None]
+    assert [event_id for event_id, _ in numbered] == list(range(1, len(numbered) + 1))
+    assert numbered[-1][1]["status"] == "complete"
+
+    # The project is stored by now, but the reconnect gets the rest of the run it was following
+    resume_from = len(numbered) - 3
+    resumed = generate(client, file_id, **{"Last-Event-ID": str(resume_from)})
+    assert resumed == numbered[resume_from:]
+
+
+def test_resume_without_a_logged_run_starts_over(client, tmp_path, monkeypatch):
+    file_id = upload(client)
+    first = generate(client, file_id)
+
+    # Another instance has no log of the run, so the cached replay is sent whole
+    monkeypatch.setattr(server, "runs", BroadcastHub(log=RunLog(str(tmp_path / "other.sqlite3"))))
+    replay = generate(client, file_id, **{"Last-Event-ID": "8"})
+    assert replay[0] == (1, {"status": "loading_cached", "message": "Loading previously generated project..."})
+    assert replay[-1][1]["status"] == "complete"
+    assert replay[-1][1]["files"] == first[-1][1]["files"]
+    assert sorted(event["path"] for _, event in replay if event["status"] == "file") == sorted(
+        entry["path"] for entry in first[-1][1]["files"]
+    )
+
+
+def generated_project(client):
+    events = generate(client, upload(client))
+    complete = events[-1][1]
+    assert complete["status"] == "complete"
+    return complete["project_id"], complete["files"]
+
+
+def test_download_streams_archive_and_keeps_a_local_copy(client):
+    project_id, files = generated_project(client)
+    assert server.archive_cache.lookup(project_id) is None
+
+    response = client.get(f"/download/{project_id}")
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{project_id}"'
+    assert sorted(server.read_zip(response.content)) == sorted(entry["path"] for entry in files)
+
+    # The whole archive went through, so it was committed to the cache
+    cached = server.archive_cache.lookup(project_id)
+    with open(cached, "rb") as f:
+        assert f.read() == response.content
+
+
+def test_download_answers_conditional_and_range_requests(client):
+    project_id, _ = generated_project(client)
+    etag = f'"{project_id}"'
+
+    response = client.get(f"/download/{project_id}", headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # A range on a cold cache fetches the archive whole first
+    response = client.get(f"/download/{project_id}", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.headers["content-range"].startswith("bytes 0-9/")
+    assert len(response.content) == 10
+    assert response.content.startswith(b"PK\x03\x04")
+
+    size = int(response.headers["content-range"].split("/")[1])
+    response = client.get(f"/download/{project_id}", headers={"Range": f"bytes={size - 4}-"})
+    assert response.status_code == 206
+    assert len(response.content) == 4
+
+    assert client.get("/download/missing").status_code == 404
+
+
+def test_interrupted_download_is_not_cached(client):
+    project_id, _ = generated_project(client)
+
+    async def read_first_chunk():
+        chunks = server.iter_project_archive(project_id)
+        stream = server.tee_archive(project_id, await anext(chunks), chunks)
+        await anext(stream)
+        await stream.aclose()
+
+    client.portal.call(read_first_chunk)
+    assert server.archive_cache.lookup(project_id) is None
+
+
+def test_batch_runs_items_and_downloads_one_archive(client):
+    first, second = upload(client, "First paper"), upload(client, "Second paper")
+    response = client.post("/batches", json={"items": [{"file_id": first}, {"file_id": second}, {"file_id": first}]})
+    assert response.status_code == 202
+    batch = response.json()
+    assert (batch["total"], batch["duplicates"]) == (2, 1)
+
+    with client.stream("GET", f"/batches/{batch['batch_id']}/events") as response:
+        events = [event for _, event in read_events(response)]
+    assert sorted(event["index"] for event in events if event["status"] == "item_complete") == [0, 1]
+    assert events[-1]["status"] == "batch_complete"
+    assert events[-1]["complete"] == 2
+
+    items = client.get(f"/batches/{batch['batch_id']}").json()["items"]
+    response = client.get(f"/batches/{batch['batch_id']}/download")
+    assert response.status_code == 200
+    paths = server.read_zip(response.content)
+    for item in items:
+        folder = f"{item['index'] + 1:03d}-{item['project_id']}/"
+        assert len([path for path in paths if path.startswith(folder)]) == FakeProjectGenerator.files
+
+
+def test_batch_requests_are_validated_and_capped(client, monkeypatch):
+    assert client.post("/batches", json={"items": []}).status_code == 400
+    assert client.post("/batches", json={"items": [{"file_id": "a", "pdf_url": "https://example.com/a.pdf"}]}).status_code == 400
+    assert client.get("/batches/missing").status_code == 404
+    assert client.get("/batches/missing/events").status_code == 404
+
+    first, second, third = (upload(client, text) for text in ("First paper", "Second paper", "Third paper"))
+    response = client.post("/batches", json={"items": [{"file_id": first}, {"file_id": "missing"}]})
+    assert response.status_code == 404
+
+    # With the workers stopped the items stay queued
+    client.portal.call(server.job_queue.stop)
+    monkeypatch.setattr(server.job_queue, "max_batch_depth", 2)
+    response = client.post("/batches", json={"items": [{"file_id": first}, {"file_id": second}]})
+    assert response.status_code == 202
+    assert client.get(f"/batches/{response.json()['batch_id']}/download").status_code == 409
+
+    response = client.post("/batches", json={"items": [{"file_id": third}]})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "30"
+
+
+def test_jobs_need_an_uploaded_pdf(client):
+    assert client.post("/jobs", json={"file_id": "missing"}).status_code == 404
+
+    file_id = upload(client)
+    response = client.post("/jobs", json={"file_id": file_id})
+    assert response.status_code == 202
+    assert client.get(f"/jobs/{response.json()['job_id']}").json()["file_id"] == file_id
+
+
+def test_tenant_header_is_only_trusted_from_a_proxy(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+
+    def tenant(host, header):
+        return server.client_tenant(Request({"type": "http", "client": (host, 4000), "headers": []}), header)
+
+    assert tenant("10.1.2.3", "acme") == "acme"
+    assert tenant("10.1.2.3", None) == "10.1.2.3"
+    assert tenant("203.0.113.7", "acme") == "203.0.113.7"
+    assert tenant("testclient", "acme") == "testclient"
+
+
+def test_duplicate_uploads_keep_the_pdf(client):
+    storage = db.get_storage()
+    file_id = upload(client)
+    far_future = (datetime.now(timezone.utc) + timedelta(days=365)).isoformat()
+    assert file_id in client.portal.call(storage.find_expired_pdfs, far_future, 10)
+
+    # Uploading the same PDF again pushes its expiry out
+    client.portal.call(storage.touch_pdf, file_id, datetime.now(timezone.utc).isoformat())
+    assert upload(client) == file_id
+    assert file_id not in client.portal.call(storage.find_expired_pdfs, datetime.now(timezone.utc).isoformat(), 10)
+
+
+def test_duplicate_uploads_are_not_sent_to_storage(client, monkeypatch):
+    storage = db.get_storage()
+    puts = []
+    put_object = storage.put_object
+
+    async def counting_put(bucket, path, data, content_type):
+        puts.append(path)
+        await put_object(bucket, path, data, content_type)
+
+    monkeypatch.setattr(storage, "put_object", counting_put)
+    file_id = upload(client)
+    response = client.post("/upload", files={"file": ("paper.pdf", make_pdf(["Paper"]), "application/pdf")})
+    assert response.json() == {"file_id": file_id, "message": "PDF already uploaded", "duplicate": True}
+    assert puts == [f"{file_id}.pdf"]
+
+
+def test_upload_checks_the_given_sha256(client):
+    pdf = make_pdf(["Paper"])
+    other = upload(client, "Other paper")
+    response = client.post("/upload", data={"sha256": other}, files={"file": ("paper.pdf", pdf, "application/pdf")})
+    assert response.status_code == 400
+
+    file_id = hashlib.sha256(pdf).hexdigest()
+    response = client.post("/upload", data={"sha256": file_id.upper()}, files={"file": ("paper.pdf", pdf, "application/pdf")})
+    assert response.json()["file_id"] == file_id
@@ -12,16 +12,17 @@ def test_generate(file_id: str):
     
     # Process the SSE stream
     for line in response.iter_lines():
-        if line:
+        # Skip blank separators and the "id: " line that precedes each event
+        if line and line.startswith(b'data: '):
             # Remove the "data: " prefix and parse JSON
             data = json.loads(line.decode('utf-8').replace('data: ', ''))
             print(data)
             
-            # If we have files in the response, print them
+            # The final manifest lists every generated file
             if 'files' in data:
                 print("\nGenerated files:")
                 for file in data['files']:
-                    print(f"- {file}")
+                    print(f"- {file['path']}")
             
             # If we get an error or completion, break
             if data['status'] in ['error', 'complete']:
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from workspace import DiskBudget, DiskQuotaError, JobWorkspace, sweep_workspaces
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_workspace_is_created_on_first_write_and_removed_on_close(tmp_path):
+    budget = DiskBudget(1024)
+
+    async def main():
+        async with JobWorkspace(quota=1024, budget=budget, root=str(tmp_path)) as workspace:
+            assert workspace.path is None
+            path = await workspace.write_stream("paper.pdf", chunks(b"abc", b"def"))
+            with open(path, 'rb') as f:
+                assert f.read() == b"abcdef"
+            assert budget.used == 6
+        return workspace.path
+
+    path = asyncio.run(main())
+    assert not os.path.exists(path)
+    assert budget.used == 0
+
+
+def test_job_quota_and_shared_budget_are_enforced(tmp_path):
+    budget = DiskBudget(10)
+
+    async def main():
+        first = JobWorkspace(quota=4, budget=budget, root=str(tmp_path))
+        with pytest.raises(DiskQuotaError):
+            await first.write_stream("a", chunks(b"123", b"456"))
+
+        second = JobWorkspace(quota=100, budget=budget, root=str(tmp_path))
+        await second.write_stream("b", chunks(b"123456"))
+        # The shared budget is full until the first job lets go of its bytes
+        with pytest.raises(DiskQuotaError):
+            await second.write_stream("c", chunks(b"1234"))
+        await first.close()
+        await second.write_stream("c", chunks(b"1234"))
+        await second.close()
+
+    asyncio.run(main())
+    assert budget.used == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_sweep_only_removes_workspaces_of_dead_processes(tmp_path):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    os.makedirs(tmp_path / f"{dead.pid}-stale")
+    os.makedirs(tmp_path / f"{os.getpid()}-live")
+
+    assert sweep_workspaces(str(tmp_path)) == 1
+    assert os.listdir(tmp_path) == [f"{os.getpid()}-live"]
+
+
+def test_linked_files_survive_removal_from_the_cache(tmp_path):
+    source = tmp_path / "cached.pdf"
+    source.write_bytes(b"%PDF-1.4")
+
+    async def main():
+        async with JobWorkspace(quota=1024, budget=DiskBudget(1024), root=str(tmp_path / "jobs")) as workspace:
+            path = await workspace.link_file("paper.pdf", str(source))
+            os.remove(source)
+            with open(path, 'rb') as f:
+                assert f.read() == b"%PDF-1.4"
+            with pytest.raises(FileNotFoundError):
+                await workspace.link_file("other.pdf", str(source))
+
+    asyncio.run(main())
+
+
+def test_shared_workspace_is_removed_by_the_last_holder(tmp_path):
+    budget = DiskBudget(1024)
+
+    async def main():
+        workspace = JobWorkspace(quota=1024, budget=budget, root=str(tmp_path))
+        path = await workspace.write_stream("paper.pdf", chunks(b"%PDF"))
+        background = workspace.share()
+
+        await workspace.close()
+        assert os.path.exists(path)
+        await background.close()
+        assert not os.path.exists(path)
+
+    asyncio.run(main())
+    assert budget.used == 0
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+from typing import AsyncIterator, Optional
+
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", os.path.join(tempfile.gettempdir(), "brss_jobs"))
+JOB_DISK_QUOTA_BYTES = int(os.getenv("JOB_DISK_QUOTA_BYTES", str(256 * 1024 * 1024)))
+WORKSPACE_MAX_BYTES = int(os.getenv("WORKSPACE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+
+class DiskQuotaError(OSError):
+    pass
+
+
+class DiskBudget:
+    """Bytes reserved by all live workspaces of this process, capped at `max_bytes`."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, size: int):
+        with self._lock:
+            if self.used + size > self.max_bytes:
+                raise DiskQuotaError(f"Scratch space is full ({self.max_bytes} bytes in use by running jobs)")
+            self.used += size
+
+    def release(self, size: int):
+        with self._lock:
+            self.used = max(0, self.used - size)
+
+
+workspace_budget = DiskBudget(WORKSPACE_MAX_BYTES)
+
+
+class JobWorkspace:
+    """Scratch directory owned by one job.
+
+    The directory is only created on the first write. Everything written
+    through it counts against the job's `quota` and the shared `budget`, and
+    the directory is removed once every holder has closed it.
+    """
+
+    def __init__(self, quota: Optional[int] = None, budget: Optional[DiskBudget] = None, root: Optional[str] = None):
+        self.quota = quota or JOB_DISK_QUOTA_BYTES
+        self.budget = budget or workspace_budget
+        self.root = root or WORKSPACE_DIR
+        self.path: Optional[str] = None
+        self.used = 0
+        self._holders = 1
+        self._closed = False
+
+    async def open(self) -> "JobWorkspace":
+        await asyncio.to_thread(os.makedirs, self.root, exist_ok=True)
+        # The pid prefix lets a restarted server tell its own leftovers from a live sibling's
+        self.path = await asyncio.to_thread(tempfile.mkdtemp, prefix=f"{os.getpid()}-", dir=self.root)
+        return self
+
+    async def _directory(self) -> str:
+        if self._closed:
+            raise RuntimeError("Workspace is closed")
+        if self.path is None:
+            await self.open()
+        return self.path
+
+    def _charge(self, size: int):
+        if self.used + size > self.quota:
+            raise DiskQuotaError(f"Job exceeds its {self.quota} byte disk quota")
+        self.budget.reserve(size)
+        self.used += size
+
+    async def write_stream(self, name: str, chunks: AsyncIterator[bytes]) -> str:
+        """Write `chunks` to `name` inside the workspace without blocking the event loop."""
+        path = os.path.join(await self._directory(), name)
+        f = await asyncio.to_thread(open, path, 'wb')
+        try:
+            async for chunk in chunks:
+                self._charge(len(chunk))
+                await asyncio.to_thread(f.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+        return path
+
+    async def link_file(self, name: str, source: str) -> str:
+        """Give the job its own name for `source`, so the file outlives eviction from a shared cache.
+
+        A hard link takes no new space; the copy made across filesystems is
+        charged to the quota like any other write.
+        """
+        path = os.path.join(await self._directory(), name)
+        try:
+            await asyncio.to_thread(os.link, source, path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            self._charge(await asyncio.to_thread(os.path.getsize, source))
+            await asyncio.to_thread(shutil.copyfile, source, path)
+        return path
+
+    def share(self) -> "JobWorkspace":
+        """Register another holder, for a task that must keep reading the workspace after the job is done with it."""
+        if self._closed:
+            raise RuntimeError("Workspace is closed")
+        self._holders += 1
+        return self
+
+    async def close(self):
+        if self._closed:
+            return
+        self._holders -= 1
+        if self._holders > 0:
+            return
+        self._closed = True
+        if self.path:
+            await asyncio.to_thread(shutil.rmtree, self.path, True)
+        self.budget.release(self.used)
+        self.used = 0
+
+    async def __aenter__(self) -> "JobWorkspace":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def sweep_workspaces(root: Optional[str] = None) -> int:
+    """Remove workspaces left behind by processes that are no longer running."""
+    root = root or WORKSPACE_DIR
+    removed = 0
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        pid, _, _ = name.partition("-")
+        if pid.isdigit() and (int(pid) == os.getpid() or _pid_alive(int(pid))):
+            continue
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        removed += 1
+    return removed